@@ -1,3 +1,6 @@
 # Módulo común para compartir entre APIs (Skualo, Odoo, etc.)
-# Por ahora vacío - se agregará código compartido según sea necesario
-
+# excel.py: escritura de Excel en modo streaming
+# clasificacion.py: clasificación de cuentas por reglas de prefijo
+# salida_json.py: escritura en streaming de reportes JSON/NDJSON
+# entorno.py: lectura de variables de entorno numéricas y booleanas
+# concurrencia.py: mapeo concurrente con pool acotado de hilos
@@ -0,0 +1,85 @@
+"""
+Clasificación de cuentas contables por reglas de código.
+
+Las reglas son las del balance clasificado (config Excel de Skualo) o
+CLASIFICACION_CUENTAS de Odoo:
+
+    {
+        "activo_corriente": {"nombre": "...", "prefijos": ["11"], "excluir_cuentas": ["1101002"]},
+        "patrimonio": {"nombre": "...", "cuentas_especificas": ["3101001"]},
+    }
+
+Precedencia (igual que el recorrido lineal original):
+    1. cuentas_especificas: la primera categoría que lista el código.
+    2. prefijos: la primera categoría (en el orden de las reglas) con un
+       prefijo que calza y que no excluye el código en excluir_cuentas.
+       Las categorías con cuentas_especificas no usan prefijos.
+
+Las reglas se compilan una vez en un índice prefijo -> categorías. Para
+clasificar un código solo se miran sus prefijos de los largos existentes
+(en vez de recorrer todas las categorías y todos los prefijos). El
+resultado se memoiza por código, así las cuentas que se repiten entre
+períodos se clasifican una sola vez.
+
+Uso:
+    clasificador = ClasificadorCuentas(config["balance_clasificado"])
+    categoria = clasificador.clasificar('1101001')
+    por_categoria = clasificador.agrupar(codigos)
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+
+class ClasificadorCuentas:
+    """Reglas de clasificación compiladas, con memoización por código."""
+
+    def __init__(self, reglas: Dict[str, dict]):
+        self.reglas = reglas
+        self._especificas: Dict[str, str] = {}
+        self._excluidas: Dict[str, set] = {}
+        self._por_prefijo: Dict[str, List[tuple]] = {}  # prefijo -> [(orden, categoria)]
+        self._memo: Dict[str, Optional[str]] = {}
+
+        for orden, (categoria, regla) in enumerate(reglas.items()):
+            if 'cuentas_especificas' in regla:
+                for codigo in regla['cuentas_especificas']:
+                    self._especificas.setdefault(codigo, categoria)
+                continue
+            self._excluidas[categoria] = set(regla.get('excluir_cuentas', []))
+            for prefijo in regla.get('prefijos', []):
+                self._por_prefijo.setdefault(prefijo, []).append((orden, categoria))
+
+        self._largos = sorted({len(p) for p in self._por_prefijo})
+
+    def clasificar(self, codigo: str) -> Optional[str]:
+        """Categoría de la cuenta, o None si ninguna regla aplica."""
+        try:
+            return self._memo[codigo]
+        except KeyError:
+            pass
+
+        categoria = self._especificas.get(codigo)
+        if categoria is None:
+            candidatos = []
+            for largo in self._largos:
+                if largo > len(codigo):
+                    break
+                candidatos.extend(self._por_prefijo.get(codigo[:largo], ()))
+            for _, cat in sorted(candidatos):
+                if codigo not in self._excluidas[cat]:
+                    categoria = cat
+                    break
+
+        self._memo[codigo] = categoria
+        return categoria
+
+    def clasificar_lote(self, codigos: Iterable[str]) -> List[Optional[str]]:
+        """Categorías de varias cuentas, en el orden de `codigos`."""
+        return [self.clasificar(codigo) for codigo in codigos]
+
+    def agrupar(self, codigos: Iterable[str]) -> Dict[Optional[str], List[str]]:
+        """Códigos agrupados por categoría (None = sin clasificar), conservando el orden."""
+        grupos: Dict[Optional[str], List[str]] = {}
+        for codigo in codigos:
+            grupos.setdefault(self.clasificar(codigo), []).append(codigo)
+        return grupos
@@ -0,0 +1,39 @@
+"""
+Ejecución concurrente acotada con hilos (consultas por empresa, cuenta o página).
+
+Uso:
+    from common.concurrencia import mapear_concurrente
+    resultados = mapear_concurrente(consultar, empresas, workers=4)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List
+
+
+def mapear_concurrente(fn: Callable, items: Iterable, workers: int) -> List:
+    """
+    Aplica fn a cada item usando un pool acotado de hilos.
+
+    Los resultados se retornan en el mismo orden que los items.
+    Con workers <= 1 se ejecuta secuencialmente, sin crear hilos.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+def iterar_concurrente(fn: Callable, items: Iterable, workers: int) -> Iterator:
+    """
+    Como mapear_concurrente, pero entrega cada resultado apenas está listo
+    y los anteriores ya se entregaron: respeta el orden de `items` (la
+    salida es reproducible) y solo retiene los que terminan adelantados.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        yield from executor.map(fn, items)
@@ -0,0 +1,35 @@
+"""
+Lectura de variables de entorno (.env) con valor por defecto.
+
+Los valores vacíos o mal escritos toman el default en vez de fallar al
+importar el módulo que los usa.
+
+Uso:
+    from common.entorno import env_bool, env_int
+    WORKERS = env_int('SKUALO_PAGE_WORKERS', 4)
+"""
+
+import os
+
+
+def env_int(key: str, default: int) -> int:
+    val = os.getenv(key)
+    try:
+        return int(val.strip()) if val else default
+    except ValueError:
+        return default
+
+
+def env_float(key: str, default: float) -> float:
+    val = os.getenv(key)
+    try:
+        return float(val.strip()) if val else default
+    except ValueError:
+        return default
+
+
+def env_bool(key: str, default: bool) -> bool:
+    val = os.getenv(key)
+    if not val:
+        return default
+    return val.strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
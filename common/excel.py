@@ -0,0 +1,212 @@
+"""
+Escritura de Excel compartida por los generadores de Skualo y Odoo.
+
+LibroStreaming usa el modo write-only de openpyxl: cada fila se escribe
+una sola vez, ya con su estilo, y no queda en memoria. Así se evita el
+patrón "DataFrame.to_excel + recorrer todas las celdas para darles
+formato", que en libros con 100+ hojas y decenas de miles de filas toma
+más tiempo que la descarga de datos.
+
+RegistroEstilos registra los estilos de cada tipo de fila (header,
+subtotal, total_final...) como NamedStyle, una sola vez por libro. Las
+celdas solo guardan el nombre del estilo: no se crean objetos Font/Fill
+por celda ni hay que deduplicarlos al guardar.
+
+Restricciones del modo write-only:
+    - Las filas se agregan en orden; no se puede volver a una celda.
+    - Anchos de columna se fijan al crear la hoja (antes de la primera fila).
+    - Los hipervínculos entre hojas deben conocerse al escribir la fila.
+
+Uso:
+    libro = LibroStreaming()
+    hoja = libro.crear_hoja('Balance', anchos={'A': 12, 'B': 40})
+    hoja.fila(['Código', 'Cuenta'], estilo={'font': Font(bold=True)})
+    hoja.fila(['1101001', 'Caja'], columnas={2: {'number_format': '#,##0'}})
+    libro.guardar('balance.xlsx')
+
+    estilos = libro.estilos({'total': {'font': Font(bold=True)}})
+    hoja.fila(['TOTAL', 1500], estilo=estilos('total'), columnas={2: estilos('total', '#,##0')})
+"""
+
+import math
+import numbers
+from copy import copy
+from typing import Dict, Iterable, List, Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.styles.fonts import DEFAULT_FONT
+
+# Atributos de estilo que se pueden asignar a una celda. 'style' (estilo con
+# nombre, ej. 'Hyperlink') va primero: los atributos sueltos se aplican encima.
+ATRIBUTOS_ESTILO = ('style', 'font', 'fill', 'border', 'alignment', 'number_format', 'hyperlink')
+
+
+def valor_excel(valor):
+    """Normaliza un valor para Excel (NaN/NaT -> vacío, tipos NumPy -> Python)."""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if hasattr(valor, 'item') and not isinstance(valor, (str, bytes)):
+        try:
+            valor = valor.item()
+        except (ValueError, AttributeError):
+            pass
+        if isinstance(valor, float) and math.isnan(valor):
+            return None
+    return valor
+
+
+class RegistroEstilos:
+    """
+    NamedStyles de un libro, creados la primera vez que se usan.
+
+    Args:
+        wb: Workbook de openpyxl (normal o write-only)
+        definiciones: tipo de fila -> atributos (font, fill, border,
+                      alignment, number_format)
+    """
+
+    def __init__(self, wb, definiciones: Dict[str, dict]):
+        self.wb = wb
+        self.definiciones = definiciones
+        self._estilos: Dict[tuple, dict] = {}
+
+    def __contains__(self, tipo: str) -> bool:
+        return tipo in self.definiciones
+
+    def __call__(self, tipo: Optional[str], number_format: str = None) -> dict:
+        """
+        Estilo del tipo de fila, para HojaStreaming.fila (ej: {'style': 'total'}).
+
+        Con `number_format` se registra una variante del estilo con ese
+        formato (ej: 'total #,##0'). Un tipo sin definición usa el estilo base.
+        """
+        clave = (tipo, number_format)
+        estilo = self._estilos.get(clave)
+        if estilo is None:
+            # Font/Border no indicados quedan como en el estilo Normal
+            atributos = {'font': DEFAULT_FONT, 'border': DEFAULT_BORDER, **self.definiciones.get(tipo, {})}
+            atributos = {k: copy(v) for k, v in atributos.items()}
+            nombre = tipo or 'base'
+            if number_format:
+                atributos['number_format'] = number_format
+                nombre = f'{nombre} {number_format}'
+            if nombre not in self.wb.named_styles:
+                self.wb.add_named_style(NamedStyle(name=nombre, **atributos))
+            estilo = self._estilos[clave] = {'style': nombre}
+        return estilo
+
+    def columnas(self, valores: list, formato: Dict[int, str],
+                 numericas: Iterable[int] = (), number_format: str = None) -> Dict[int, dict]:
+        """
+        Estilos por columna de una fila, para HojaStreaming.fila(columnas=...).
+
+        Args:
+            valores: Valores de la fila
+            formato: columna (1-based) -> tipo de estilo
+            numericas: Columnas que llevan `number_format` si el valor es numérico
+            number_format: Formato numérico (ej: '#,##0')
+        """
+        numericas = set(numericas) if number_format else ()
+        columnas = {}
+        for col, valor in enumerate(valores, start=1):
+            tipo = formato.get(col)
+            if col in numericas and isinstance(valor, numbers.Number) and not isinstance(valor, bool):
+                columnas[col] = self(tipo, number_format)
+            elif tipo:
+                columnas[col] = self(tipo)
+        return columnas
+
+
+class HojaStreaming:
+    """Hoja write-only: las filas se escriben en orden, con estilo al emitirlas."""
+
+    def __init__(self, libro: 'LibroStreaming', ws, anchos: Dict[str, float] = None):
+        self.libro = libro
+        self.ws = ws
+        self.titulo = ws.title
+        self.filas = 0
+        for columna, ancho in (anchos or {}).items():
+            ws.column_dimensions[columna].width = ancho
+
+    def _celda(self, valor, estilo: Optional[dict]):
+        valor = valor_excel(valor)
+        if not estilo:
+            return valor
+        celda = WriteOnlyCell(self.ws, value=valor)
+        for atributo in ATRIBUTOS_ESTILO:
+            if atributo in estilo:
+                setattr(celda, atributo, estilo[atributo])
+        return celda
+
+    def fila(self, valores: Iterable, estilo: dict = None,
+             columnas: Dict[int, dict] = None):
+        """
+        Agrega una fila.
+
+        Args:
+            valores: Valores de la fila
+            estilo: Estilo para todas las celdas (font, fill, border,
+                    alignment, number_format, hyperlink, style)
+            columnas: Estilo adicional por columna (1-based), se combina con `estilo`
+        """
+        celdas = []
+        for col, valor in enumerate(valores, start=1):
+            estilo_celda = estilo
+            if columnas and col in columnas:
+                estilo_celda = {**(estilo or {}), **columnas[col]}
+            celdas.append(self._celda(valor, estilo_celda))
+        self.ws.append(celdas)
+        self.filas += 1
+
+    def filas_vacias(self, cantidad: int = 1):
+        for _ in range(cantidad):
+            self.ws.append([])
+            self.filas += 1
+
+
+class LibroStreaming:
+    """Libro Excel en modo write-only (openpyxl)."""
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        self.hojas: Dict[str, HojaStreaming] = {}
+        self._registros: Dict[int, RegistroEstilos] = {}
+
+    def crear_hoja(self, nombre: str, anchos: Dict[str, float] = None) -> HojaStreaming:
+        hoja = HojaStreaming(self, self.wb.create_sheet(title=nombre), anchos)
+        self.hojas[nombre] = hoja
+        return hoja
+
+    def estilos(self, definiciones: Dict[str, dict]) -> RegistroEstilos:
+        """Registro de estilos del libro para `definiciones` (uno por diccionario)."""
+        registro = self._registros.get(id(definiciones))
+        if registro is None:
+            registro = self._registros[id(definiciones)] = RegistroEstilos(self.wb, definiciones)
+        return registro
+
+    def guardar(self, filename) -> str:
+        self.wb.save(str(filename))
+        return str(filename)
+
+
+def filas_dataframe(df) -> List[list]:
+    """Filas de un DataFrame como listas (sin índice)."""
+    return df.values.tolist()
+
+
+def nombre_hoja_unico(nombre: str, usados: set, largo: int = 31) -> str:
+    """Nombre de hoja válido y no repetido (agrega _1, _2... si ya existe)."""
+    for char in ['\\', '/', '*', '?', '[', ']', ':']:
+        nombre = nombre.replace(char, '')
+    nombre = nombre[:largo]
+    original, sufijo = nombre, 1
+    while nombre in usados:
+        nombre = f'{original[:largo - 3]}_{sufijo}'
+        sufijo += 1
+    usados.add(nombre)
+    return nombre
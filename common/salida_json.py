@@ -0,0 +1,158 @@
+"""
+Escritura en streaming de reportes JSON multi-empresa (pendientes Skualo/Odoo).
+
+Los reportes tienen la forma:
+
+    {"generado": ..., "version": ..., "empresas": [{...}, ...], "resumen": {...}}
+
+SalidaReporte escribe cada empresa apenas termina su consulta, en vez de
+armar el reporte completo en memoria y volcarlo al final: la memoria queda
+acotada a una empresa y el archivo crece a medida que avanza el proceso.
+
+Mientras se escribe, el reporte vive en `<archivo>.tmp`; al salir del
+`with` sin error se renombra al nombre final (os.replace, atómico). Si el
+proceso falla a mitad, se borra el temporal: nunca queda un JSON truncado
+con el nombre del reporte (ni se pisa uno anterior válido).
+
+Formatos:
+    json      Documento único indentado (mismo texto que json.dump(..., indent=2))
+    compacto  Documento único sin espacios, serializado con el encoder C de
+              json (json.dump con indent usa el encoder Python, más lento)
+    ndjson    Una línea JSON por registro: cabecera del reporte, cada empresa
+              (sin sus listas de detalle), cada documento/movimiento y el
+              resumen. Cada línea lleva "registro" para distinguirlas.
+
+Uso:
+    detalle = {'pendientes_sii': 'documentos', 'pendientes_conciliar': 'movimientos'}
+    with SalidaReporte('pendientes.ndjson', 'ndjson', cabecera, detalle) as salida:
+        for empresa in iterar_pendientes():
+            salida.empresa(empresa)
+        salida.resumen(resumen)
+"""
+
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Optional
+
+FORMATOS = ('json', 'compacto', 'ndjson')
+
+# Campos que identifican a la empresa en cada línea de detalle NDJSON
+CAMPOS_EMPRESA = ('empresa', 'rut', 'database')
+
+
+def valor_json(obj):
+    """Conversión de tipos no nativos de JSON (fechas, Decimal)."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+_INDENTADO = json.JSONEncoder(ensure_ascii=False, indent=2, default=valor_json)
+_COMPACTO = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=valor_json)
+
+
+def _indentado(obj, nivel: int) -> str:
+    """JSON indentado, desplazado `nivel` niveles (para anidarlo en el documento)."""
+    return _INDENTADO.encode(obj).replace('\n', '\n' + '  ' * nivel)
+
+
+class SalidaReporte:
+    """
+    Archivo de reporte que se escribe empresa por empresa.
+
+    Args:
+        archivo: Ruta del archivo de salida
+        formato: 'json', 'compacto' o 'ndjson'
+        cabecera: Campos iniciales del reporte (generado, version, sistema...)
+        detalle: sección -> lista de detalle que en NDJSON va una por línea
+                 (ej: {'pendientes_sii': 'documentos'})
+    """
+
+    def __init__(self, archivo, formato: str = 'json', cabecera: Dict = None,
+                 detalle: Optional[Dict[str, str]] = None):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconocido: {formato} (usar {', '.join(FORMATOS)})")
+        self.archivo = archivo
+        self.formato = formato
+        self.detalle = detalle or {}
+        self.empresas = 0
+        self._temporal = f'{os.fspath(archivo)}.tmp'
+        self._f = open(self._temporal, 'w', encoding='utf-8')
+        try:
+            self._abrir(cabecera or {})
+        except BaseException:
+            self._descartar()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        if tipo is not None:
+            self._descartar()
+            return
+        self._f.close()
+        os.replace(self._temporal, self.archivo)
+
+    def _descartar(self):
+        """Cierra y borra el temporal (el reporte quedó incompleto)."""
+        self._f.close()
+        try:
+            os.remove(self._temporal)
+        except FileNotFoundError:
+            pass
+
+    def _abrir(self, cabecera: Dict):
+        if self.formato == 'ndjson':
+            self._linea({'registro': 'reporte', **cabecera})
+        elif self.formato == 'compacto':
+            self._f.write(_COMPACTO.encode(cabecera)[:-1])
+            self._f.write(',"empresas":[' if cabecera else '"empresas":[')
+        else:
+            self._f.write('{')
+            for clave, valor in cabecera.items():
+                self._f.write(f'\n  {json.dumps(clave, ensure_ascii=False)}: {_indentado(valor, 1)},')
+            self._f.write('\n  "empresas": [')
+
+    def _linea(self, registro: Dict):
+        self._f.write(_COMPACTO.encode(registro))
+        self._f.write('\n')
+
+    def empresa(self, empresa: Dict):
+        """Escribe la sección de una empresa (y, en NDJSON, su detalle)."""
+        if self.formato == 'ndjson':
+            self._empresa_ndjson(empresa)
+        elif self.formato == 'compacto':
+            self._f.write((',' if self.empresas else '') + _COMPACTO.encode(empresa))
+        else:
+            self._f.write((',' if self.empresas else '') + '\n    ' + _indentado(empresa, 2))
+        self._f.flush()
+        self.empresas += 1
+
+    def _empresa_ndjson(self, empresa: Dict):
+        identidad = {campo: empresa[campo] for campo in CAMPOS_EMPRESA if campo in empresa}
+        resumen = dict(empresa)
+        listas = []
+        for seccion, lista in self.detalle.items():
+            datos = empresa.get(seccion)
+            if isinstance(datos, dict) and lista in datos:
+                resumen[seccion] = {k: v for k, v in datos.items() if k != lista}
+                listas.append((seccion, datos[lista]))
+        self._linea({'registro': 'empresa', **resumen})
+        for seccion, items in listas:
+            for item in items:
+                self._linea({'registro': seccion, **identidad, **item})
+
+    def resumen(self, resumen: Dict):
+        """Escribe el resumen y cierra el documento."""
+        if self.formato == 'ndjson':
+            self._linea({'registro': 'resumen', **resumen})
+        elif self.formato == 'compacto':
+            self._f.write('],"resumen":' + _COMPACTO.encode(resumen) + '}')
+        else:
+            self._f.write('\n  ]' if self.empresas else ']')
+            self._f.write(f',\n  "resumen": {_indentado(resumen, 1)}\n}}')
@@ -7,6 +7,7 @@ Genera un Excel con:
 - Resumen: Balance Clasificado + Estado de Resultados + KPIs
 - Balance: Todas las cuentas con saldos
 - Hojas por cuenta: Detalle de movimientos con hipervínculos
+  (una sola consulta con cursor de servidor, escrita hoja por hoja)
 
 IMPORTANTE:
 - Incluye Resultado del Período en Patrimonio
@@ -20,25 +21,16 @@ Uso:
 import os
 import sys
 from datetime import datetime
-from dotenv import load_dotenv
-import psycopg2
+from itertools import groupby
+from operator import itemgetter
 import pandas as pd
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
-load_dotenv()
+from common.clasificacion import ClasificadorCuentas
+from common.excel import LibroStreaming, filas_dataframe, nombre_hoja_unico
 
-
-def get_env_clean(key, default=None):
-    val = os.getenv(key)
-    return val.strip() if val else default
-
-
-DB_CONFIG = {
-    'host': get_env_clean('SERVER'),
-    'port': get_env_clean('PORT', '5432'),
-    'user': get_env_clean('DB_USER'),
-    'password': get_env_clean('PASSWORD'),
-}
+from .conexion import conexion, iterar_filas
+from .snapshots import obtener_saldos
 
 DATABASES = {
     'FactorIT': 'FactorIT SpA',
@@ -67,6 +59,35 @@ ESTILOS = {
     "formato_miles": '#,##0'
 }
 
+# Estilos con nombre por tipo de fila (NamedStyle, se registran una vez por libro)
+ESTILOS_FILA = {
+    "header": {"font": ESTILOS["font_header"], "fill": ESTILOS["fill_header"]},
+    "titulo": {"font": ESTILOS["font_titulo"]},
+    "section": {"font": ESTILOS["font_section"], "fill": ESTILOS["fill_section"]},
+    "category": {"font": ESTILOS["font_category"]},
+    "subcategory": {"font": Font(bold=True, italic=True)},
+    "subtotal": {"font": ESTILOS["font_subtotal"], "fill": ESTILOS["fill_subtotal"]},
+    "total": {"font": ESTILOS["font_total"]},
+    "total_final": {"font": ESTILOS["font_total_final"], "fill": ESTILOS["fill_total_final"]},
+    "verification_ok": {"font": Font(bold=True, color="006400")},
+    "verification_error": {"font": Font(bold=True, color="FF0000")},
+    "kpi": {"font": Font(bold=True, color="1F4E79")},
+}
+
+# Hoja Resumen: tipo de fila -> {columna: estilo}
+FORMATO_RESUMEN = {
+    "titulo": {1: "titulo"},
+    "section": {1: "section"},
+    "category": {1: "category"},
+    "subcategory": {1: "subcategory"},
+    "subtotal": {1: "subtotal", 2: "subtotal"},
+    "total": {1: "total", 2: "total"},
+    "total_final": {1: "total_final", 2: "total_final"},
+    "verification_ok": {1: "verification_ok"},
+    "verification_error": {1: "verification_error"},
+    "kpi": {2: "kpi"},
+}
+
 # Clasificación de cuentas por prefijo de código
 CLASIFICACION_CUENTAS = {
     "activo_corriente": {"nombre": "Activo Corriente", "prefijos": ["11"]},
@@ -83,28 +104,20 @@ CLASIFICACION_CUENTAS = {
 }
 
 
-def clasificar_cuenta(codigo):
-    """Clasifica una cuenta según su código."""
-    for categoria, config in CLASIFICACION_CUENTAS.items():
-        for prefijo in config["prefijos"]:
-            if codigo.startswith(prefijo):
-                return categoria
-    return None
+CLASIFICADOR = ClasificadorCuentas(CLASIFICACION_CUENTAS)
 
 
-def sanitize_sheet_name(codigo, nombre):
-    """Limpia nombre para hoja Excel (max 31 chars)."""
-    name = f"{codigo} {nombre}"
-    for char in ['\\', '/', '*', '?', '[', ']', ':']:
-        name = name.replace(char, '')
-    return name[:31]
+def clasificar_cuenta(codigo):
+    """Clasifica una cuenta según su código."""
+    return CLASIFICADOR.clasificar(codigo)
 
 
-def obtener_balance(cursor, fecha_hasta=None):
-    """Obtiene el balance de saldos por cuenta."""
+def _consultar_balance(conn, fecha_hasta):
+    """
+    Saldos por cuenta agregando todo account_move_line hasta la fecha.
     
-    if fecha_hasta is None:
-        fecha_hasta = datetime.now().strftime('%Y-%m-%d')
+    Las filas llegan por bloques (cursor de servidor), con los montos ya en float.
+    """
     
     query = """
     SELECT 
@@ -124,18 +137,33 @@ def obtener_balance(cursor, fecha_hasta=None):
     ORDER BY aa.code
     """
     
-    cursor.execute(query, (fecha_hasta,))
+    return iterar_filas(conn, query, (fecha_hasta,))
+
+
+def obtener_balance(cursor, fecha_hasta=None, db_name=None):
+    """
+    Obtiene el balance de saldos por cuenta.
+    
+    Con `db_name` los saldos salen de los snapshots mensuales locales más
+    las líneas posteriores (odoo.snapshots); sin él, o con ODOO_SNAPSHOTS=false,
+    se agrega toda la historia de account_move_line.
+    """
+    
+    if fecha_hasta is None:
+        fecha_hasta = datetime.now().strftime('%Y-%m-%d')
+    
+    filas = obtener_saldos(cursor, db_name, fecha_hasta) if db_name else None
+    if filas is None:
+        filas = _consultar_balance(cursor.connection, fecha_hasta)
     
     cuentas = []
-    for row in cursor.fetchall():
-        codigo, nombre, tipo, debe, haber, saldo = row
+    for codigo, nombre, tipo, debe, haber, saldo in filas:
+        clasificacion = CLASIFICADOR.clasificar(codigo)
+        # Los snapshots entregan Decimal exacto; la consulta completa, float
         debe = float(debe or 0)
         haber = float(haber or 0)
         saldo = float(saldo or 0)
         
-        # Determinar clasificación
-        clasificacion = clasificar_cuenta(codigo)
-        
         # Lógica de signos según tipo de cuenta:
         # - Activos (1): saldo deudor (+) es positivo
         # - Pasivos (2): saldo acreedor (-) se invierte a positivo
@@ -173,14 +201,30 @@ def obtener_balance(cursor, fecha_hasta=None):
     return cuentas
 
 
-def obtener_movimientos_cuenta(cursor, codigo_cuenta, fecha_hasta=None):
-    """Obtiene los movimientos de una cuenta específica."""
+# Columnas de las hojas de detalle (filas de iterar_movimientos_por_cuenta + saldo)
+COLUMNAS_MOVIMIENTOS = ['Fecha', 'Asiento', 'Descripción', 'Tercero', 'Debe', 'Haber', 'Saldo']
+
+
+def iterar_movimientos_por_cuenta(conn, codigos, fecha_hasta=None):
+    """
+    Movimientos de varias cuentas en una sola consulta, agrupados por cuenta.
+    
+    Usa un cursor de servidor (iterar_filas): las filas llegan en bloques de
+    ODOO_ITERSIZE a medida que se consumen, así la memoria no depende del
+    tamaño del libro mayor. Debe y haber llegan como float.
+    
+    Yields:
+        (codigo, filas) en orden de código. `filas` es un iterador de
+        (fecha, asiento, descripcion, tercero, debe, haber), del más reciente
+        al más antiguo; se debe consumir antes de pasar a la cuenta siguiente.
+    """
     
     if fecha_hasta is None:
         fecha_hasta = datetime.now().strftime('%Y-%m-%d')
     
     query = """
     SELECT 
+        aa.code as codigo,
         aml.date as fecha,
         am.name as asiento,
         aml.name as descripcion,
@@ -191,14 +235,15 @@ def obtener_movimientos_cuenta(cursor, codigo_cuenta, fecha_hasta=None):
     JOIN account_account aa ON aml.account_id = aa.id
     JOIN account_move am ON aml.move_id = am.id
     LEFT JOIN res_partner rp ON aml.partner_id = rp.id
-    WHERE aa.code = %s
+    WHERE aa.code = ANY(%s)
       AND am.state = 'posted'
       AND aml.date <= %s
-    ORDER BY aml.date DESC, am.name
+    ORDER BY aa.code, aml.date DESC, am.name
     """
     
-    cursor.execute(query, (codigo_cuenta, fecha_hasta))
-    return cursor.fetchall()
+    filas = iterar_filas(conn, query, (list(codigos), fecha_hasta))
+    for codigo, filas_cuenta in groupby(filas, key=itemgetter(0)):
+        yield codigo, (fila[1:] for fila in filas_cuenta)
 
 
 def generar_balance_excel(db_name, fecha_hasta=None):
@@ -214,19 +259,10 @@ def generar_balance_excel(db_name, fecha_hasta=None):
     print("=" * 70)
     print(f"   Fecha de corte: {fecha_hasta}")
     
-    # Conectar
-    conn = psycopg2.connect(
-        host=DB_CONFIG['host'],
-        port=DB_CONFIG['port'],
-        database=db_name,
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-    )
-    cursor = conn.cursor()
-    
-    # Obtener balance
+    # Obtener balance (conexión del pool compartido)
     print("\n📊 Obteniendo balance...")
-    cuentas = obtener_balance(cursor, fecha_hasta)
+    with conexion(db_name) as conn, conn.cursor() as cursor:
+        cuentas = obtener_balance(cursor, fecha_hasta, db_name)
     print(f"   {len(cuentas)} cuentas con movimientos")
     
     # Clasificar cuentas
@@ -303,294 +339,234 @@ def generar_balance_excel(db_name, fecha_hasta=None):
     
     print(f"\n📝 Generando Excel...")
     
+    # Nombres de las hojas de detalle: se asignan antes de escribir, porque
+    # en modo streaming los hipervínculos del balance deben conocerlos. Toda
+    # cuenta del balance tiene movimientos (HAVING), así que cada cuenta con
+    # saldo tendrá su hoja.
     cuenta_a_hoja = {}
+    cuenta_por_codigo = {}
+    nombres_usados = {'Resumen', 'Balance'}
+    for c in cuentas:
+        if abs(c['saldo']) < 1 or c['codigo'] in cuenta_a_hoja:
+            continue
+        cuenta_a_hoja[c['codigo']] = nombre_hoja_unico(f"{c['codigo']} {c['cuenta']}", nombres_usados)
+        cuenta_por_codigo[c['codigo']] = c
+    
+    libro = LibroStreaming()
+    estilos = libro.estilos(ESTILOS_FILA)
+    
+    # ═══════════════════════════════════════════════════════════════════════
+    # HOJA 1: RESUMEN
+    # ═══════════════════════════════════════════════════════════════════════
+    rows = []
+    row_types = []
+    
+    # Título
+    rows.append([f"BALANCE GENERAL - {empresa_nombre}", "", "", "", f"Fecha: {fecha_hasta}"])
+    row_types.append("titulo")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # BALANCE CLASIFICADO
+    rows.append(["BALANCE CLASIFICADO", "", "", "", ""])
+    row_types.append("section")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # ACTIVOS
+    rows.append(["ACTIVOS", "", "", "", ""])
+    row_types.append("category")
+    
+    rows.append(["  Activo Corriente", "", "", "", ""])
+    row_types.append("subcategory")
+    for c in categorias.get('activo_corriente', [])[:10]:
+        rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
+        row_types.append("item")
+    rows.append(["  Total Activo Corriente", total_activo_corriente, "", "", ""])
+    row_types.append("subtotal")
     
-    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-        # ═══════════════════════════════════════════════════════════════════
-        # HOJA 1: RESUMEN
-        # ═══════════════════════════════════════════════════════════════════
-        rows = []
-        row_types = []
-        
-        # Título
-        rows.append([f"BALANCE GENERAL - {empresa_nombre}", "", "", "", f"Fecha: {fecha_hasta}"])
-        row_types.append("titulo")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # BALANCE CLASIFICADO
-        rows.append(["BALANCE CLASIFICADO", "", "", "", ""])
-        row_types.append("section")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # ACTIVOS
-        rows.append(["ACTIVOS", "", "", "", ""])
-        row_types.append("category")
-        
-        rows.append(["  Activo Corriente", "", "", "", ""])
-        row_types.append("subcategory")
-        for c in categorias.get('activo_corriente', [])[:10]:
-            rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
-            row_types.append("item")
-        rows.append(["  Total Activo Corriente", total_activo_corriente, "", "", ""])
-        row_types.append("subtotal")
-        
-        rows.append(["  Activo No Corriente", "", "", "", ""])
-        row_types.append("subcategory")
-        for c in categorias.get('activo_no_corriente', [])[:10]:
-            rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
-            row_types.append("item")
-        rows.append(["  Total Activo No Corriente", total_activo_no_corriente, "", "", ""])
-        row_types.append("subtotal")
-        
-        rows.append(["TOTAL ACTIVOS", total_activos, "", "", ""])
-        row_types.append("total")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # PASIVOS
-        rows.append(["PASIVOS", "", "", "", ""])
-        row_types.append("category")
-        
-        rows.append(["  Pasivo Corriente", "", "", "", ""])
-        row_types.append("subcategory")
-        for c in categorias.get('pasivo_corriente', [])[:10]:
-            rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
-            row_types.append("item")
-        rows.append(["  Total Pasivo Corriente", total_pasivo_corriente, "", "", ""])
-        row_types.append("subtotal")
-        
-        rows.append(["  Pasivo No Corriente", "", "", "", ""])
-        row_types.append("subcategory")
-        for c in categorias.get('pasivo_no_corriente', [])[:10]:
-            rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
-            row_types.append("item")
-        rows.append(["  Total Pasivo No Corriente", total_pasivo_no_corriente, "", "", ""])
-        row_types.append("subtotal")
-        
-        rows.append(["TOTAL PASIVOS", total_pasivos, "", "", ""])
-        row_types.append("total")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # PATRIMONIO
-        rows.append(["PATRIMONIO", "", "", "", ""])
-        row_types.append("category")
-        for c in categorias.get('patrimonio', []):
-            rows.append([f"  {c['cuenta']}", c['valor_balance'], "", "", ""])
-            row_types.append("item")
-        rows.append(["  Resultado del Período", resultado_neto, "", "", "(calculado)"])
+    rows.append(["  Activo No Corriente", "", "", "", ""])
+    row_types.append("subcategory")
+    for c in categorias.get('activo_no_corriente', [])[:10]:
+        rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
         row_types.append("item")
-        if ajustes_apertura != 0:
-            rows.append(["  Ajustes de Apertura", ajustes_apertura, "", "", ""])
-            row_types.append("item")
-        rows.append(["TOTAL PATRIMONIO", total_patrimonio, "", "", ""])
-        row_types.append("total")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        rows.append(["TOTAL PASIVOS + PATRIMONIO", total_pasivos + total_patrimonio, "", "", ""])
-        row_types.append("total_final")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # Verificación
-        if cuadra:
-            rows.append(["✅ CUADRATURA OK: Activos = Pasivos + Patrimonio", "", "", "", ""])
-            row_types.append("verification_ok")
-        else:
-            rows.append([f"⚠️ DESCUADRE: Diferencia = ${diferencia:,.0f}", "", "", "", ""])
-            row_types.append("verification_error")
-        
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # ESTADO DE RESULTADOS
-        rows.append(["ESTADO DE RESULTADOS", "", "", "", ""])
-        row_types.append("section")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        rows.append(["Ingresos Operacionales", ingresos, "", "", ""])
+    rows.append(["  Total Activo No Corriente", total_activo_no_corriente, "", "", ""])
+    row_types.append("subtotal")
+    
+    rows.append(["TOTAL ACTIVOS", total_activos, "", "", ""])
+    row_types.append("total")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # PASIVOS
+    rows.append(["PASIVOS", "", "", "", ""])
+    row_types.append("category")
+    
+    rows.append(["  Pasivo Corriente", "", "", "", ""])
+    row_types.append("subcategory")
+    for c in categorias.get('pasivo_corriente', [])[:10]:
+        rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
         row_types.append("item")
-        rows.append(["Costo de Ventas", -costos, "", "", ""])
+    rows.append(["  Total Pasivo Corriente", total_pasivo_corriente, "", "", ""])
+    row_types.append("subtotal")
+    
+    rows.append(["  Pasivo No Corriente", "", "", "", ""])
+    row_types.append("subcategory")
+    for c in categorias.get('pasivo_no_corriente', [])[:10]:
+        rows.append([f"    {c['cuenta']}", c['valor_balance'], "", "", ""])
         row_types.append("item")
-        rows.append(["UTILIDAD BRUTA", utilidad_bruta, "", "", ""])
-        row_types.append("subtotal")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        rows.append(["Gastos Operacionales", -gastos_op, "", "", ""])
+    rows.append(["  Total Pasivo No Corriente", total_pasivo_no_corriente, "", "", ""])
+    row_types.append("subtotal")
+    
+    rows.append(["TOTAL PASIVOS", total_pasivos, "", "", ""])
+    row_types.append("total")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # PATRIMONIO
+    rows.append(["PATRIMONIO", "", "", "", ""])
+    row_types.append("category")
+    for c in categorias.get('patrimonio', []):
+        rows.append([f"  {c['cuenta']}", c['valor_balance'], "", "", ""])
         row_types.append("item")
-        rows.append(["RESULTADO OPERACIONAL", resultado_operacional, "", "", ""])
-        row_types.append("total")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        rows.append(["Otros Ingresos No Operacionales", otros_ingresos, "", "", ""])
+    rows.append(["  Resultado del Período", resultado_neto, "", "", "(calculado)"])
+    row_types.append("item")
+    if ajustes_apertura != 0:
+        rows.append(["  Ajustes de Apertura", ajustes_apertura, "", "", ""])
         row_types.append("item")
-        rows.append(["Otros Gastos No Operacionales", -otros_gastos, "", "", "(incluye impuestos)"])
+    rows.append(["TOTAL PATRIMONIO", total_patrimonio, "", "", ""])
+    row_types.append("total")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    rows.append(["TOTAL PASIVOS + PATRIMONIO", total_pasivos + total_patrimonio, "", "", ""])
+    row_types.append("total_final")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # Verificación
+    if cuadra:
+        rows.append(["✅ CUADRATURA OK: Activos = Pasivos + Patrimonio", "", "", "", ""])
+        row_types.append("verification_ok")
+    else:
+        rows.append([f"⚠️ DESCUADRE: Diferencia = ${diferencia:,.0f}", "", "", "", ""])
+        row_types.append("verification_error")
+    
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # ESTADO DE RESULTADOS
+    rows.append(["ESTADO DE RESULTADOS", "", "", "", ""])
+    row_types.append("section")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    rows.append(["Ingresos Operacionales", ingresos, "", "", ""])
+    row_types.append("item")
+    rows.append(["Costo de Ventas", -costos, "", "", ""])
+    row_types.append("item")
+    rows.append(["UTILIDAD BRUTA", utilidad_bruta, "", "", ""])
+    row_types.append("subtotal")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    rows.append(["Gastos Operacionales", -gastos_op, "", "", ""])
+    row_types.append("item")
+    rows.append(["RESULTADO OPERACIONAL", resultado_operacional, "", "", ""])
+    row_types.append("total")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    rows.append(["Otros Ingresos No Operacionales", otros_ingresos, "", "", ""])
+    row_types.append("item")
+    rows.append(["Otros Gastos No Operacionales", -otros_gastos, "", "", "(incluye impuestos)"])
+    row_types.append("item")
+    if impuesto_contabilizado > 0:
+        rows.append([f"  (Impuesto Renta incluido)", -impuesto_contabilizado, "", "", ""])
         row_types.append("item")
-        if impuesto_contabilizado > 0:
-            rows.append([f"  (Impuesto Renta incluido)", -impuesto_contabilizado, "", "", ""])
-            row_types.append("item")
-        rows.append(["RESULTADO NETO", resultado_neto, "", "", ""])
-        row_types.append("total_final")
-        
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        # KPIs
-        rows.append(["INDICADORES FINANCIEROS", "", "", "", ""])
-        row_types.append("section")
-        rows.append(["", "", "", "", ""])
-        row_types.append("empty")
-        
-        margen_bruto = (utilidad_bruta / ingresos * 100) if ingresos else 0
-        margen_op = (resultado_operacional / ingresos * 100) if ingresos else 0
-        margen_neto = (resultado_neto / ingresos * 100) if ingresos else 0
-        roa = (resultado_neto / total_activos * 100) if total_activos else 0
-        roe = (resultado_neto / total_patrimonio * 100) if total_patrimonio else 0
-        
-        rows.append(["Margen Bruto", f"{margen_bruto:.1f}%", "Utilidad Bruta / Ingresos", "", ""])
-        row_types.append("kpi")
-        rows.append(["Margen Operacional", f"{margen_op:.1f}%", "Resultado Op / Ingresos", "", ""])
-        row_types.append("kpi")
-        rows.append(["Margen Neto", f"{margen_neto:.1f}%", "Resultado Neto / Ingresos", "", ""])
-        row_types.append("kpi")
-        rows.append(["ROA", f"{roa:.1f}%", "Resultado / Activos", "", ""])
-        row_types.append("kpi")
-        rows.append(["ROE", f"{roe:.1f}%", "Resultado / Patrimonio", "", ""])
-        row_types.append("kpi")
-        
-        # Escribir hoja Resumen
-        df_resumen = pd.DataFrame(rows)
-        df_resumen.to_excel(writer, sheet_name='Resumen', index=False, header=False)
-        
-        ws_resumen = writer.sheets['Resumen']
-        
-        # Aplicar formatos
-        for row_idx, row_type in enumerate(row_types, start=1):
-            cell_a = ws_resumen.cell(row=row_idx, column=1)
-            cell_b = ws_resumen.cell(row=row_idx, column=2)
+    rows.append(["RESULTADO NETO", resultado_neto, "", "", ""])
+    row_types.append("total_final")
+    
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    # KPIs
+    rows.append(["INDICADORES FINANCIEROS", "", "", "", ""])
+    row_types.append("section")
+    rows.append(["", "", "", "", ""])
+    row_types.append("empty")
+    
+    margen_bruto = (utilidad_bruta / ingresos * 100) if ingresos else 0
+    margen_op = (resultado_operacional / ingresos * 100) if ingresos else 0
+    margen_neto = (resultado_neto / ingresos * 100) if ingresos else 0
+    roa = (resultado_neto / total_activos * 100) if total_activos else 0
+    roe = (resultado_neto / total_patrimonio * 100) if total_patrimonio else 0
+    
+    rows.append(["Margen Bruto", f"{margen_bruto:.1f}%", "Utilidad Bruta / Ingresos", "", ""])
+    row_types.append("kpi")
+    rows.append(["Margen Operacional", f"{margen_op:.1f}%", "Resultado Op / Ingresos", "", ""])
+    row_types.append("kpi")
+    rows.append(["Margen Neto", f"{margen_neto:.1f}%", "Resultado Neto / Ingresos", "", ""])
+    row_types.append("kpi")
+    rows.append(["ROA", f"{roa:.1f}%", "Resultado / Activos", "", ""])
+    row_types.append("kpi")
+    rows.append(["ROE", f"{roe:.1f}%", "Resultado / Patrimonio", "", ""])
+    row_types.append("kpi")
+    
+    # Escribir hoja Resumen (cada fila con su formato según el tipo)
+    ws_resumen = libro.crear_hoja('Resumen', anchos={'A': 45, 'B': 18, 'C': 30, 'E': 20})
+    for row, row_type in zip(rows, row_types):
+        formato = FORMATO_RESUMEN.get(row_type, {})
+        ws_resumen.fila(row, columnas=estilos.columnas(row, formato, [2], ESTILOS["formato_miles"]))
+    
+    # ═══════════════════════════════════════════════════════════════════════
+    # HOJA 2: BALANCE DETALLADO
+    # ═══════════════════════════════════════════════════════════════════════
+    df_balance = pd.DataFrame(cuentas)
+    df_balance = df_balance[['codigo', 'cuenta', 'debe', 'haber', 'saldo', 'clasificacion']]
+    df_balance.columns = ['Código', 'Cuenta', 'Debe', 'Haber', 'Saldo', 'Clasificación']
+    df_balance['Ver Detalle'] = ''
+    
+    ws_balance = libro.crear_hoja('Balance')
+    ws_balance.fila([f"BALANCE DETALLADO - {empresa_nombre} - {fecha_hasta}"], columnas={1: estilos("titulo")})
+    ws_balance.fila(df_balance.columns, estilo=estilos("header"))
+    
+    # Hipervínculos a las hojas de detalle
+    for c, fila in zip(cuentas, filas_dataframe(df_balance)):
+        columnas = None
+        if c['codigo'] in cuenta_a_hoja:
+            fila[6] = "→ Ver"
+            columnas = {7: {"hyperlink": f"#'{cuenta_a_hoja[c['codigo']]}'!A1", "style": "Hyperlink"}}
+        ws_balance.fila(fila, columnas=columnas)
+    
+    # ═══════════════════════════════════════════════════════════════════════
+    # HOJAS DE DETALLE POR CUENTA
+    # ═══════════════════════════════════════════════════════════════════════
+    # Una sola consulta para todas las cuentas: cada cuenta se escribe en su
+    # hoja a medida que llegan sus filas, con saldo acumulado
+    print("   Generando hojas de detalle...")
+    hojas_detalle = 0
+    with conexion(db_name) as conn:
+        for codigo, movimientos in iterar_movimientos_por_cuenta(conn, cuenta_a_hoja, fecha_hasta):
+            c = cuenta_por_codigo[codigo]
+            ws = libro.crear_hoja(cuenta_a_hoja[codigo])
+            ws.fila(["← Volver al Balance"], columnas={1: {"hyperlink": "#'Balance'!A1", "style": "Hyperlink"}})
+            ws.fila([f"{c['codigo']} - {c['cuenta']}"], columnas={1: estilos("titulo")})
+            ws.fila(COLUMNAS_MOVIMIENTOS)
             
-            if row_type == "titulo":
-                cell_a.font = ESTILOS["font_titulo"]
-            elif row_type == "section":
-                cell_a.font = ESTILOS["font_section"]
-                cell_a.fill = ESTILOS["fill_section"]
-            elif row_type == "category":
-                cell_a.font = ESTILOS["font_category"]
-            elif row_type == "subcategory":
-                cell_a.font = Font(bold=True, italic=True)
-            elif row_type == "subtotal":
-                cell_a.font = ESTILOS["font_subtotal"]
-                cell_b.font = ESTILOS["font_subtotal"]
-                cell_a.fill = ESTILOS["fill_subtotal"]
-                cell_b.fill = ESTILOS["fill_subtotal"]
-            elif row_type == "total":
-                cell_a.font = ESTILOS["font_total"]
-                cell_b.font = ESTILOS["font_total"]
-            elif row_type == "total_final":
-                cell_a.font = ESTILOS["font_total_final"]
-                cell_a.fill = ESTILOS["fill_total_final"]
-                cell_b.font = ESTILOS["font_total_final"]
-                cell_b.fill = ESTILOS["fill_total_final"]
-            elif row_type == "verification_ok":
-                cell_a.font = Font(bold=True, color="006400")
-            elif row_type == "verification_error":
-                cell_a.font = Font(bold=True, color="FF0000")
-            elif row_type == "kpi":
-                cell_b.font = Font(bold=True, color="1F4E79")
-            
-            # Formato numérico
-            if isinstance(rows[row_idx-1][1], (int, float)):
-                cell_b.number_format = ESTILOS["formato_miles"]
-        
-        # Anchos de columna
-        ws_resumen.column_dimensions['A'].width = 45
-        ws_resumen.column_dimensions['B'].width = 18
-        ws_resumen.column_dimensions['C'].width = 30
-        ws_resumen.column_dimensions['E'].width = 20
-        
-        # ═══════════════════════════════════════════════════════════════════
-        # HOJA 2: BALANCE DETALLADO
-        # ═══════════════════════════════════════════════════════════════════
-        df_balance = pd.DataFrame(cuentas)
-        df_balance = df_balance[['codigo', 'cuenta', 'debe', 'haber', 'saldo', 'clasificacion']]
-        df_balance.columns = ['Código', 'Cuenta', 'Debe', 'Haber', 'Saldo', 'Clasificación']
-        df_balance['Ver Detalle'] = ''
-        
-        df_balance.to_excel(writer, sheet_name='Balance', index=False, startrow=1)
-        
-        ws_balance = writer.sheets['Balance']
-        ws_balance.cell(row=1, column=1).value = f"BALANCE DETALLADO - {empresa_nombre} - {fecha_hasta}"
-        ws_balance.cell(row=1, column=1).font = ESTILOS["font_titulo"]
-        
-        # Formato encabezados
-        for col in range(1, 8):
-            cell = ws_balance.cell(row=2, column=col)
-            cell.font = ESTILOS["font_header"]
-            cell.fill = ESTILOS["fill_header"]
-        
-        # ═══════════════════════════════════════════════════════════════════
-        # HOJAS DE DETALLE POR CUENTA
-        # ═══════════════════════════════════════════════════════════════════
-        print("   Generando hojas de detalle...")
-        
-        cuentas_con_detalle = 0
-        for c in cuentas:
-            if abs(c['saldo']) < 1:
-                continue
-            
-            movimientos = obtener_movimientos_cuenta(cursor, c['codigo'], fecha_hasta)
-            
-            if not movimientos:
-                continue
-            
-            # Crear hoja
-            sheet_name = sanitize_sheet_name(c['codigo'], c['cuenta'])
-            
-            df_mov = pd.DataFrame(movimientos, columns=['Fecha', 'Asiento', 'Descripción', 'Tercero', 'Debe', 'Haber'])
-            df_mov['Fecha'] = df_mov['Fecha'].astype(str)
-            
-            # Calcular saldo acumulado
-            saldo_acum = []
-            acum = 0
-            for _, row in df_mov.iterrows():
-                acum += float(row['Debe'] or 0) - float(row['Haber'] or 0)
-                saldo_acum.append(acum)
-            df_mov['Saldo'] = saldo_acum
-            
-            df_mov.to_excel(writer, sheet_name=sheet_name, index=False, startrow=2)
-            
-            ws = writer.sheets[sheet_name]
-            ws.cell(row=1, column=1).value = "← Volver al Balance"
-            ws.cell(row=1, column=1).hyperlink = "#'Balance'!A1"
-            ws.cell(row=1, column=1).style = "Hyperlink"
-            ws.cell(row=2, column=1).value = f"{c['codigo']} - {c['cuenta']}"
-            ws.cell(row=2, column=1).font = ESTILOS["font_titulo"]
-            
-            cuenta_a_hoja[c['codigo']] = sheet_name
-            cuentas_con_detalle += 1
-        
-        print(f"   {cuentas_con_detalle} cuentas con detalle")
-        
-        # Agregar hipervínculos en Balance
-        for row_idx, c in enumerate(cuentas, start=3):
-            if c['codigo'] in cuenta_a_hoja:
-                cell = ws_balance.cell(row=row_idx, column=7)
-                cell.value = "→ Ver"
-                cell.hyperlink = f"#'{cuenta_a_hoja[c['codigo']]}'!A1"
-                cell.style = "Hyperlink"
-    
-    cursor.close()
-    conn.close()
+            saldo = 0
+            for fecha, asiento, descripcion, tercero, debe, haber in movimientos:
+                saldo += (debe or 0) - (haber or 0)
+                ws.fila([str(fecha), asiento, descripcion, tercero, debe, haber, saldo])
+            hojas_detalle += 1
+    
+    print(f"   {hojas_detalle} cuentas con detalle")
+    
+    libro.guardar(filename)
     
     print(f"\n✅ Archivo generado: {filename}")
     print("=" * 70)
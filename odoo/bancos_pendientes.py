@@ -15,25 +15,11 @@ Uso:
     python -m odoo.bancos_pendientes
 """
 
-import os
+from collections import namedtuple
 from datetime import datetime
-from dotenv import load_dotenv
-import psycopg2
+from itertools import islice
 
-load_dotenv()
-
-
-def get_env_clean(key, default=None):
-    val = os.getenv(key)
-    return val.strip() if val else default
-
-
-DB_CONFIG = {
-    'host': get_env_clean('SERVER'),
-    'port': get_env_clean('PORT', '5432'),
-    'user': get_env_clean('DB_USER'),
-    'password': get_env_clean('PASSWORD'),
-}
+from .conexion import conexion, iterar_filas
 
 DATABASES = {
     'FactorIT': 'FactorIT SpA',
@@ -41,6 +27,13 @@ DATABASES = {
 }
 
 
+# Filas de las consultas (NUMERIC llega como float, ver conexion.iterar_filas)
+MovimientoPendiente = namedtuple(
+    'MovimientoPendiente', 'fecha banco descripcion referencia monto tercero periodo_extracto')
+ResumenBanco = namedtuple('ResumenBanco', 'banco cantidad total_abonos total_cargos neto')
+ResumenExtracto = namedtuple('ResumenExtracto', 'periodo banco estado lineas total')
+
+
 # Query para movimientos sin conciliar (extractos en estado 'open')
 QUERY_PENDIENTES = """
 SELECT 
@@ -99,106 +92,88 @@ def obtener_pendientes(db_name, empresa_nombre):
     print(f"{'='*70}")
     
     try:
-        conn = psycopg2.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database=db_name,
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-        )
-        cursor = conn.cursor()
-        
-        # Primero mostrar estado general de extractos
-        cursor.execute("""
-            SELECT state, COUNT(*), 
-                   (SELECT COUNT(*) FROM account_bank_statement_line bsl 
-                    WHERE bsl.statement_id IN (SELECT id FROM account_bank_statement WHERE state = bs.state))
-            FROM account_bank_statement bs
-            GROUP BY state
-        """)
-        print("\n📋 ESTADO DE EXTRACTOS BANCARIOS:")
-        print("-" * 50)
-        for state, ext_count, mov_count in cursor.fetchall():
-            estado = "✅ Confirmado" if state == 'confirm' else "📂 Abierto (pendiente)"
-            print(f"   {estado}: {ext_count} extractos, {mov_count} movimientos")
-        
-        # Resumen de extractos abiertos
-        print("\n📂 EXTRACTOS ABIERTOS (Pendientes de Conciliar):")
-        print("-" * 70)
-        
-        cursor.execute(QUERY_RESUMEN_EXTRACTOS)
-        extractos = cursor.fetchall()
-        
-        if extractos:
-            print(f"{'Período':<12} {'Banco':<30} {'Líneas':>8} {'Total':>18}")
+        with conexion(db_name) as conn, conn.cursor() as cursor:
+            # Primero mostrar estado general de extractos
+            cursor.execute("""
+                SELECT state, COUNT(*), 
+                       (SELECT COUNT(*) FROM account_bank_statement_line bsl 
+                        WHERE bsl.statement_id IN (SELECT id FROM account_bank_statement WHERE state = bs.state))
+                FROM account_bank_statement bs
+                GROUP BY state
+            """)
+            print("\n📋 ESTADO DE EXTRACTOS BANCARIOS:")
+            print("-" * 50)
+            for state, ext_count, mov_count in cursor.fetchall():
+                estado = "✅ Confirmado" if state == 'confirm' else "📂 Abierto (pendiente)"
+                print(f"   {estado}: {ext_count} extractos, {mov_count} movimientos")
+            
+            # Resumen de extractos abiertos
+            print("\n📂 EXTRACTOS ABIERTOS (Pendientes de Conciliar):")
             print("-" * 70)
-            for periodo, banco, estado, lineas, total in extractos:
-                if lineas and lineas > 0:
-                    total = total or 0
-                    print(f"{periodo:<12} {(banco or '')[:30]:<30} {lineas:>8} ${total:>17,.0f}")
-        else:
-            print("   ✅ No hay extractos pendientes de conciliar")
-        
-        # Resumen por banco
-        print("\n📊 RESUMEN POR BANCO (solo pendientes):")
-        print("-" * 70)
-        print(f"{'Banco':<30} {'Cant':>6} {'Abonos':>15} {'Cargos':>15} {'Neto':>15}")
-        print("-" * 70)
-        
-        cursor.execute(QUERY_RESUMEN_BANCO)
-        resumen = cursor.fetchall()
-        
-        total_movs = 0
-        total_abonos = 0
-        total_cargos = 0
-        total_neto = 0
-        
-        for banco, cant, abonos, cargos, neto in resumen:
-            banco_str = (banco or 'Sin banco')[:30]
-            abonos = abonos or 0
-            cargos = cargos or 0
-            neto = neto or 0
-            print(f"{banco_str:<30} {cant:>6} ${abonos:>14,.0f} ${cargos:>14,.0f} ${neto:>14,.0f}")
-            total_movs += cant
-            total_abonos += abonos
-            total_cargos += cargos
-            total_neto += neto
-        
-        if total_movs > 0:
+            
+            extractos = list(iterar_filas(conn, QUERY_RESUMEN_EXTRACTOS, registro=ResumenExtracto))
+            
+            if extractos:
+                print(f"{'Período':<12} {'Banco':<30} {'Líneas':>8} {'Total':>18}")
+                print("-" * 70)
+                for periodo, banco, estado, lineas, total in extractos:
+                    if lineas and lineas > 0:
+                        total = total or 0
+                        print(f"{periodo:<12} {(banco or '')[:30]:<30} {lineas:>8} ${total:>17,.0f}")
+            else:
+                print("   ✅ No hay extractos pendientes de conciliar")
+            
+            # Resumen por banco
+            print("\n📊 RESUMEN POR BANCO (solo pendientes):")
             print("-" * 70)
-            print(f"{'TOTAL':<30} {total_movs:>6} ${total_abonos:>14,.0f} ${total_cargos:>14,.0f} ${total_neto:>14,.0f}")
-        else:
-            print("   ✅ No hay movimientos pendientes")
-        
-        # Detalle de movimientos recientes
-        print(f"\n📋 MOVIMIENTOS PENDIENTES (últimos 20):")
-        print("-" * 100)
-        print(f"{'Fecha':<12} {'Banco':<20} {'Monto':>15} {'Descripción':<50}")
-        print("-" * 100)
-        
-        cursor.execute(QUERY_PENDIENTES + " LIMIT 20")
-        movimientos = cursor.fetchall()
-        
-        for row in movimientos:
-            fecha, banco, desc, ref, monto, tercero = row[0], row[1], row[2], row[3], row[4], row[5]
-            fecha_str = str(fecha) if fecha else ''
-            banco_str = (banco or '')[:20]
-            desc_str = (desc or ref or tercero or '')[:50]
-            print(f"{fecha_str:<12} {banco_str:<20} ${monto:>14,.0f} {desc_str}")
-        
-        if total_movs > 20:
-            print(f"\n   ... y {total_movs - 20} movimientos más")
-        
-        # Obtener todos los movimientos para retornar
-        cursor.execute(QUERY_PENDIENTES)
-        todos_movimientos = cursor.fetchall()
-        
-        # Obtener extractos para el resultado
-        cursor.execute(QUERY_RESUMEN_EXTRACTOS)
-        extractos_result = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+            print(f"{'Banco':<30} {'Cant':>6} {'Abonos':>15} {'Cargos':>15} {'Neto':>15}")
+            print("-" * 70)
+            
+            resumen = list(iterar_filas(conn, QUERY_RESUMEN_BANCO, registro=ResumenBanco))
+            
+            total_movs = 0
+            total_abonos = 0
+            total_cargos = 0
+            total_neto = 0
+            
+            for banco, cant, abonos, cargos, neto in resumen:
+                banco_str = (banco or 'Sin banco')[:30]
+                abonos = abonos or 0
+                cargos = cargos or 0
+                neto = neto or 0
+                print(f"{banco_str:<30} {cant:>6} ${abonos:>14,.0f} ${cargos:>14,.0f} ${neto:>14,.0f}")
+                total_movs += cant
+                total_abonos += abonos
+                total_cargos += cargos
+                total_neto += neto
+            
+            if total_movs > 0:
+                print("-" * 70)
+                print(f"{'TOTAL':<30} {total_movs:>6} ${total_abonos:>14,.0f} ${total_cargos:>14,.0f} ${total_neto:>14,.0f}")
+            else:
+                print("   ✅ No hay movimientos pendientes")
+            
+            # Detalle de movimientos recientes
+            print(f"\n📋 MOVIMIENTOS PENDIENTES (últimos 20):")
+            print("-" * 100)
+            print(f"{'Fecha':<12} {'Banco':<20} {'Monto':>15} {'Descripción':<50}")
+            print("-" * 100)
+            
+            # Una sola lectura (por bloques) de todos los movimientos: los
+            # primeros 20 se muestran y el resto se agrega al resultado
+            filas = iterar_filas(conn, QUERY_PENDIENTES, registro=MovimientoPendiente)
+            todos_movimientos = list(islice(filas, 20))
+            
+            for mov in todos_movimientos:
+                fecha_str = str(mov.fecha) if mov.fecha else ''
+                banco_str = (mov.banco or '')[:20]
+                desc_str = (mov.descripcion or mov.referencia or mov.tercero or '')[:50]
+                print(f"{fecha_str:<12} {banco_str:<20} ${mov.monto:>14,.0f} {desc_str}")
+            
+            if total_movs > 20:
+                print(f"\n   ... y {total_movs - 20} movimientos más")
+            
+            todos_movimientos.extend(filas)
         
         return {
             'success': True,
@@ -209,7 +184,7 @@ def obtener_pendientes(db_name, empresa_nombre):
             'total_cargos': total_cargos,
             'neto': total_neto,
             'resumen_bancos': resumen,
-            'extractos_abiertos': extractos_result,
+            'extractos_abiertos': extractos,
             'movimientos': todos_movimientos
         }
         
@@ -0,0 +1,265 @@
+"""
+Pool de conexiones compartido para las bases Odoo (PostgreSQL).
+
+Mantiene un ThreadedConnectionPool por base de datos, creado en el primer
+uso. Los reportes (pendientes, balance, bancos) toman una conexión del pool
+y la devuelven al terminar, así un proceso que genera varios reportes
+reutiliza las conexiones ya abiertas al servidor remoto en vez de abrir
+una nueva por cada invocación.
+
+Chequeo de salud: una conexión que estuvo ociosa más de
+ODOO_POOL_PING_SEGUNDOS se valida con SELECT 1 antes de entregarla. Si
+está cerrada o falla, se descarta y se abre otra (reconexión). Al
+devolverla se hace rollback para que la siguiente consulta parta sin
+transacción abierta.
+
+Nota: ThreadedConnectionPool mantiene abiertas hasta minconn conexiones
+ociosas; las que se devuelven por sobre ese número se cierran.
+
+Configuración (.env):
+    SERVER=18.223.205.221
+    PORT=5432
+    DB_USER=Hector
+    PASSWORD=tu_password
+    ODOO_POOL_MIN=1               # Conexiones que quedan abiertas entre usos
+    ODOO_POOL_MAX=4               # Conexiones máximas por base de datos
+    ODOO_POOL_PING_SEGUNDOS=30    # Ociosidad tras la cual se valida con SELECT 1
+    ODOO_CONNECT_TIMEOUT=10       # Timeout de conexión (segundos)
+    ODOO_EMPRESA_WORKERS=4        # Bases de datos consultadas en paralelo
+    ODOO_ITERSIZE=2000            # Filas por bloque en cursores de servidor
+
+Lectura de filas: iterar_filas() ejecuta la consulta en un cursor de
+servidor (named cursor) que trae ODOO_ITERSIZE filas por bloque, y
+decodifica NUMERIC directo a float (el typecaster se registra solo en ese
+cursor; los demás siguen recibiendo Decimal). Las filas se entregan como
+tuplas o como el namedtuple que se indique.
+
+Uso:
+    from odoo.conexion import conexion, iterar_filas
+    with conexion('FactorIT') as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        for fila in iterar_filas(conn, 'SELECT id, amount FROM account_move_line'):
+            ...
+"""
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2 import extensions as pg_ext
+from psycopg2 import pool as pg_pool
+
+from common import concurrencia
+from common.entorno import env_int
+
+load_dotenv()
+
+
+def get_env_clean(key, default=None):
+    """Obtiene variable de entorno y limpia espacios/tabs."""
+    val = os.getenv(key)
+    return val.strip() if val else default
+
+
+DB_CONFIG = {
+    'host': get_env_clean('SERVER'),
+    'port': get_env_clean('PORT', '5432'),
+    'user': get_env_clean('DB_USER'),  # Usar DB_USER para evitar conflicto con USER del sistema
+    'password': get_env_clean('PASSWORD'),
+}
+
+POOL_CONFIG = {
+    'minconn': env_int('ODOO_POOL_MIN', 1),
+    'maxconn': env_int('ODOO_POOL_MAX', 4),
+    'ping_segundos': env_int('ODOO_POOL_PING_SEGUNDOS', 30),
+    'connect_timeout': env_int('ODOO_CONNECT_TIMEOUT', 10),
+}
+
+EMPRESA_WORKERS = env_int('ODOO_EMPRESA_WORKERS', 4)
+ITERSIZE = env_int('ODOO_ITERSIZE', 2000)
+
+# Errores que indican una conexión rota (servidor reiniciado, timeout de red...)
+ERRORES_CONEXION = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# NUMERIC -> float sin pasar por Decimal (se registra por cursor, no global)
+NUMERIC_FLOAT = pg_ext.new_type(
+    pg_ext.DECIMAL.values, 'NUMERIC_FLOAT',
+    lambda valor, cursor: float(valor) if valor is not None else None,
+)
+
+
+class PoolOdoo:
+    """
+    Pool de una base de datos, con espera cuando no hay conexiones libres.
+
+    ThreadedConnectionPool lanza PoolError si se piden más de maxconn
+    conexiones; el semáforo hace que el hilo espere a que se libere una.
+    """
+
+    def __init__(self, db_name: str, config: dict = None):
+        config = config or POOL_CONFIG
+        self.db_name = db_name
+        self.ping_segundos = config['ping_segundos']
+        maxconn = max(1, config['maxconn'])
+        self._pool = pg_pool.ThreadedConnectionPool(
+            min(config['minconn'], maxconn), maxconn,
+            host=DB_CONFIG['host'],
+            port=DB_CONFIG['port'],
+            database=db_name,
+            user=DB_CONFIG['user'],
+            password=DB_CONFIG['password'],
+            connect_timeout=config['connect_timeout'],
+        )
+        self._libres = threading.BoundedSemaphore(maxconn)
+        self._ultimo_uso: Dict[int, float] = {}
+
+    def _sana(self, conn) -> bool:
+        """True si la conexión sirve; valida con SELECT 1 si estuvo ociosa."""
+        if conn.closed:
+            return False
+        ultimo = self._ultimo_uso.get(id(conn))
+        if ultimo is None:
+            return True  # Recién abierta por el pool
+        if time.monotonic() - ultimo < self.ping_segundos:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except ERRORES_CONEXION:
+            return False
+
+    def obtener(self):
+        """Toma una conexión sana del pool (reconecta si la entregada está rota)."""
+        self._libres.acquire()
+        try:
+            # Como máximo se descartan todas las conexiones del pool más una nueva
+            for _ in range(self._pool.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._sana(conn):
+                    return conn
+                self._descartar(conn)
+            raise psycopg2.OperationalError(f"No se pudo obtener una conexión sana a '{self.db_name}'")
+        except BaseException:
+            self._libres.release()
+            raise
+
+    def devolver(self, conn):
+        """Devuelve la conexión al pool (la descarta si quedó rota)."""
+        try:
+            if conn.closed:
+                self._descartar(conn)
+                return
+            try:
+                conn.rollback()
+            except ERRORES_CONEXION:
+                self._descartar(conn)
+                return
+            self._ultimo_uso[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+            if conn.closed:
+                # El pool solo guarda minconn conexiones ociosas; el resto las cierra
+                self._ultimo_uso.pop(id(conn), None)
+        finally:
+            self._libres.release()
+
+    def _descartar(self, conn):
+        self._ultimo_uso.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def cerrar(self):
+        self._pool.closeall()
+        self._ultimo_uso.clear()
+
+
+_pools: Dict[str, PoolOdoo] = {}
+_lock = threading.Lock()
+
+
+def get_pool(db_name: str) -> PoolOdoo:
+    """Retorna el pool de la base de datos, creándolo en el primer uso."""
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(db_name)
+            if pool is None:
+                pool = _pools[db_name] = PoolOdoo(db_name)
+    return pool
+
+
+@contextmanager
+def conexion(db_name: str):
+    """
+    Conexión del pool para usar en un bloque with.
+
+    Al salir del bloque la conexión vuelve al pool (con rollback). Si el
+    bloque falla por un error de conexión, la conexión se descarta para
+    que el siguiente uso abra una nueva.
+    """
+    pool = get_pool(db_name)
+    conn = pool.obtener()
+    try:
+        yield conn
+    except ERRORES_CONEXION:
+        if not conn.closed:
+            conn.close()
+        raise
+    finally:
+        pool.devolver(conn)
+
+
+def cerrar_pools(db_name: Optional[str] = None):
+    """Cierra el pool de una base (o de todas) y libera sus conexiones."""
+    with _lock:
+        nombres = [db_name] if db_name else list(_pools)
+        for nombre in nombres:
+            pool = _pools.pop(nombre, None)
+            if pool is not None:
+                pool.cerrar()
+
+
+def mapear_concurrente(fn: Callable, items: Iterable, workers: int = None) -> List:
+    """Aplica fn a cada item (ej: cada base de datos) en paralelo (default ODOO_EMPRESA_WORKERS)."""
+    return concurrencia.mapear_concurrente(fn, items, EMPRESA_WORKERS if workers is None else workers)
+
+
+def iterar_concurrente(fn: Callable, items: Iterable, workers: int = None) -> Iterator:
+    """Como mapear_concurrente, entregando cada resultado en cuanto está listo (default ODOO_EMPRESA_WORKERS)."""
+    return concurrencia.iterar_concurrente(fn, items, EMPRESA_WORKERS if workers is None else workers)
+
+
+_cursores = itertools.count(1)
+
+
+def iterar_filas(conn, query: str, params: Sequence = None, registro: Callable = None,
+                 itersize: int = None) -> Iterator:
+    """
+    Filas de una consulta leídas por bloques con un cursor de servidor.
+    
+    La memoria queda acotada a un bloque de `itersize` filas (ODOO_ITERSIZE)
+    en vez del resultado completo que deja fetchall(). Las columnas NUMERIC
+    llegan como float (None si son NULL).
+    
+    Args:
+        conn: Conexión (del pool); el cursor vive en su transacción actual
+        query: Consulta SQL
+        params: Parámetros de la consulta
+        registro: namedtuple (u otra clase con _make) para cada fila;
+                  sin él se entregan las tuplas de psycopg2
+        itersize: Filas por bloque (default ODOO_ITERSIZE)
+    """
+    with conn.cursor(name=f'odoo_filas_{next(_cursores)}') as cursor:
+        pg_ext.register_type(NUMERIC_FLOAT, cursor)
+        cursor.itersize = itersize or ITERSIZE
+        cursor.execute(query, params)
+        if registro is None:
+            yield from cursor
+        else:
+            yield from map(registro._make, cursor)
@@ -11,6 +11,9 @@ Genera un JSON con todos los pendientes:
 Uso:
     python -m odoo.pendientes              # Muestra en consola y guarda JSON
     python -m odoo.pendientes --output pendientes.json
+    python -m odoo.pendientes --formato ndjson     # json | compacto | ndjson
+
+El archivo se escribe empresa por empresa (common.salida_json).
 
 Como módulo:
     from odoo.pendientes import obtener_pendientes
@@ -19,56 +22,49 @@ Como módulo:
 
 import os
 import sys
-import json
-from datetime import datetime, date
-from decimal import Decimal
-from dotenv import load_dotenv
-import psycopg2
-
-load_dotenv()
-
+from collections import Counter, namedtuple
+from datetime import datetime
 
-def get_env_clean(key, default=None):
-    val = os.getenv(key)
-    return val.strip() if val else default
+from common.salida_json import SalidaReporte
 
-
-DB_CONFIG = {
-    'host': get_env_clean('SERVER'),
-    'port': get_env_clean('PORT', '5432'),
-    'user': get_env_clean('DB_USER'),
-    'password': get_env_clean('PASSWORD'),
-}
+from .conexion import conexion, iterar_concurrente, iterar_filas, mapear_concurrente
 
 DATABASES = {
     'FactorIT': 'FactorIT SpA',
     'FactorIT2': 'FactorIT Ltda',
 }
 
+# Listas de detalle que en NDJSON van una por línea
+DETALLE_NDJSON = {
+    'pendientes_sii': 'documentos',
+    'pendientes_contabilizar': 'asientos',
+    'pendientes_conciliar': 'movimientos',
+}
 
-class JSONEncoder(json.JSONEncoder):
-    """Encoder personalizado para tipos de datos especiales."""
-    def default(self, obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super().default(obj)
+# Filas de cada consulta (NUMERIC ya viene como float, ver iterar_filas)
+DocumentoSII = namedtuple('DocumentoSII', 'id fecha tipo folio proveedor monto')
+AsientoBorrador = namedtuple('AsientoBorrador', 'id fecha diario referencia tercero descripcion')
+ExtractoAbierto = namedtuple('ExtractoAbierto', 'id nombre fecha banco saldo_inicial saldo_final')
+MovimientoBanco = namedtuple('MovimientoBanco', 'id fecha banco descripcion tercero monto referencia')
 
 
 def obtener_pendientes_empresa(db_name: str) -> dict:
-    """Obtiene todos los pendientes de una empresa."""
+    """Obtiene todos los pendientes de una empresa (conexión del pool compartido)."""
     
-    empresa_nombre = DATABASES.get(db_name, db_name)
+    with conexion(db_name) as conn:
+        return _consultar_pendientes(conn, db_name)
+
+
+def _consultar_pendientes(conn, db_name: str) -> dict:
+    """
+    Ejecuta las consultas de pendientes sobre una conexión abierta.
     
-    conn = psycopg2.connect(
-        host=DB_CONFIG['host'],
-        port=DB_CONFIG['port'],
-        database=db_name,
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-    )
-    cursor = conn.cursor()
+    Cada consulta se lee por bloques con un cursor de servidor (iterar_filas).
+    Los resúmenes por diario y por banco se calculan de las mismas filas de
+    detalle, así account_move y account_bank_statement_line se leen una vez.
+    """
+    
+    empresa_nombre = DATABASES.get(db_name, db_name)
     
     resultado = {
         'empresa': empresa_nombre,
@@ -82,7 +78,7 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
     # ═══════════════════════════════════════════════════════════════════
     # 1. DOCUMENTOS POR ACEPTAR EN SII
     # ═══════════════════════════════════════════════════════════════════
-    cursor.execute('''
+    filas = iterar_filas(conn, '''
         SELECT 
             a.id,
             a.date,
@@ -94,16 +90,16 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
         JOIN sii_document_class b ON a.document_class_id = b.id
         WHERE a.state = 'draft'
         ORDER BY a.date DESC
-    ''')
+    ''', registro=DocumentoSII)
     
     docs_sii = []
     total_sii = 0
-    for row in cursor.fetchall():
-        doc_id, fecha, tipo, folio, proveedor, monto = row
-        monto = float(monto or 0)
+    for doc in filas:
+        monto = doc.monto or 0.0
         total_sii += monto
         
         # Parsear RUT y nombre del proveedor
+        proveedor = doc.proveedor
         rut = ''
         nombre = proveedor or ''
         if proveedor and ' ' in proveedor:
@@ -112,10 +108,10 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
             nombre = parts[1] if len(parts) > 1 else ''
         
         docs_sii.append({
-            'id': doc_id,
-            'fecha': fecha,
-            'tipo': tipo,
-            'folio': folio,
+            'id': doc.id,
+            'fecha': doc.fecha,
+            'tipo': doc.tipo,
+            'folio': doc.folio,
             'proveedor_rut': rut,
             'proveedor_nombre': nombre,
             'monto': monto,
@@ -130,7 +126,7 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
     # ═══════════════════════════════════════════════════════════════════
     # 2. ASIENTOS POR CONTABILIZAR (state=draft)
     # ═══════════════════════════════════════════════════════════════════
-    cursor.execute('''
+    filas = iterar_filas(conn, '''
         SELECT 
             am.id,
             am.date,
@@ -143,30 +139,16 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
         LEFT JOIN res_partner rp ON am.partner_id = rp.id
         WHERE am.state = 'draft'
         ORDER BY am.date DESC
-    ''')
+    ''', registro=AsientoBorrador)
     
     asientos_draft = []
-    for row in cursor.fetchall():
-        asiento_id, fecha, diario, referencia, tercero, descripcion = row
-        asientos_draft.append({
-            'id': asiento_id,
-            'fecha': fecha,
-            'diario': diario,
-            'referencia': referencia,
-            'tercero': tercero,
-            'descripcion': descripcion,
-        })
+    conteo_diarios = Counter()
+    for asiento in filas:
+        conteo_diarios[asiento.diario] += 1
+        asientos_draft.append(asiento._asdict())
     
-    # Resumen por diario
-    cursor.execute('''
-        SELECT aj.name as diario, COUNT(*) as cantidad
-        FROM account_move am
-        JOIN account_journal aj ON am.journal_id = aj.id
-        WHERE am.state = 'draft'
-        GROUP BY aj.name
-        ORDER BY COUNT(*) DESC
-    ''')
-    resumen_diarios = {row[0]: row[1] for row in cursor.fetchall()}
+    # Resumen por diario (de las mismas filas, sin otra consulta), más asientos primero
+    resumen_diarios = dict(conteo_diarios.most_common())
     
     resultado['pendientes_contabilizar'] = {
         'cantidad': len(asientos_draft),
@@ -179,7 +161,7 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
     # ═══════════════════════════════════════════════════════════════════
     
     # Extractos abiertos
-    cursor.execute('''
+    filas = iterar_filas(conn, '''
         SELECT 
             abs.id,
             abs.name,
@@ -191,22 +173,18 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
         JOIN account_journal aj ON abs.journal_id = aj.id
         WHERE abs.state = 'open'
         ORDER BY abs.date DESC
-    ''')
+    ''', registro=ExtractoAbierto)
     
     extractos = []
-    for row in cursor.fetchall():
-        ext_id, nombre, fecha, banco, saldo_ini, saldo_fin = row
+    for extracto in filas:
         extractos.append({
-            'id': ext_id,
-            'nombre': nombre,
-            'fecha': fecha,
-            'banco': banco,
-            'saldo_inicial': float(saldo_ini or 0),
-            'saldo_final': float(saldo_fin or 0),
+            **extracto._asdict(),
+            'saldo_inicial': extracto.saldo_inicial or 0.0,
+            'saldo_final': extracto.saldo_final or 0.0,
         })
     
     # Movimientos en extractos abiertos
-    cursor.execute('''
+    filas = iterar_filas(conn, '''
         SELECT 
             abl.id,
             abl.date,
@@ -221,53 +199,34 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
         LEFT JOIN res_partner rp ON abl.partner_id = rp.id
         WHERE abs.state = 'open'
         ORDER BY abl.date DESC
-    ''')
+    ''', registro=MovimientoBanco)
     
     movimientos = []
     total_abonos = 0
     total_cargos = 0
-    for row in cursor.fetchall():
-        mov_id, fecha, banco, descripcion, tercero, monto, referencia = row
-        monto = float(monto or 0)
+    por_banco = {}  # banco -> [cantidad, abonos, cargos]
+    for mov in filas:
+        monto = mov.monto or 0.0
+        acumulado = por_banco.setdefault(mov.banco, [0, 0.0, 0.0])
+        acumulado[0] += 1
         if monto > 0:
+            acumulado[1] += monto
             total_abonos += monto
         else:
+            acumulado[2] += monto
             total_cargos += monto
         
-        movimientos.append({
-            'id': mov_id,
-            'fecha': fecha,
-            'banco': banco,
-            'descripcion': descripcion,
-            'tercero': tercero,
-            'monto': monto,
-            'referencia': referencia,
-        })
-    
-    # Resumen por banco
-    cursor.execute('''
-        SELECT 
-            aj.name as banco,
-            COUNT(*) as cantidad,
-            SUM(CASE WHEN abl.amount > 0 THEN abl.amount ELSE 0 END) as abonos,
-            SUM(CASE WHEN abl.amount < 0 THEN abl.amount ELSE 0 END) as cargos
-        FROM account_bank_statement_line abl
-        JOIN account_bank_statement abs ON abl.statement_id = abs.id
-        JOIN account_journal aj ON abs.journal_id = aj.id
-        WHERE abs.state = 'open'
-        GROUP BY aj.name
-        ORDER BY COUNT(*) DESC
-    ''')
+        movimientos.append({**mov._asdict(), 'monto': monto})
     
+    # Resumen por banco (acumulado en la misma pasada), más movimientos primero
     resumen_bancos = []
-    for row in cursor.fetchall():
-        banco, cantidad, abonos, cargos = row
+    for banco, (cantidad, abonos, cargos) in sorted(por_banco.items(), key=lambda item: -item[1][0]):
         resumen_bancos.append({
             'banco': banco,
             'cantidad': cantidad,
-            'abonos': float(abonos or 0),
-            'cargos': float(cargos or 0),
-            'neto': float((abonos or 0) + (cargos or 0)),
+            'abonos': abonos,
+            'cargos': cargos,
+            'neto': abonos + cargos,
         })
     
     resultado['pendientes_conciliar'] = {
@@ -280,9 +239,6 @@ def obtener_pendientes_empresa(db_name: str) -> dict:
         'movimientos': movimientos,
     }
     
-    cursor.close()
-    conn.close()
-    
     return resultado
 
 
@@ -290,40 +246,77 @@ def obtener_pendientes() -> dict:
     """Obtiene pendientes de todas las empresas configuradas."""
     
     reporte = {
-        'generado': datetime.now().isoformat(),
-        'version': '1.0',
+        **_cabecera_reporte(),
         'empresas': [],
-        'resumen': {
-            'total_sii': 0,
-            'total_sii_monto': 0,
-            'total_contabilizar': 0,
-            'total_conciliar': 0,
-        }
+        'resumen': _resumen_vacio(),
     }
     
-    for db_name in DATABASES.keys():
-        try:
-            pendientes = obtener_pendientes_empresa(db_name)
-            reporte['empresas'].append(pendientes)
-            
-            # Acumular totales
-            reporte['resumen']['total_sii'] += pendientes['pendientes_sii']['cantidad']
-            reporte['resumen']['total_sii_monto'] += pendientes['pendientes_sii']['total']
-            reporte['resumen']['total_contabilizar'] += pendientes['pendientes_contabilizar']['cantidad']
-            reporte['resumen']['total_conciliar'] += pendientes['pendientes_conciliar']['cantidad']
-            
-        except Exception as e:
-            reporte['empresas'].append({
-                'empresa': DATABASES[db_name],
-                'database': db_name,
-                'error': str(e),
-            })
+    # Las empresas se consultan en paralelo (ODOO_EMPRESA_WORKERS): la
+    # latencia total es la de la base más lenta, no la suma de todas
+    resultados = mapear_concurrente(_pendientes_o_error, DATABASES.keys())
+    
+    for pendientes in resultados:
+        reporte['empresas'].append(pendientes)
+        _acumular_resumen(reporte['resumen'], pendientes)
     
     return reporte
 
 
+def iterar_pendientes():
+    """
+    Pendientes de cada empresa, en el orden de DATABASES, entregados apenas
+    termina su consulta (y la de las anteriores). Las empresas con error se
+    entregan con 'error'.
+    """
+    yield from iterar_concurrente(_pendientes_o_error, DATABASES.keys())
+
+
+def _cabecera_reporte() -> dict:
+    return {
+        'generado': datetime.now().isoformat(),
+        'version': '1.0',
+    }
+
+
+def _resumen_vacio() -> dict:
+    return {
+        'total_sii': 0,
+        'total_sii_monto': 0,
+        'total_contabilizar': 0,
+        'total_conciliar': 0,
+    }
+
+
+def _acumular_resumen(resumen: dict, pendientes: dict):
+    """Suma los totales de una empresa al resumen (las empresas con error no suman)."""
+    if 'error' in pendientes:
+        return
+    resumen['total_sii'] += pendientes['pendientes_sii']['cantidad']
+    resumen['total_sii_monto'] += pendientes['pendientes_sii']['total']
+    resumen['total_contabilizar'] += pendientes['pendientes_contabilizar']['cantidad']
+    resumen['total_conciliar'] += pendientes['pendientes_conciliar']['cantidad']
+
+
+def _pendientes_o_error(db_name: str) -> dict:
+    """Pendientes de una empresa, o un dict con 'error' si la consulta falla."""
+    try:
+        return obtener_pendientes_empresa(db_name)
+    except Exception as e:
+        return {
+            'empresa': DATABASES[db_name],
+            'database': db_name,
+            'error': str(e),
+        }
+
+
 def main():
-    """Función principal."""
+    """
+    Función principal.
+    
+    Cada empresa se escribe en el archivo apenas termina su consulta, así
+    el reporte completo no queda en memoria. Retorna la cabecera y el
+    resumen del reporte, con la ruta del archivo en 'archivo'.
+    """
     
     # Parsear argumentos
     output_file = None
@@ -331,54 +324,57 @@ def main():
         idx = sys.argv.index('--output')
         if idx + 1 < len(sys.argv):
             output_file = sys.argv[idx + 1]
+    formato = 'json'
+    if '--formato' in sys.argv:
+        idx = sys.argv.index('--formato')
+        if idx + 1 < len(sys.argv):
+            formato = sys.argv[idx + 1]
     
     print("=" * 70)
     print("   REPORTE DE PENDIENTES FACTORIT")
     print("=" * 70)
     print()
     
-    # Obtener datos
-    print("📊 Consultando pendientes...")
-    reporte = obtener_pendientes()
+    if output_file is None:
+        output_dir = os.path.join(os.path.dirname(__file__), '..', 'temp')
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = 'ndjson' if formato == 'ndjson' else 'json'
+        output_file = os.path.join(output_dir, f'pendientes_factorit_{timestamp}.{extension}')
     
-    # Mostrar resumen
-    print()
-    print("=" * 70)
-    print("   RESUMEN")
-    print("=" * 70)
+    # Consultar y escribir cada empresa a medida que termina
+    print("📊 Consultando pendientes...")
+    cabecera = _cabecera_reporte()
+    resumen = _resumen_vacio()
     
-    for emp in reporte['empresas']:
-        if 'error' in emp:
-            print(f"\n❌ {emp['empresa']}: {emp['error']}")
-            continue
+    with SalidaReporte(output_file, formato, cabecera, DETALLE_NDJSON) as salida:
+        for emp in iterar_pendientes():
+            salida.empresa(emp)
+            _acumular_resumen(resumen, emp)
+            
+            if 'error' in emp:
+                print(f"\n❌ {emp['empresa']}: {emp['error']}")
+                continue
+            
+            print(f"\n🏢 {emp['empresa']} ({emp['database']})")
+            print(f"   📄 SII pendientes: {emp['pendientes_sii']['cantidad']} docs (${emp['pendientes_sii']['total']:,.0f})")
+            print(f"   📝 Por contabilizar: {emp['pendientes_contabilizar']['cantidad']} asientos")
+            print(f"   🏦 Por conciliar: {emp['pendientes_conciliar']['cantidad']} movimientos")
         
-        print(f"\n🏢 {emp['empresa']} ({emp['database']})")
-        print(f"   📄 SII pendientes: {emp['pendientes_sii']['cantidad']} docs (${emp['pendientes_sii']['total']:,.0f})")
-        print(f"   📝 Por contabilizar: {emp['pendientes_contabilizar']['cantidad']} asientos")
-        print(f"   🏦 Por conciliar: {emp['pendientes_conciliar']['cantidad']} movimientos")
+        salida.resumen(resumen)
     
     print()
     print("-" * 70)
     print(f"📊 TOTALES:")
-    print(f"   Documentos SII: {reporte['resumen']['total_sii']} (${reporte['resumen']['total_sii_monto']:,.0f})")
-    print(f"   Asientos borrador: {reporte['resumen']['total_contabilizar']}")
-    print(f"   Movimientos banco: {reporte['resumen']['total_conciliar']}")
-    
-    # Guardar JSON
-    if output_file is None:
-        output_dir = os.path.join(os.path.dirname(__file__), '..', 'temp')
-        os.makedirs(output_dir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = os.path.join(output_dir, f'pendientes_factorit_{timestamp}.json')
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(reporte, f, cls=JSONEncoder, ensure_ascii=False, indent=2)
+    print(f"   Documentos SII: {resumen['total_sii']} (${resumen['total_sii_monto']:,.0f})")
+    print(f"   Asientos borrador: {resumen['total_contabilizar']}")
+    print(f"   Movimientos banco: {resumen['total_conciliar']}")
     
     print()
     print(f"✅ JSON guardado: {output_file}")
     print("=" * 70)
     
-    return reporte
+    return {**cabecera, 'resumen': resumen, 'archivo': output_file}
 
 
 if __name__ == '__main__':
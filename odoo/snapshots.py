@@ -0,0 +1,383 @@
+"""
+Snapshots mensuales de saldos por cuenta (Odoo), en una base SQLite local.
+
+El balance a una fecha es la suma de todo account_move_line contabilizado
+hasta esa fecha: recalcularlo en cada corrida recorre toda la historia.
+Este módulo guarda, por cada mes cerrado, el debe y haber acumulados de
+cada cuenta al último día del mes. El balance a cualquier fecha se arma
+como:
+
+    snapshot del último mes cerrado <= fecha
+    + líneas con fecha posterior al snapshot (consulta delta)
+
+Así el costo pasa de O(toda la historia) a O(líneas recientes). Un
+snapshot nuevo se construye a partir del anterior más las líneas del
+intervalo, no desde cero.
+
+Validez: un snapshot se descarta (y se reconstruye) si algún asiento
+cambió después de tomarlo (write_date posterior) y:
+    - hoy tiene fecha dentro del período cubierto, o
+    - sus líneas se sumaron en el snapshot (cada snapshot guarda los ids
+      de esos asientos). Así se detecta un asiento que se pasó a borrador,
+      se cambió de fecha a un mes abierto y se volvió a contabilizar: sin
+      esto quedaría en el snapshot y además en la consulta delta.
+Se usa el write_date del asiento (account_move) y no el de las líneas:
+para cambiar el debe/haber de un asiento contabilizado hay que pasarlo a
+borrador, lo que actualiza el asiento, mientras que las líneas cambian su
+write_date también al conciliar, sin afectar saldos. Un asiento eliminado
+de un mes cerrado no se detecta: en ese caso usar invalidar(). Los
+snapshots tomados antes de guardar los ids tampoco detectan el cambio de
+fecha: invalidar() una vez los reconstruye.
+
+Los montos se guardan como texto (NUMERIC exacto), así el balance por
+snapshot es idéntico al de la consulta completa.
+
+Configuración (.env, todas opcionales):
+    ODOO_SNAPSHOTS=true                # false = siempre consulta completa
+    ODOO_CACHE_DIR=temp                # Directorio de la base (default <repo>/temp)
+    ODOO_SNAPSHOT_MESES_ABIERTOS=3     # Meses recientes que no se congelan
+
+Uso:
+    from odoo.snapshots import obtener_saldos
+    filas = obtener_saldos(cursor, 'FactorIT', '2025-11-30')
+    # [(codigo, nombre, tipo, debe, haber, saldo), ...] ordenado por código
+"""
+
+import calendar
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.entorno import env_bool, env_int
+
+from .conexion import DB_CONFIG
+
+CACHE_DIR = Path(os.getenv('ODOO_CACHE_DIR') or Path(__file__).parent.parent / 'temp')
+SNAPSHOTS_HABILITADOS = env_bool('ODOO_SNAPSHOTS', True)
+MESES_ABIERTOS = env_int('ODOO_SNAPSHOT_MESES_ABIERTOS', 3)
+
+# account_id -> [debe, haber]
+Saldos = Dict[int, List[Decimal]]
+
+# Sumas por cuenta de las líneas contabilizadas en (desde, hasta]
+QUERY_SUMAS = """
+SELECT aml.account_id, SUM(aml.debit), SUM(aml.credit)
+FROM account_move_line aml
+JOIN account_move am ON aml.move_id = am.id
+WHERE am.state = 'posted'
+  AND aml.date > %s
+  AND aml.date <= %s
+GROUP BY aml.account_id
+"""
+
+# Asientos (ids) cuyas líneas se suman en (desde, hasta]: se guardan con el snapshot
+QUERY_ASIENTOS = """
+SELECT DISTINCT aml.move_id
+FROM account_move_line aml
+JOIN account_move am ON aml.move_id = am.id
+WHERE am.state = 'posted'
+  AND aml.date > %s
+  AND aml.date <= %s
+"""
+
+# ¿Algún asiento del período cubierto cambió después de tomar el snapshot?
+QUERY_CAMBIOS = """
+SELECT 1
+FROM account_move am
+WHERE am.date <= %s
+  AND am.write_date > %s
+LIMIT 1
+"""
+
+# Asientos hoy fuera del período cubierto que cambiaron después del snapshot
+# (pueden haber estado dentro: se cruzan con los ids guardados)
+QUERY_CAMBIADOS_FUERA = """
+SELECT am.id
+FROM account_move am
+WHERE am.date > %s
+  AND am.write_date > %s
+"""
+
+QUERY_CUENTAS = """
+SELECT id, code, name, user_type_id
+FROM account_account
+WHERE id = ANY(%s)
+ORDER BY code
+"""
+
+# Fecha anterior a cualquier asiento, para las sumas "desde el inicio"
+INICIO = date(1900, 1, 1)
+
+
+def fin_de_mes(periodo: str) -> date:
+    """Último día del período YYYYMM."""
+    año, mes = int(periodo[:4]), int(periodo[4:6])
+    return date(año, mes, calendar.monthrange(año, mes)[1])
+
+
+def ultimo_periodo_cerrado(fecha_hasta: date, meses_abiertos: int = None,
+                           hoy: date = None) -> Optional[str]:
+    """
+    Último mes cerrado (YYYYMM) que termina en o antes de `fecha_hasta`.
+
+    Se consideran abiertos el mes actual y los `meses_abiertos - 1`
+    anteriores (igual criterio que skualo.cache.periodo_cerrado).
+    """
+    if meses_abiertos is None:
+        meses_abiertos = MESES_ABIERTOS
+    hoy = hoy or date.today()
+    # Último mes cerrado según hoy
+    indice = hoy.year * 12 + (hoy.month - 1) - meses_abiertos
+    # Último mes completo hasta fecha_hasta
+    indice_fecha = fecha_hasta.year * 12 + (fecha_hasta.month - 1)
+    if fecha_hasta != fin_de_mes(f'{fecha_hasta.year}{fecha_hasta.month:02d}'):
+        indice_fecha -= 1
+    indice = min(indice, indice_fecha)
+    if indice < 0:
+        return None
+    return f'{indice // 12}{indice % 12 + 1:02d}'
+
+
+class SnapshotsCache:
+    """
+    Snapshots (base, periodo) -> saldos acumulados por cuenta.
+
+    Abre una conexión SQLite por operación, de modo que puede usarse
+    desde varios hilos (una empresa por hilo).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    base TEXT NOT NULL,
+                    periodo TEXT NOT NULL,
+                    tomado_el TEXT NOT NULL,
+                    PRIMARY KEY (base, periodo)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS saldos (
+                    base TEXT NOT NULL,
+                    periodo TEXT NOT NULL,
+                    account_id INTEGER NOT NULL,
+                    debe TEXT NOT NULL,
+                    haber TEXT NOT NULL,
+                    PRIMARY KEY (base, periodo, account_id)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS asientos (
+                    base TEXT NOT NULL,
+                    periodo TEXT NOT NULL,
+                    move_id INTEGER NOT NULL,
+                    PRIMARY KEY (base, periodo, move_id)
+                )
+            ''')
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        """Conexión de una operación: commit al salir (rollback si falla) y cierre."""
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ultimo(self, base: str, hasta_periodo: str) -> Optional[Tuple[str, str]]:
+        """(periodo, tomado_el) del snapshot más reciente <= hasta_periodo, o None."""
+        with self._conectar() as conn:
+            return conn.execute(
+                'SELECT periodo, tomado_el FROM snapshots WHERE base = ? AND periodo <= ? '
+                'ORDER BY periodo DESC LIMIT 1',
+                (base, hasta_periodo)
+            ).fetchone()
+
+    def saldos(self, base: str, periodo: str) -> Saldos:
+        with self._conectar() as conn:
+            filas = conn.execute(
+                'SELECT account_id, debe, haber FROM saldos WHERE base = ? AND periodo = ?',
+                (base, periodo)
+            ).fetchall()
+        return {cuenta: [Decimal(debe), Decimal(haber)] for cuenta, debe, haber in filas}
+
+    def guardar(self, base: str, periodo: str, tomado_el: str, saldos: Saldos,
+                asientos: Iterable[int] = ()):
+        """Guarda el snapshot y los ids de los asientos sumados desde el snapshot anterior."""
+        filas = [(base, periodo, cuenta, str(debe), str(haber)) for cuenta, (debe, haber) in saldos.items()]
+        with self._lock, self._conectar() as conn:
+            conn.execute('DELETE FROM saldos WHERE base = ? AND periodo = ?', (base, periodo))
+            conn.execute('DELETE FROM asientos WHERE base = ? AND periodo = ?', (base, periodo))
+            conn.executemany('INSERT INTO saldos VALUES (?, ?, ?, ?, ?)', filas)
+            conn.executemany('INSERT OR IGNORE INTO asientos VALUES (?, ?, ?)',
+                             [(base, periodo, move_id) for move_id in asientos])
+            conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)', (base, periodo, tomado_el))
+
+    def incluye_asientos(self, base: str, hasta_periodo: str, move_ids: Iterable[int]) -> bool:
+        """True si alguno de los asientos se sumó en un snapshot <= hasta_periodo."""
+        move_ids = list(move_ids)
+        with self._conectar() as conn:
+            for i in range(0, len(move_ids), 500):
+                lote = move_ids[i:i + 500]
+                fila = conn.execute(
+                    'SELECT 1 FROM asientos WHERE base = ? AND periodo <= ? '
+                    f'AND move_id IN ({", ".join("?" * len(lote))}) LIMIT 1',
+                    (base, hasta_periodo, *lote)
+                ).fetchone()
+                if fila:
+                    return True
+        return False
+
+    def invalidar(self, base: str = None, desde_periodo: str = None) -> int:
+        """
+        Elimina snapshots (de una base, desde un período, o todos).
+        Retorna cuántos borró.
+        """
+        condiciones, params = [], []
+        if base:
+            condiciones.append('base = ?')
+            params.append(base)
+        if desde_periodo:
+            condiciones.append('periodo >= ?')
+            params.append(desde_periodo)
+        where = f' WHERE {" AND ".join(condiciones)}' if condiciones else ''
+        with self._lock, self._conectar() as conn:
+            cur = conn.execute(f'DELETE FROM snapshots{where}', params)
+            conn.execute(f'DELETE FROM saldos{where}', params)
+            conn.execute(f'DELETE FROM asientos{where}', params)
+            return cur.rowcount
+
+
+_cache: Optional[SnapshotsCache] = None
+
+
+def get_cache_snapshots() -> Optional[SnapshotsCache]:
+    """Almacén compartido de snapshots, o None si ODOO_SNAPSHOTS=false."""
+    global _cache
+    if not SNAPSHOTS_HABILITADOS:
+        return None
+    if _cache is None:
+        _cache = SnapshotsCache(CACHE_DIR / 'odoo_snapshots.db')
+    return _cache
+
+
+def clave_base(db_name: str) -> str:
+    """Identidad de la base de datos (servidor + nombre)."""
+    return f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{db_name}"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CÁLCULO DE SALDOS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _sumar(cursor, saldos: Saldos, desde: date, hasta: date) -> Saldos:
+    """Agrega a `saldos` las sumas de las líneas contabilizadas en (desde, hasta]."""
+    cursor.execute(QUERY_SUMAS, (desde, hasta))
+    for cuenta, debe, haber in cursor.fetchall():
+        acumulado = saldos.setdefault(cuenta, [Decimal(0), Decimal(0)])
+        acumulado[0] += debe or 0
+        acumulado[1] += haber or 0
+    return saldos
+
+
+def _asientos(cursor, desde: date, hasta: date) -> List[int]:
+    """Ids de los asientos contabilizados con líneas en (desde, hasta]."""
+    cursor.execute(QUERY_ASIENTOS, (desde, hasta))
+    return [fila[0] for fila in cursor.fetchall()]
+
+
+def _hay_cambios(cursor, cache: SnapshotsCache, base: str, periodo: str,
+                 hasta: date, tomado_el: str) -> bool:
+    """¿Cambió después de `tomado_el` algún asiento que está (o estaba) en el snapshot?"""
+    cursor.execute(QUERY_CAMBIOS, (hasta, tomado_el))
+    if cursor.fetchone() is not None:
+        return True
+    # Asientos cambiados de fecha fuera del período: ¿se sumaron en el snapshot?
+    cursor.execute(QUERY_CAMBIADOS_FUERA, (hasta, tomado_el))
+    return cache.incluye_asientos(base, periodo, (fila[0] for fila in cursor.fetchall()))
+
+
+def _ahora_servidor(cursor) -> str:
+    """Hora UTC del servidor (misma referencia que write_date de Odoo)."""
+    cursor.execute("SELECT now() AT TIME ZONE 'UTC'")
+    return cursor.fetchone()[0].isoformat()
+
+
+def _snapshot(cursor, cache: SnapshotsCache, base: str, periodo: str) -> Tuple[date, Saldos]:
+    """
+    Saldos acumulados al cierre de `periodo`, desde el almacén local.
+
+    Si no hay snapshot vigente para el período, se construye desde el
+    snapshot vigente anterior (o desde el inicio) y se guarda.
+    """
+    fin = fin_de_mes(periodo)
+    base_saldos: Saldos = {}
+    desde = INICIO
+
+    previo = cache.ultimo(base, periodo)
+    if previo is not None:
+        periodo_previo, tomado_el = previo
+        fin_previo = fin_de_mes(periodo_previo)
+        if _hay_cambios(cursor, cache, base, periodo_previo, fin_previo, tomado_el):
+            # El período cubierto cambió: este snapshot y los siguientes ya no sirven
+            cache.invalidar(base, desde_periodo=periodo_previo)
+            return _snapshot(cursor, cache, base, periodo)
+        base_saldos = cache.saldos(base, periodo_previo)
+        if periodo_previo == periodo:
+            return fin, base_saldos
+        desde = fin_previo
+
+    # La hora se toma antes de sumar: lo que cambie durante la consulta
+    # queda con write_date posterior y se detecta en la próxima corrida
+    tomado_el = _ahora_servidor(cursor)
+    saldos = _sumar(cursor, base_saldos, desde, fin)
+    cache.guardar(base, periodo, tomado_el, saldos, _asientos(cursor, desde, fin))
+    return fin, saldos
+
+
+def obtener_saldos(cursor, db_name: str, fecha_hasta) -> Optional[List[tuple]]:
+    """
+    Saldos por cuenta a `fecha_hasta` usando snapshots mensuales + delta.
+
+    Returns:
+        Filas (codigo, nombre, tipo, debe, haber, saldo) ordenadas por
+        código, con la misma forma y montos que la consulta completa del
+        balance (solo cuentas con debe o haber distinto de 0). None si los
+        snapshots están desactivados.
+    """
+    cache = get_cache_snapshots()
+    if cache is None:
+        return None
+
+    if isinstance(fecha_hasta, str):
+        fecha_hasta = datetime.strptime(fecha_hasta[:10], '%Y-%m-%d').date()
+
+    periodo = ultimo_periodo_cerrado(fecha_hasta)
+    if periodo is None:
+        saldos = _sumar(cursor, {}, INICIO, fecha_hasta)
+    else:
+        fin, saldos = _snapshot(cursor, cache, clave_base(db_name), periodo)
+        saldos = {cuenta: list(montos) for cuenta, montos in saldos.items()}
+        if fecha_hasta > fin:
+            saldos = _sumar(cursor, saldos, fin, fecha_hasta)
+
+    saldos = {cuenta: montos for cuenta, montos in saldos.items() if montos[0] != 0 or montos[1] != 0}
+    if not saldos:
+        return []
+
+    cursor.execute(QUERY_CUENTAS, (list(saldos),))
+    filas = []
+    for cuenta, codigo, nombre, tipo in cursor.fetchall():
+        debe, haber = saldos[cuenta]
+        filas.append((codigo, nombre, tipo, debe, haber, debe - haber))
+    return filas
@@ -17,7 +17,6 @@ Variables de entorno requeridas en .env:
     PASSWORD=password_db
 """
 
-import os
 import sys
 from pathlib import Path
 from dotenv import load_dotenv
@@ -39,18 +38,8 @@ except ImportError:
 # CONFIGURACIÓN
 # ═══════════════════════════════════════════════════════════════════════════════
 
-# Credenciales desde .env (limpiando espacios extra)
-def get_env_clean(key, default=None):
-    """Obtiene variable de entorno y limpia espacios/tabs."""
-    val = os.getenv(key)
-    return val.strip() if val else default
-
-DB_CONFIG = {
-    'host': get_env_clean('SERVER'),
-    'port': get_env_clean('PORT', '5432'),
-    'user': get_env_clean('DB_USER'),  # Usar DB_USER para evitar conflicto con USER del sistema
-    'password': get_env_clean('PASSWORD'),
-}
+# Credenciales desde .env (SERVER, PORT, DB_USER, PASSWORD) y pool compartido
+from .conexion import DB_CONFIG, conexion
 
 # Bases de datos a probar
 DATABASES = {
@@ -122,67 +111,56 @@ def test_connection(db_name, db_info):
     print("─" * 50)
     
     try:
-        # Conectar
-        conn = psycopg2.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database=db_name,
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            connect_timeout=10
-        )
-        
-        print(f"   ✅ Conexión exitosa")
-        
-        # Obtener versión PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("SELECT version();")
-        version = cursor.fetchone()[0]
-        print(f"   📊 PostgreSQL: {version.split(',')[0]}")
-        
-        # Ejecutar query de pendientes SII
-        print(f"\n   📄 Ejecutando query de documentos pendientes SII...")
-        cursor.execute(QUERY_PENDIENTES_SII)
-        rows = cursor.fetchall()
-        
-        if rows:
-            print(f"   ✅ {len(rows)} documentos pendientes encontrados\n")
+        # Conectar (pool compartido, connect_timeout desde ODOO_CONNECT_TIMEOUT)
+        with conexion(db_name) as conn, conn.cursor() as cursor:
+            print(f"   ✅ Conexión exitosa")
             
-            # Mostrar encabezados
-            print(f"   {'Fecha':<12} {'Tipo':<8} {'Número':<12} {'Partner':<40} {'Monto':>15}")
-            print(f"   {'-'*90}")
+            # Obtener versión PostgreSQL
+            cursor.execute("SELECT version();")
+            version = cursor.fetchone()[0]
+            print(f"   📊 PostgreSQL: {version.split(',')[0]}")
             
-            # Mostrar primeros 10 registros
-            for row in rows[:10]:
-                fecha = str(row[0])[:10] if row[0] else ''
-                tipo = str(row[1] or '')[:8]
-                numero = str(row[2] or '')[:12]
-                partner = str(row[3] or '')[:40]
-                monto = row[4] or 0
-                print(f"   {fecha:<12} {tipo:<8} {numero:<12} {partner:<40} ${monto:>14,.0f}")
+            # Ejecutar query de pendientes SII
+            print(f"\n   📄 Ejecutando query de documentos pendientes SII...")
+            cursor.execute(QUERY_PENDIENTES_SII)
+            rows = cursor.fetchall()
             
-            if len(rows) > 10:
-                print(f"\n   ... y {len(rows) - 10} documentos más")
-            
-            # Resumen por tipo
-            print(f"\n   📊 Resumen por tipo de documento:")
-            cursor.execute("""
-                SELECT b.doc_code_prefix, COUNT(*), SUM(a.amount)
-                FROM mail_message_dte_document a,
-                     sii_document_class b
-                WHERE a.state = 'draft' 
-                  AND a.document_class_id = b.id
-                GROUP BY b.doc_code_prefix
-                ORDER BY COUNT(*) DESC
-            """)
-            resumen = cursor.fetchall()
-            for tipo, cantidad, total in resumen:
-                print(f"      {tipo or 'N/A'}: {cantidad} docs, ${total or 0:,.0f}")
-        else:
-            print(f"   ℹ️  No hay documentos pendientes")
-        
-        cursor.close()
-        conn.close()
+            if rows:
+                print(f"   ✅ {len(rows)} documentos pendientes encontrados\n")
+                
+                # Mostrar encabezados
+                print(f"   {'Fecha':<12} {'Tipo':<8} {'Número':<12} {'Partner':<40} {'Monto':>15}")
+                print(f"   {'-'*90}")
+                
+                # Mostrar primeros 10 registros
+                for row in rows[:10]:
+                    fecha = str(row[0])[:10] if row[0] else ''
+                    tipo = str(row[1] or '')[:8]
+                    numero = str(row[2] or '')[:12]
+                    partner = str(row[3] or '')[:40]
+                    monto = row[4] or 0
+                    print(f"   {fecha:<12} {tipo:<8} {numero:<12} {partner:<40} ${monto:>14,.0f}")
+                
+                if len(rows) > 10:
+                    print(f"\n   ... y {len(rows) - 10} documentos más")
+                
+                # Resumen por tipo
+                print(f"\n   📊 Resumen por tipo de documento:")
+                cursor.execute("""
+                    SELECT b.doc_code_prefix, COUNT(*), SUM(a.amount)
+                    FROM mail_message_dte_document a,
+                         sii_document_class b
+                    WHERE a.state = 'draft' 
+                      AND a.document_class_id = b.id
+                    GROUP BY b.doc_code_prefix
+                    ORDER BY COUNT(*) DESC
+                """)
+                resumen = cursor.fetchall()
+                for tipo, cantidad, total in resumen:
+                    print(f"      {tipo or 'N/A'}: {cantidad} docs, ${total or 0:,.0f}")
+            else:
+                print(f"   ℹ️  No hay documentos pendientes")
+
         
         return {
             'success': True,
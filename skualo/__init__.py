@@ -26,11 +26,19 @@ Uso básico:
     
     # Generar balance Excel
     archivo = ctrl.generar_balance_excel('77285542-7', '202511')
+
+Uso asíncrono (bots, webhooks; requiere httpx):
+    from skualo import AsyncSkualoControl
+    
+    async with AsyncSkualoControl() as ctrl:
+        resultado = await ctrl.reporte_completo('77285542-7')
 """
 
 from .control import SkualoControl
+from .control_async import AsyncSkualoControl
+from .trafico import ApiSkualoNoDisponible, ApiSkualoRechazo
 from .config import cargar_config, guardar_config, config_existe, listar_empresas
 
 __version__ = '1.0.0'
-__all__ = ['SkualoControl', 'cargar_config', 'guardar_config', 'config_existe', 'listar_empresas']
+__all__ = ['SkualoControl', 'AsyncSkualoControl', 'ApiSkualoNoDisponible', 'ApiSkualoRechazo', 'cargar_config', 'guardar_config', 'config_existe', 'listar_empresas']
 
@@ -0,0 +1,264 @@
+"""
+Capa HTTP compartida para la API de Skualo.
+
+Mantiene una única sesión ``requests`` con pool de conexiones keep-alive,
+de modo que las llamadas sucesivas a api.skualo.cl reutilicen la conexión
+TCP/TLS en vez de abrir una nueva por cada página o documento.
+
+Configuración (.env, todas opcionales):
+    SKUALO_POOL_CONNECTIONS=4     # Pools por host (hosts distintos cacheados)
+    SKUALO_POOL_MAXSIZE=16        # Conexiones máximas por host
+    SKUALO_POOL_BLOCK=false       # true = esperar conexión libre en vez de abrir extra
+    SKUALO_KEEP_ALIVE=true        # false = cerrar la conexión tras cada request
+    SKUALO_PAGE_WORKERS=4         # Páginas descargadas en paralelo (1 = secuencial)
+    SKUALO_CUENTA_WORKERS=4       # Cuentas bancarias consultadas en paralelo
+
+Uso:
+    from skualo.api import get_session, paginar
+    r = get_session().get(url, headers=headers, params=params, timeout=30)
+    items = paginar(api_get, rut, '/sii/dte/recibidos')
+
+paginar_async y mapear_async son las versiones asyncio (api_get es una
+corrutina), usadas por skualo.control_async.
+
+Los GET con límite de tasa y reintentos ante 429/5xx están en
+skualo.trafico (get_json).
+"""
+
+import asyncio
+import math
+import threading
+from typing import Callable, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import concurrencia
+from common.entorno import env_bool, env_int
+
+
+SESSION_CONFIG = {
+    'pool_connections': env_int('SKUALO_POOL_CONNECTIONS', 4),
+    'pool_maxsize': env_int('SKUALO_POOL_MAXSIZE', 16),
+    'pool_block': env_bool('SKUALO_POOL_BLOCK', False),
+    'keep_alive': env_bool('SKUALO_KEEP_ALIVE', True),
+}
+
+PAGE_SIZE = 100
+PAGE_WORKERS = env_int('SKUALO_PAGE_WORKERS', 4)
+CUENTA_WORKERS = env_int('SKUALO_CUENTA_WORKERS', 4)
+
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+
+def _crear_session(config: dict) -> requests.Session:
+    """Crea una sesión con adaptador de pool para http y https."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=config['pool_connections'],
+        pool_maxsize=config['pool_maxsize'],
+        pool_block=config['pool_block'],
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not config['keep_alive']:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Retorna la sesión compartida, creándola en el primer uso.
+
+    Es segura para usar desde varios hilos: el pool entrega una
+    conexión distinta a cada request concurrente (hasta pool_maxsize).
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _crear_session(SESSION_CONFIG)
+    return _session
+
+
+def configurar_session(**opciones) -> requests.Session:
+    """
+    Reconfigura el pool (pool_connections, pool_maxsize, pool_block, keep_alive).
+
+    Cierra la sesión actual y crea una nueva con la configuración indicada.
+    Útil para procesos largos (bot, cron multi-tenant) que necesitan más
+    conexiones simultáneas que el valor por defecto.
+    """
+    global _session
+    desconocidas = set(opciones) - set(SESSION_CONFIG)
+    if desconocidas:
+        raise ValueError(f"Opciones de sesión desconocidas: {', '.join(sorted(desconocidas))}")
+
+    with _lock:
+        SESSION_CONFIG.update(opciones)
+        if _session is not None:
+            _session.close()
+        _session = _crear_session(SESSION_CONFIG)
+    return _session
+
+
+def cerrar_session():
+    """Cierra la sesión compartida y libera las conexiones del pool."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONCURRENCIA Y PAGINACIÓN
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def mapear_concurrente(fn: Callable, items: Iterable, workers: int = None) -> List:
+    """common.concurrencia.mapear_concurrente con default SKUALO_PAGE_WORKERS."""
+    return concurrencia.mapear_concurrente(fn, items, PAGE_WORKERS if workers is None else workers)
+
+
+def _items_pagina(data) -> list:
+    items = data.get('items', data) if isinstance(data, dict) else data
+    return items if isinstance(items, list) else []
+
+
+def _hay_siguiente(data) -> bool:
+    return isinstance(data, dict) and bool(data.get('next'))
+
+
+def _total_registros(data) -> Optional[int]:
+    """Total de registros informado por la primera página, si viene."""
+    if not isinstance(data, dict):
+        return None
+    for key in ('totalItems', 'totalCount', 'total', 'count'):
+        valor = data.get(key)
+        if isinstance(valor, int) and valor >= 0:
+            return valor
+    # 'size' a veces es el total y a veces el largo de la página:
+    # solo es confiable si supera lo recibido en la primera página.
+    size = data.get('size')
+    if isinstance(size, int) and size > len(_items_pagina(data)):
+        return size
+    return None
+
+
+def paginar(api_get: Callable, rut: str, endpoint: str, params: dict = None,
+            workers: int = None, page_size: int = PAGE_SIZE) -> List:
+    """
+    Obtiene todos los registros paginados de un endpoint.
+
+    Pide la página 1 y, si hay más, descarga el resto en paralelo:
+    - Si la respuesta informa el total, pide de una vez las páginas 2..N.
+    - Si solo informa 'next', pide lotes de `workers` páginas y corta en
+      la primera página sin 'next'.
+
+    Los registros se unen en orden de página. Una página fallida (None)
+    detiene la paginación igual que en el recorrido secuencial.
+
+    Args:
+        api_get: Función (rut, endpoint, params) -> dict | None
+        rut: RUT de la empresa
+        endpoint: Endpoint relativo (ej: '/bancos/1102002')
+        params: Parámetros adicionales de la consulta
+        workers: Páginas simultáneas (default SKUALO_PAGE_WORKERS; 1 = secuencial)
+        page_size: Registros por página
+    """
+    base_params = params or {}
+    if workers is None:
+        workers = PAGE_WORKERS
+    workers = max(1, workers)
+
+    def obtener_pagina(page):
+        return api_get(rut, endpoint, {**base_params, 'PageSize': page_size, 'Page': page})
+
+    primera = obtener_pagina(1)
+    if not primera:
+        return []
+
+    all_items = list(_items_pagina(primera))
+    if not _hay_siguiente(primera):
+        return all_items
+
+    total = _total_registros(primera)
+    ultima = math.ceil(total / page_size) if total else None
+
+    siguiente = 2
+    while True:
+        if ultima and ultima >= siguiente:
+            hasta = ultima
+        else:
+            hasta = siguiente + workers - 1
+
+        paginas = mapear_concurrente(obtener_pagina, range(siguiente, hasta + 1), workers)
+        for data in paginas:
+            if not data:
+                return all_items
+            all_items.extend(_items_pagina(data))
+            if not _hay_siguiente(data):
+                return all_items
+
+        siguiente = hasta + 1
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# VERSIONES ASYNCIO
+# ═══════════════════════════════════════════════════════════════════════════════
+
+async def mapear_async(fn: Callable, items: Iterable) -> List:
+    """
+    Ejecuta la corrutina fn(item) para todos los items a la vez.
+
+    Los resultados se retornan en el mismo orden que los items. No limita
+    la concurrencia: el límite lo ponen los semáforos del cliente HTTP
+    (ver AsyncSkualoControl).
+    """
+    return list(await asyncio.gather(*(fn(item) for item in items)))
+
+
+async def paginar_async(api_get: Callable, rut: str, endpoint: str, params: dict = None,
+                        workers: int = None, page_size: int = PAGE_SIZE) -> List:
+    """
+    Como paginar, con api_get asíncrono.
+
+    Si la primera página informa el total, las páginas 2..N se piden todas
+    a la vez; si solo informa 'next', en lotes de `workers` páginas. Una
+    página fallida (None) detiene la paginación, igual que en paginar.
+    """
+    base_params = params or {}
+    if workers is None:
+        workers = PAGE_WORKERS
+    workers = max(1, workers)
+
+    async def obtener_pagina(page):
+        return await api_get(rut, endpoint, {**base_params, 'PageSize': page_size, 'Page': page})
+
+    primera = await obtener_pagina(1)
+    if not primera:
+        return []
+
+    all_items = list(_items_pagina(primera))
+    if not _hay_siguiente(primera):
+        return all_items
+
+    total = _total_registros(primera)
+    ultima = math.ceil(total / page_size) if total else None
+
+    siguiente = 2
+    while True:
+        if ultima and ultima >= siguiente:
+            hasta = ultima
+        else:
+            hasta = siguiente + workers - 1
+
+        for data in await mapear_async(obtener_pagina, range(siguiente, hasta + 1)):
+            if not data:
+                return all_items
+            all_items.extend(_items_pagina(data))
+            if not _hay_siguiente(data):
+                return all_items
+
+        siguiente = hasta + 1
@@ -0,0 +1,65 @@
+"""
+Detección de cuentas bancarias en el balance tributario.
+
+Una cuenta se considera bancaria si:
+    1. Su código empieza con 1102 (bancos) o 1103 (moneda extranjera), o
+    2. Es cuenta de activo (código 1...) y su nombre contiene una palabra
+       clave de banco (PALABRAS_BANCO).
+
+Las palabras clave se compilan en una sola expresión regular, así cada
+nombre se revisa en una pasada en vez de probar palabra por palabra.
+
+Uso:
+    from skualo.bancos import detectar_cuentas_bancarias
+    cuentas_banco = detectar_cuentas_bancarias(balance)
+"""
+
+import re
+from typing import Iterable, List
+
+# Palabras clave para detectar cuentas bancarias
+PALABRAS_BANCO = [
+    'banco', 'santander', 'chile', 'estado', 'bci', 'scotiabank',
+    'itau', 'itaú', 'security', 'bice', 'falabella', 'ripley',
+    'consorcio', 'internacional', 'corpbanca', 'tapp', 'tenpo',
+    'mercado pago', 'cuenta corriente', 'cta cte', 'cta. cte',
+    'coopeuch', 'bancoestado', 'bco.', 'bco '
+]
+
+# Prefijos de código que siempre son bancos (1102 estándar, 1103 moneda extranjera)
+PREFIJOS_BANCO = ('1102', '1103')
+
+
+class DetectorBancos:
+    """Reglas de detección compiladas (prefijos + regex de palabras clave)."""
+
+    def __init__(self, palabras: Iterable[str] = PALABRAS_BANCO,
+                 prefijos: Iterable[str] = PREFIJOS_BANCO):
+        self.prefijos = tuple(prefijos)
+        # Las palabras más largas primero, para que la alternancia no se corte antes
+        palabras = sorted(set(palabras), key=len, reverse=True)
+        self._patron = re.compile('|'.join(re.escape(p) for p in palabras))
+
+    def es_banco(self, codigo: str, nombre: str) -> bool:
+        """True si la cuenta (código, nombre) es bancaria."""
+        codigo = codigo or ''
+        if codigo.startswith(self.prefijos):
+            return True
+        return codigo.startswith('1') and self._patron.search((nombre or '').lower()) is not None
+
+    def detectar(self, balance: List[dict]) -> List[dict]:
+        """Cuentas bancarias de un balance tributario, en el orden del balance."""
+        return [c for c in balance or [] if self.es_banco(c.get('idCuenta', ''), c.get('cuenta', ''))]
+
+
+DETECTOR = DetectorBancos()
+
+
+def es_cuenta_bancaria(codigo: str, nombre: str) -> bool:
+    """True si la cuenta es bancaria (reglas por defecto)."""
+    return DETECTOR.es_banco(codigo, nombre)
+
+
+def detectar_cuentas_bancarias(balance: List[dict]) -> List[dict]:
+    """Cuentas bancarias del balance (reglas por defecto)."""
+    return DETECTOR.detectar(balance)
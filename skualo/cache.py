@@ -0,0 +1,487 @@
+"""
+Caché local persistente (SQLite) para datos de Skualo que no cambian.
+
+Un DTE que ya aparece contabilizado sigue contabilizado: no tiene sentido
+volver a consultarlo en cada ejecución. Este módulo guarda en disco las
+claves ya confirmadas para que las siguientes corridas solo verifiquen
+los DTEs nuevos o que siguen pendientes.
+
+Configuración (.env, todas opcionales):
+    SKUALO_CACHE=true             # false = desactivar la caché
+    SKUALO_CACHE_DIR=temp         # Directorio de la base (default <repo>/temp)
+    SKUALO_BALANCE_MESES_ABIERTOS=3  # Meses recientes que se consideran abiertos
+    SKUALO_BALANCE_TTL=3600       # Segundos de validez del balance de un período abierto
+
+Uso:
+    from skualo.cache import get_cache_contabilizados
+    cache = get_cache_contabilizados()
+    if cache:
+        confirmados = cache.filtrar_confirmados(rut, claves)
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from common.entorno import env_bool, env_int
+
+from .documentos import normalizar_folio, normalizar_rut
+
+CACHE_DIR = Path(os.getenv('SKUALO_CACHE_DIR') or Path(__file__).parent.parent / 'temp')
+CACHE_HABILITADA = env_bool('SKUALO_CACHE', True)
+BALANCE_MESES_ABIERTOS = env_int('SKUALO_BALANCE_MESES_ABIERTOS', 3)
+BALANCE_TTL = env_int('SKUALO_BALANCE_TTL', 3600)
+
+Clave = Tuple[str, object, str]
+
+
+def _normalizar_clave(clave: Clave) -> Tuple[str, str, str]:
+    tipo, folio, rut_emisor = clave
+    return str(tipo or '').upper(), normalizar_folio(folio), normalizar_rut(rut_emisor)
+
+
+class CacheLocal(ABC):
+    """
+    Base SQLite compartida por las cachés de Skualo.
+
+    Abre una conexión por operación, de modo que puede usarse desde varios
+    hilos sin compartir cursores. Las subclases definen _crear_tablas.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            self._crear_tablas(conn)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        """Conexión de una operación: commit al salir (rollback si falla) y cierre."""
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @abstractmethod
+    def _crear_tablas(self, conn: sqlite3.Connection):
+        """Crea las tablas de la caché si no existen."""
+
+
+class ContabilizadosCache(CacheLocal):
+    """Claves (rut, tipo_interno, folio, rut_emisor) ya confirmadas como contabilizadas."""
+
+    def _crear_tablas(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS contabilizados (
+                rut TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                folio TEXT NOT NULL,
+                rut_emisor TEXT NOT NULL,
+                confirmado_el TEXT NOT NULL,
+                PRIMARY KEY (rut, tipo, folio, rut_emisor)
+            )
+        ''')
+
+    def filtrar_confirmados(self, rut: str, claves: Iterable[Clave]) -> List[bool]:
+        """Indica, para cada clave, si ya estaba confirmada en la caché."""
+        claves = [_normalizar_clave(c) for c in claves]
+        if not claves:
+            return []
+        with self._conectar() as conn:
+            filas = conn.execute(
+                'SELECT tipo, folio, rut_emisor FROM contabilizados WHERE rut = ?', (rut,)
+            ).fetchall()
+        confirmados: Set[Tuple[str, str, str]] = set(filas)
+        return [c in confirmados for c in claves]
+
+    def marcar(self, rut: str, claves: Iterable[Clave]):
+        """Registra claves recién confirmadas como contabilizadas."""
+        ahora = datetime.now().isoformat(timespec='seconds')
+        filas = [(rut, *_normalizar_clave(c), ahora) for c in claves]
+        if not filas:
+            return
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO contabilizados VALUES (?, ?, ?, ?, ?)', filas
+            )
+
+    def limpiar(self, rut: str = None) -> int:
+        """Elimina las claves de una empresa (o todas). Retorna cuántas borró."""
+        with self._lock, self._conectar() as conn:
+            if rut:
+                cur = conn.execute('DELETE FROM contabilizados WHERE rut = ?', (rut,))
+            else:
+                cur = conn.execute('DELETE FROM contabilizados')
+            return cur.rowcount
+
+
+_cache_contabilizados: Optional[ContabilizadosCache] = None
+
+
+def get_cache_contabilizados() -> Optional[ContabilizadosCache]:
+    """Caché compartida de contabilizados, o None si SKUALO_CACHE=false."""
+    global _cache_contabilizados
+    if not CACHE_HABILITADA:
+        return None
+    if _cache_contabilizados is None:
+        _cache_contabilizados = ContabilizadosCache(CACHE_DIR / 'skualo_cache.db')
+    return _cache_contabilizados
+
+
+class DtesRecibidosCache(CacheLocal):
+    """
+    DTEs recibidos del SII ya descargados, por empresa.
+
+    Guarda cada DTE completo (JSON) y permite conocer la marca de agua
+    (mayor creadoEl almacenado) para sincronizar solo lo nuevo, y cuándo
+    fue la última descarga completa (ultima_completa) para reconciliar.
+    """
+
+    def _crear_tablas(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS dtes_recibidos (
+                rut TEXT NOT NULL,
+                clave TEXT NOT NULL,
+                creado_el TEXT NOT NULL,
+                dte TEXT NOT NULL,
+                PRIMARY KEY (rut, clave)
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_dtes_recibidos_creado
+            ON dtes_recibidos (rut, creado_el)
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS dtes_recibidos_completa (
+                rut TEXT PRIMARY KEY,
+                completa_el TEXT NOT NULL
+            )
+        ''')
+
+    @staticmethod
+    def clave_dte(dte: dict) -> str:
+        """Identidad del DTE: tipo + folio + RUT emisor."""
+        return '|'.join((
+            str(dte.get('idTipoDocumento') or ''),
+            normalizar_folio(dte.get('folio')),
+            normalizar_rut(dte.get('rutEmisor')),
+        ))
+
+    def marca_de_agua(self, rut: str) -> Optional[str]:
+        """Mayor creadoEl almacenado para la empresa (None si no hay nada)."""
+        with self._conectar() as conn:
+            fila = conn.execute(
+                'SELECT MAX(creado_el) FROM dtes_recibidos WHERE rut = ?', (rut,)
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def ultima_completa(self, rut: str) -> Optional[str]:
+        """Fecha ISO de la última descarga completa (reemplazar) de la empresa."""
+        with self._conectar() as conn:
+            fila = conn.execute(
+                'SELECT completa_el FROM dtes_recibidos_completa WHERE rut = ?', (rut,)
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def _filas(self, rut: str, dtes: Iterable[dict]) -> List[tuple]:
+        return [
+            (rut, self.clave_dte(d), str(d.get('creadoEl') or ''), json.dumps(d, ensure_ascii=False))
+            for d in dtes
+        ]
+
+    def guardar(self, rut: str, dtes: Iterable[dict]):
+        """Inserta o actualiza DTEs (el más reciente reemplaza al guardado)."""
+        filas = self._filas(rut, dtes)
+        if not filas:
+            return
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO dtes_recibidos VALUES (?, ?, ?, ?)', filas
+            )
+
+    def reemplazar(self, rut: str, dtes: Iterable[dict]) -> int:
+        """
+        Reemplaza el historial de la empresa por una descarga completa.
+
+        Los DTEs guardados que no vienen en `dtes` (eliminados en Skualo)
+        se borran. Registra la fecha como última descarga completa.
+        Retorna cuántos DTEs guardados desaparecieron.
+        """
+        filas = self._filas(rut, dtes)
+        with self._lock, self._conectar() as conn:
+            claves = {clave for _, clave, _, _ in filas}
+            guardadas = {f[0] for f in conn.execute(
+                'SELECT clave FROM dtes_recibidos WHERE rut = ?', (rut,)
+            )}
+            conn.execute('DELETE FROM dtes_recibidos WHERE rut = ?', (rut,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO dtes_recibidos VALUES (?, ?, ?, ?)', filas
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO dtes_recibidos_completa VALUES (?, ?)',
+                (rut, datetime.now().isoformat())
+            )
+        return len(guardadas - claves)
+
+    def obtener(self, rut: str) -> List[dict]:
+        """Todos los DTEs almacenados de la empresa, del más nuevo al más antiguo."""
+        with self._conectar() as conn:
+            filas = conn.execute(
+                'SELECT dte FROM dtes_recibidos WHERE rut = ? ORDER BY creado_el DESC', (rut,)
+            ).fetchall()
+        return [json.loads(f[0]) for f in filas]
+
+    def limpiar(self, rut: str = None) -> int:
+        """
+        Elimina los DTEs de una empresa (o todos). Retorna cuántos borró.
+
+        La sincronización incremental solo relee desde la marca de agua (o la
+        ventana de relectura): un DTE con creadoEl retroactivo anterior a ese
+        corte, o uno eliminado en Skualo, no se ve hasta la próxima descarga
+        completa (cada SKUALO_DTE_RECONCILIAR_DIAS, ver skualo.sincronizacion).
+        Para forzarla antes, limpiar la empresa.
+        """
+        with self._lock, self._conectar() as conn:
+            if rut:
+                cur = conn.execute('DELETE FROM dtes_recibidos WHERE rut = ?', (rut,))
+                conn.execute('DELETE FROM dtes_recibidos_completa WHERE rut = ?', (rut,))
+            else:
+                cur = conn.execute('DELETE FROM dtes_recibidos')
+                conn.execute('DELETE FROM dtes_recibidos_completa')
+            return cur.rowcount
+
+
+_cache_dtes: Optional[DtesRecibidosCache] = None
+
+
+def get_cache_dtes() -> Optional[DtesRecibidosCache]:
+    """Caché compartida de DTEs recibidos, o None si SKUALO_CACHE=false."""
+    global _cache_dtes
+    if not CACHE_HABILITADA:
+        return None
+    if _cache_dtes is None:
+        _cache_dtes = DtesRecibidosCache(CACHE_DIR / 'skualo_cache.db')
+    return _cache_dtes
+
+
+class MovimientosBancoCache(CacheLocal):
+    """
+    Movimientos bancarios ya descargados, por empresa y cuenta.
+
+    La clave es el GUID `id` que entrega /bancos/{idCuenta}; la marca de agua
+    es la mayor `fecha` almacenada de la cuenta.
+    """
+
+    def _crear_tablas(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS movimientos_banco (
+                rut TEXT NOT NULL,
+                cuenta TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fecha TEXT NOT NULL,
+                conciliado INTEGER NOT NULL,
+                movimiento TEXT NOT NULL,
+                PRIMARY KEY (rut, cuenta, id)
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_movimientos_banco_conciliado
+            ON movimientos_banco (rut, cuenta, conciliado)
+        ''')
+
+    def marca_de_agua(self, rut: str, cuenta: str) -> Optional[str]:
+        """Mayor fecha almacenada de la cuenta (None si no hay nada)."""
+        with self._conectar() as conn:
+            fila = conn.execute(
+                'SELECT MAX(fecha) FROM movimientos_banco WHERE rut = ? AND cuenta = ?',
+                (rut, str(cuenta))
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def guardar(self, rut: str, cuenta: str, movimientos: Iterable[dict]):
+        """Inserta o actualiza movimientos (los que no traen id se ignoran)."""
+        filas = [
+            (rut, str(cuenta), str(m['id']), str(m.get('fecha') or ''),
+             1 if m.get('conciliado', True) else 0, json.dumps(m, ensure_ascii=False))
+            for m in movimientos if m.get('id')
+        ]
+        if not filas:
+            return
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO movimientos_banco VALUES (?, ?, ?, ?, ?, ?)', filas
+            )
+
+    def sin_conciliar(self, rut: str, cuenta: str) -> List[dict]:
+        """Movimientos almacenados que seguían sin conciliar."""
+        with self._conectar() as conn:
+            filas = conn.execute(
+                'SELECT movimiento FROM movimientos_banco '
+                'WHERE rut = ? AND cuenta = ? AND conciliado = 0',
+                (rut, str(cuenta))
+            ).fetchall()
+        return [json.loads(f[0]) for f in filas]
+
+    def eliminar(self, rut: str, cuenta: str, ids: Iterable) -> int:
+        """Elimina movimientos por id (ya no existen en Skualo). Retorna cuántos borró."""
+        filas = [(rut, str(cuenta), str(id_)) for id_ in ids]
+        if not filas:
+            return 0
+        with self._lock, self._conectar() as conn:
+            cur = conn.executemany(
+                'DELETE FROM movimientos_banco WHERE rut = ? AND cuenta = ? AND id = ?', filas
+            )
+            return cur.rowcount
+
+    def obtener(self, rut: str, cuenta: str) -> List[dict]:
+        """Todos los movimientos almacenados de la cuenta, del más nuevo al más antiguo."""
+        with self._conectar() as conn:
+            filas = conn.execute(
+                'SELECT movimiento FROM movimientos_banco WHERE rut = ? AND cuenta = ? '
+                'ORDER BY fecha DESC',
+                (rut, str(cuenta))
+            ).fetchall()
+        return [json.loads(f[0]) for f in filas]
+
+    def limpiar(self, rut: str = None) -> int:
+        """Elimina los movimientos de una empresa (o todos). Retorna cuántos borró."""
+        with self._lock, self._conectar() as conn:
+            if rut:
+                cur = conn.execute('DELETE FROM movimientos_banco WHERE rut = ?', (rut,))
+            else:
+                cur = conn.execute('DELETE FROM movimientos_banco')
+            return cur.rowcount
+
+
+_cache_movimientos: Optional[MovimientosBancoCache] = None
+
+
+def get_cache_movimientos() -> Optional[MovimientosBancoCache]:
+    """Caché compartida de movimientos bancarios, o None si SKUALO_CACHE=false."""
+    global _cache_movimientos
+    if not CACHE_HABILITADA:
+        return None
+    if _cache_movimientos is None:
+        _cache_movimientos = MovimientosBancoCache(CACHE_DIR / 'skualo_cache.db')
+    return _cache_movimientos
+
+
+def periodo_cerrado(periodo: str, meses_abiertos: int = None, hoy: datetime = None) -> bool:
+    """
+    Indica si un período YYYYMM se considera cerrado (ya no cambia).
+
+    Se consideran abiertos el mes actual y los `meses_abiertos - 1` anteriores
+    (ajustes y contabilización atrasada); todo lo anterior es cerrado.
+    """
+    if meses_abiertos is None:
+        meses_abiertos = BALANCE_MESES_ABIERTOS
+    hoy = hoy or datetime.now()
+    try:
+        año, mes = int(periodo[:4]), int(periodo[4:6])
+    except (TypeError, ValueError):
+        return False
+    meses_atras = (hoy.year - año) * 12 + (hoy.month - mes)
+    return meses_atras >= meses_abiertos
+
+
+class BalancesCache(CacheLocal):
+    """
+    Respuestas de /contabilidad/reportes/balancetributario/{periodo}.
+
+    Direccionada por contenido: cada respuesta se guarda una sola vez por
+    su hash SHA-256 (dos períodos o empresas con el mismo balance comparten
+    el blob) y un índice (rut, periodo) -> hash registra cuándo se obtuvo.
+    Los balances obtenidos con el período ya cerrado no expiran; los
+    obtenidos con el período abierto vencen tras `ttl` segundos, aunque el
+    período se haya cerrado después (pueden faltarles los ajustes de cierre).
+    """
+
+    def _crear_tablas(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                contenido TEXT NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS balances (
+                rut TEXT NOT NULL,
+                periodo TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                obtenido_el REAL NOT NULL,
+                PRIMARY KEY (rut, periodo)
+            )
+        ''')
+
+    def obtener(self, rut: str, periodo: str, ttl: int = None):
+        """Balance cacheado, o None si no existe o (período abierto) venció."""
+        if ttl is None:
+            ttl = BALANCE_TTL
+        with self._conectar() as conn:
+            fila = conn.execute(
+                'SELECT b.contenido, i.obtenido_el FROM balances i '
+                'JOIN blobs b ON b.hash = i.hash WHERE i.rut = ? AND i.periodo = ?',
+                (rut, str(periodo))
+            ).fetchone()
+        if not fila:
+            return None
+        contenido, obtenido_el = fila
+        cerrado_al_obtener = periodo_cerrado(str(periodo), hoy=datetime.fromtimestamp(obtenido_el))
+        if not cerrado_al_obtener and time.time() - obtenido_el > ttl:
+            return None
+        return json.loads(contenido)
+
+    def guardar(self, rut: str, periodo: str, balance) -> str:
+        """Guarda el balance y retorna su hash de contenido."""
+        contenido = json.dumps(balance, ensure_ascii=False, sort_keys=True)
+        hash_ = hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+        with self._lock, self._conectar() as conn:
+            conn.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?)', (hash_, contenido))
+            conn.execute(
+                'INSERT OR REPLACE INTO balances VALUES (?, ?, ?, ?)',
+                (rut, str(periodo), hash_, time.time())
+            )
+        return hash_
+
+    def invalidar(self, rut: str = None, periodo: str = None) -> int:
+        """
+        Elimina balances cacheados (de una empresa, de un período, o todos).
+        Retorna cuántos borró. Los blobs sin referencias se eliminan también.
+        """
+        condiciones, params = [], []
+        if rut:
+            condiciones.append('rut = ?')
+            params.append(rut)
+        if periodo:
+            condiciones.append('periodo = ?')
+            params.append(str(periodo))
+        where = f' WHERE {" AND ".join(condiciones)}' if condiciones else ''
+        with self._lock, self._conectar() as conn:
+            cur = conn.execute(f'DELETE FROM balances{where}', params)
+            conn.execute('DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM balances)')
+            return cur.rowcount
+
+
+_cache_balances: Optional[BalancesCache] = None
+
+
+def get_cache_balances() -> Optional[BalancesCache]:
+    """Caché compartida de balances tributarios, o None si SKUALO_CACHE=false."""
+    global _cache_balances
+    if not CACHE_HABILITADA:
+        return None
+    if _cache_balances is None:
+        _cache_balances = BalancesCache(CACHE_DIR / 'skualo_cache.db')
+    return _cache_balances
@@ -25,11 +25,20 @@ Uso:
 import os
 import sys
 import json
-import requests
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
+from skualo.api import paginar, mapear_concurrente, CUENTA_WORKERS
+from skualo.trafico import get_json
+from skualo.bancos import detectar_cuentas_bancarias
+from skualo.documentos import verificar_contabilizados
+from skualo.cache import get_cache_contabilizados
+from skualo.contexto import ContextoReporte
+from skualo.reportes import obtener_analisis_cuentas, obtener_balance
+from skualo.cache import get_cache_balances
+from skualo.sincronizacion import obtener_dtes_recibidos, obtener_movimientos_banco
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # CONFIGURACIÓN
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -53,15 +62,6 @@ TIPO_DTE_A_INTERNO = {
     110: 'FEXP',  # Factura de Exportación Electrónica
 }
 
-# Palabras clave para detectar cuentas bancarias
-PALABRAS_BANCO = [
-    'banco', 'santander', 'chile', 'estado', 'bci', 'scotiabank', 
-    'itau', 'itaú', 'security', 'bice', 'falabella', 'ripley',
-    'consorcio', 'internacional', 'corpbanca', 'tapp', 'tenpo',
-    'mercado pago', 'cuenta corriente', 'cta cte', 'cta. cte',
-    'coopeuch', 'bancoestado', 'bco.', 'bco '
-]
-
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # UTILIDADES API
@@ -74,37 +74,20 @@ def get_headers():
     }
 
 
-def api_get(rut, endpoint, params=None):
+def api_get(rut, endpoint, params=None, estricto=False):
     """Realiza una llamada GET a la API."""
-    url = f'{BASE_URL}/{rut}{endpoint}'
-    try:
-        r = requests.get(url, headers=get_headers(), params=params, timeout=30)
-        if r.ok:
-            return r.json()
-    except Exception as e:
-        print(f'   ⚠️ Error API: {e}')
-    return None
+    return get_json(rut, f'{BASE_URL}/{rut}{endpoint}', headers=get_headers(), params=params,
+                    estricto=estricto)
 
 
 def api_get_all(rut, endpoint, params=None):
-    """Obtiene todos los registros paginados de un endpoint."""
-    all_items = []
-    page = 1
-    base_params = params or {}
-    
-    while True:
-        paged_params = {**base_params, 'PageSize': 100, 'Page': page}
-        data = api_get(rut, endpoint, paged_params)
-        if not data:
-            break
-        items = data.get('items', data) if isinstance(data, dict) else data
-        if isinstance(items, list):
-            all_items.extend(items)
-        if not data.get('next'):
-            break
-        page += 1
-    
-    return all_items
+    """Obtiene todos los registros paginados de un endpoint (páginas en paralelo)."""
+    return paginar(api_get, rut, endpoint, params)
+
+
+def dtes_recibidos(rut):
+    """DTEs recibidos (incremental si SKUALO_DTE_INCREMENTAL=true)."""
+    return obtener_dtes_recibidos(api_get, rut)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -227,34 +210,16 @@ def setup_empresa(rut):
     if not balance:
         print('      ⚠️ No se pudo obtener el balance. Deberá configurar cuentas manualmente.')
     else:
-        # Detectar cuentas bancarias
-        cuentas_detectadas = []
-        for cuenta in balance:
-            codigo = cuenta.get('idCuenta', '')
-            nombre = cuenta.get('cuenta', '').lower()
-            
-            es_banco = False
-            
-            # Método 1: Prefijo 1102 (estándar)
-            if codigo.startswith('1102'):
-                es_banco = True
-            
-            # Método 2: Prefijo 1103 (moneda extranjera)
-            elif codigo.startswith('1103'):
-                es_banco = True
-            
-            # Método 3: Nombre contiene palabra clave
-            elif any(palabra in nombre for palabra in PALABRAS_BANCO):
-                if codigo.startswith('1'):  # Solo cuentas de activo
-                    es_banco = True
-            
-            if es_banco:
-                cuentas_detectadas.append({
-                    'codigo': codigo,
-                    'nombre': cuenta.get('cuenta', ''),
-                    'activa': True,
-                    'saldo': cuenta.get('saldo', 0)
-                })
+        # Detectar cuentas bancarias (prefijos 1102/1103 o nombre con palabra clave)
+        cuentas_detectadas = [
+            {
+                'codigo': cuenta.get('idCuenta', ''),
+                'nombre': cuenta.get('cuenta', ''),
+                'activa': True,
+                'saldo': cuenta.get('saldo', 0)
+            }
+            for cuenta in detectar_cuentas_bancarias(balance)
+        ]
         
         # Mostrar cuentas detectadas y pedir confirmación
         if cuentas_detectadas:
@@ -407,12 +372,13 @@ def setup_empresa(rut):
 # FUNCIÓN 1: MOVIMIENTOS BANCARIOS PENDIENTES DE CONCILIAR
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def movimientos_bancarios_pendientes(rut, mostrar=True):
+def movimientos_bancarios_pendientes(rut, mostrar=True, contexto=None):
     """
     Obtiene movimientos bancarios pendientes de conciliar.
     Usa la configuración guardada de la empresa.
     """
-    config = cargar_config(rut)
+    ctx = contexto or ContextoReporte(rut, api_get_all, cargar_config, obtener_dtes=dtes_recibidos)
+    config = ctx.config
     if not config:
         print(f'\n   ❌ No hay configuración para {rut}')
         print(f'   Ejecute primero: python skualo_control.py setup {rut}')
@@ -436,16 +402,17 @@ def movimientos_bancarios_pendientes(rut, mostrar=True):
             print('\n   ⚠️ No hay cuentas bancarias configuradas')
         return resultado
     
-    for cuenta in config['cuentas_bancarias']:
-        if not cuenta.get('activa', True):
-            continue
-        
+    cuentas = [c for c in config['cuentas_bancarias'] if c.get('activa', True)]
+    
+    # Obtener todos los movimientos (cuentas en paralelo, resultado en orden de config)
+    movimientos_por_cuenta = mapear_concurrente(
+        lambda c: obtener_movimientos_banco(api_get, rut, c['codigo']), cuentas, CUENTA_WORKERS
+    )
+    
+    for cuenta, movimientos in zip(cuentas, movimientos_por_cuenta):
         codigo = cuenta['codigo']
         nombre = cuenta['nombre']
         
-        # Obtener todos los movimientos
-        movimientos = api_get_all(rut, f'/bancos/{codigo}')
-        
         # Filtrar no conciliados
         sin_conciliar = [m for m in movimientos if not m.get('conciliado', True)]
         
@@ -490,12 +457,13 @@ def movimientos_bancarios_pendientes(rut, mostrar=True):
 # FUNCIÓN 2: DOCUMENTOS PENDIENTES DE APROBAR EN SII
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def documentos_por_aprobar_sii(rut, mostrar=True):
+def documentos_por_aprobar_sii(rut, mostrar=True, contexto=None):
     """
     Obtiene documentos pendientes de aprobar en el SII.
     Regla: DTEs recibidos con menos de 8 días sin respuesta.
     """
-    config = cargar_config(rut)
+    ctx = contexto or ContextoReporte(rut, api_get_all, cargar_config, obtener_dtes=dtes_recibidos)
+    config = ctx.config
     if not config:
         print(f'\n   ❌ No hay configuración para {rut}')
         print(f'   Ejecute primero: python skualo_control.py setup {rut}')
@@ -516,7 +484,7 @@ def documentos_por_aprobar_sii(rut, mostrar=True):
     }
     
     # Obtener DTEs recibidos
-    dtes = api_get_all(rut, '/sii/dte/recibidos')
+    dtes = ctx.dtes_recibidos()
     hoy = datetime.now()
     
     for dte in dtes:
@@ -578,12 +546,13 @@ def documentos_por_aprobar_sii(rut, mostrar=True):
 # FUNCIÓN 3: DOCUMENTOS PENDIENTES DE CONTABILIZAR
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def documentos_por_contabilizar(rut, mostrar=True):
+def documentos_por_contabilizar(rut, mostrar=True, contexto=None):
     """
     Obtiene documentos pendientes de contabilizar.
     Son DTEs aceptados (> 8 días o con respuesta) que NO existen en /documentos.
     """
-    config = cargar_config(rut)
+    ctx = contexto or ContextoReporte(rut, api_get_all, cargar_config, obtener_dtes=dtes_recibidos)
+    config = ctx.config
     if not config:
         print(f'\n   ❌ No hay configuración para {rut}')
         print(f'   Ejecute primero: python skualo_control.py setup {rut}')
@@ -605,12 +574,13 @@ def documentos_por_contabilizar(rut, mostrar=True):
     }
     
     # Obtener DTEs recibidos
-    dtes = api_get_all(rut, '/sii/dte/recibidos')
+    dtes = ctx.dtes_recibidos()
     hoy = datetime.now()
     
     if mostrar:
         print(f'\n   Verificando {len(dtes)} DTEs recibidos...')
     
+    aceptados = []
     for dte in dtes:
         # Verificar si está aceptado
         fecha_respuesta = dte.get('fechaRespuesta')
@@ -626,15 +596,24 @@ def documentos_por_contabilizar(rut, mostrar=True):
             except:
                 continue
         
-        # El DTE está aceptado, verificar si está contabilizado
+        aceptados.append(dte)
+    
+    # El DTE está aceptado, verificar en bloque si está contabilizado
+    # (caché local + índice del libro de compras + /documentos solo para los no encontrados)
+    claves = [
+        (TIPO_DTE_A_INTERNO.get(dte.get('idTipoDocumento'), 'FACE'), dte.get('folio'), dte.get('rutEmisor', ''))
+        for dte in aceptados
+    ]
+    contabilizados = verificar_contabilizados(
+        api_get, rut, claves, None, TIPO_DTE_A_INTERNO,
+        fechas=[dte.get('fechaEmision') for dte in aceptados],
+        cache=get_cache_contabilizados(),
+    )
+    
+    for dte, (tipo_interno, folio, _), contabilizado in zip(aceptados, claves, contabilizados):
         tipo_dte = dte.get('idTipoDocumento')
-        folio = dte.get('folio')
-        tipo_interno = TIPO_DTE_A_INTERNO.get(tipo_dte, 'FACE')
-        
-        # Verificar si existe en documentos
-        doc = api_get(rut, f'/documentos/{tipo_interno}/{folio}')
         
-        if doc:
+        if contabilizado:
             resultado['ya_contabilizados'] += 1
         else:
             # Pendiente de contabilizar
@@ -686,8 +665,8 @@ def generar_balance_excel(rut, periodo=None):
     """
     try:
         import pandas as pd
-        from openpyxl.utils import get_column_letter
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, numbers
+        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+        from common.excel import LibroStreaming, filas_dataframe, nombre_hoja_unico
     except ImportError:
         print('\n   ❌ Requiere pandas y openpyxl')
         print('   Instalar: pip install pandas openpyxl')
@@ -726,7 +705,7 @@ def generar_balance_excel(rut, periodo=None):
     # ───────────────────────────────────────────────────────────────────────────
     print('\n   1. Obteniendo Balance Tributario...')
     
-    balance = api_get(rut, f'/contabilidad/reportes/balancetributario/{periodo}')
+    balance = obtener_balance(api_get, rut, periodo)
     if not balance:
         print('      ❌ No se pudo obtener el balance')
         return None
@@ -736,6 +715,13 @@ def generar_balance_excel(rut, periodo=None):
     cuentas_con_saldo = [c for c in balance if c.get('saldo', 0) != 0]
     print(f'      ✅ {len(balance)} cuentas ({len(cuentas_con_movimiento)} con movimiento, {len(cuentas_con_saldo)} con saldo)')
     
+    # Análisis por cuenta: se descargan todos en paralelo antes de escribir el Excel
+    cuentas_a_procesar = cuentas_con_movimiento if cuentas_con_movimiento else balance
+    print(f'\n   Obteniendo análisis de {len(cuentas_a_procesar)} cuentas...')
+    analisis_por_cuenta = obtener_analisis_cuentas(
+        api_get, rut, [c.get('idCuenta', '') for c in cuentas_a_procesar], fecha_corte
+    )
+    
     # ───────────────────────────────────────────────────────────────────────────
     # 2. CREAR EXCEL
     # ───────────────────────────────────────────────────────────────────────────
@@ -750,22 +736,25 @@ def generar_balance_excel(rut, periodo=None):
     nombre_empresa = config['nombre'].replace(' ', '_')[:20]
     filename = output_dir / f'Balance_{nombre_empresa}_{periodo}_{timestamp}.xlsx'
     
-    # Estilos
-    header_fill = PatternFill(start_color='1F4E79', end_color='1F4E79', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF')
+    # Estilos con nombre por tipo de celda (NamedStyle, se registran una vez por libro)
     border = Border(
         left=Side(style='thin'),
         right=Side(style='thin'),
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
-    
-    def sanitize_sheet_name(codigo, nombre):
-        """Limpiar nombre para hoja Excel (max 31 chars)"""
-        name = f"{codigo} {nombre}"
-        for char in ['\\', '/', '*', '?', '[', ']', ':']:
-            name = name.replace(char, '')
-        return name[:31]
+    header = {
+        'fill': PatternFill(start_color='1F4E79', end_color='1F4E79', fill_type='solid'),
+        'font': Font(bold=True, color='FFFFFF'),
+        'border': border,
+    }
+    estilos_celda = {
+        'header': {**header, 'alignment': Alignment(horizontal='center')},
+        'header_cuenta': header,
+        'dato': {'border': border},
+        'monto': {'border': border, 'alignment': Alignment(horizontal='right')},
+        'link': {'border': border, 'font': Font(color='0563C1', underline='single')},
+    }
     
     # Crear DataFrame del balance
     df_balance = pd.DataFrame(balance)
@@ -790,124 +779,102 @@ def generar_balance_excel(rut, periodo=None):
     # Agregar columna para hipervínculo
     df_balance['Ver Detalle'] = ''
     
-    # Guardar en Excel
-    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-        # Hoja principal: Balance Tributario
-        df_balance.to_excel(writer, sheet_name='Balance Tributario', index=False)
+    # ───────────────────────────────────────────────────────────────────────────
+    # 3. PREPARAR ANÁLISIS POR CUENTA
+    # ───────────────────────────────────────────────────────────────────────────
+    # En modo streaming no se puede volver a una celda ya escrita: los nombres
+    # de hoja (destino de los hipervínculos) se calculan antes de escribir
+    print('\n   3. Escribiendo análisis por cuenta...')
+    
+    col_rename = {
+        'comprobante': 'Comp',
+        'idTipoDoc': 'Tipo',
+        'numDoc': 'N° Doc',
+        'auxiliar': 'Auxiliar',
+        'emision': 'Emisión',
+        'vencimiento': 'Vencimiento',
+        'valor': 'Valor',
+        'saldo': 'Saldo',
+        'glosa': 'Glosa'
+    }
+    hojas_cuentas = []
+    cuenta_a_hoja = {}
+    nombres_usados = {'Balance Tributario'}
+    
+    for cuenta in cuentas_a_procesar:
+        codigo = cuenta.get('idCuenta', '')
+        nombre = cuenta.get('cuenta', '')
         
-        ws_balance = writer.sheets['Balance Tributario']
+        analisis = analisis_por_cuenta.get(codigo)
         
-        # Formato de encabezados
-        for col in range(1, len(df_balance.columns) + 1):
-            cell = ws_balance.cell(row=1, column=col)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-            cell.border = border
+        if not analisis:
+            continue
         
-        # Formato de datos
-        for row in range(2, len(df_balance) + 2):
-            for col in range(1, len(df_balance.columns) + 1):
-                cell = ws_balance.cell(row=row, column=col)
-                cell.border = border
-                
-                # Formato numérico
-                if col >= 4 and col <= 6:  # Debe, Haber, Saldo
-                    cell.number_format = '#,##0'
-                    cell.alignment = Alignment(horizontal='right')
+        # Filtrar movimientos con valor
+        movimientos = [m for m in analisis if m.get('saldo', 0) != 0 or m.get('valor', 0) != 0]
         
-        # Ancho de columnas
-        ws_balance.column_dimensions['A'].width = 12  # Código
-        ws_balance.column_dimensions['B'].width = 40  # Cuenta
-        ws_balance.column_dimensions['C'].width = 12  # Tipo
-        ws_balance.column_dimensions['D'].width = 15  # Debe
-        ws_balance.column_dimensions['E'].width = 15  # Haber
-        ws_balance.column_dimensions['F'].width = 15  # Saldo
-        ws_balance.column_dimensions['G'].width = 12  # Ver Detalle
+        if not movimientos:
+            continue
         
-        # ───────────────────────────────────────────────────────────────────────
-        # 3. OBTENER ANÁLISIS POR CUENTA
-        # ───────────────────────────────────────────────────────────────────────
-        print('\n   3. Obteniendo análisis por cuenta...')
+        df_cuenta = pd.DataFrame(movimientos).rename(columns=col_rename)
         
-        cuentas_procesadas = 0
-        cuentas_a_procesar = cuentas_con_movimiento if cuentas_con_movimiento else balance
+        # Seleccionar columnas
+        cols_cuenta = [c for c in ['Comp', 'Tipo', 'N° Doc', 'Auxiliar', 'Emisión', 'Vencimiento', 'Valor', 'Saldo', 'Glosa'] 
+                      if c in df_cuenta.columns]
+        df_cuenta = df_cuenta[cols_cuenta]
         
-        for idx, cuenta in enumerate(cuentas_a_procesar):
-            codigo = cuenta.get('idCuenta', '')
-            nombre = cuenta.get('cuenta', '')
-            
-            # Obtener análisis
-            analisis = api_get(rut, f'/contabilidad/reportes/analisisporcuenta/{codigo}?fechaCorte={fecha_corte}&soloPendientes=false')
-            
-            if not analisis:
-                continue
-            
-            # Filtrar movimientos con valor
-            movimientos = [m for m in analisis if m.get('saldo', 0) != 0 or m.get('valor', 0) != 0]
-            
-            if not movimientos:
-                continue
-            
-            # Crear hoja para esta cuenta
-            sheet_name = sanitize_sheet_name(codigo, nombre)
-            
-            df_cuenta = pd.DataFrame(movimientos)
-            
-            # Renombrar columnas
-            col_rename = {
-                'comprobante': 'Comp',
-                'idTipoDoc': 'Tipo',
-                'numDoc': 'N° Doc',
-                'auxiliar': 'Auxiliar',
-                'emision': 'Emisión',
-                'vencimiento': 'Vencimiento',
-                'valor': 'Valor',
-                'saldo': 'Saldo',
-                'glosa': 'Glosa'
-            }
-            df_cuenta = df_cuenta.rename(columns=col_rename)
-            
-            # Seleccionar columnas
-            cols_cuenta = [c for c in ['Comp', 'Tipo', 'N° Doc', 'Auxiliar', 'Emisión', 'Vencimiento', 'Valor', 'Saldo', 'Glosa'] 
-                          if c in df_cuenta.columns]
-            df_cuenta = df_cuenta[cols_cuenta]
-            
-            # Formatear fechas
-            for col in ['Emisión', 'Vencimiento']:
-                if col in df_cuenta.columns:
-                    df_cuenta[col] = df_cuenta[col].apply(lambda x: str(x)[:10] if x else '')
-            
-            # Guardar hoja
-            df_cuenta.to_excel(writer, sheet_name=sheet_name, index=False)
-            
-            # Formato de la hoja
-            ws_cuenta = writer.sheets[sheet_name]
-            
-            for col in range(1, len(df_cuenta.columns) + 1):
-                cell = ws_cuenta.cell(row=1, column=col)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.border = border
-            
-            # Agregar hipervínculo en Balance Tributario
-            row_balance = None
-            for row in range(2, len(df_balance) + 2):
-                if ws_balance.cell(row=row, column=1).value == codigo:
-                    row_balance = row
-                    break
-            
-            if row_balance:
-                cell_link = ws_balance.cell(row=row_balance, column=7)
-                cell_link.value = 'Ver Detalle'
-                cell_link.hyperlink = f"#'{sheet_name}'!A1"
-                cell_link.font = Font(color='0563C1', underline='single')
-            
-            cuentas_procesadas += 1
-            
-            # Progreso
-            if (cuentas_procesadas % 10 == 0):
-                print(f'      Procesadas: {cuentas_procesadas}/{len(cuentas_a_procesar)}')
+        # Formatear fechas
+        for col in ['Emisión', 'Vencimiento']:
+            if col in df_cuenta.columns:
+                df_cuenta[col] = df_cuenta[col].apply(lambda x: str(x)[:10] if x else '')
+        
+        sheet_name = nombre_hoja_unico(f"{codigo} {nombre}", nombres_usados)
+        cuenta_a_hoja.setdefault(codigo, sheet_name)
+        hojas_cuentas.append((sheet_name, df_cuenta))
+    
+    # ───────────────────────────────────────────────────────────────────────────
+    # 4. ESCRIBIR EXCEL (streaming, formato por fila)
+    # ───────────────────────────────────────────────────────────────────────────
+    libro = LibroStreaming()
+    estilos = libro.estilos(estilos_celda)
+    
+    # Hoja principal: Balance Tributario
+    ws_balance = libro.crear_hoja('Balance Tributario', anchos={
+        'A': 12,  # Código
+        'B': 40,  # Cuenta
+        'C': 12,  # Tipo
+        'D': 15,  # Debe
+        'E': 15,  # Haber
+        'F': 15,  # Saldo
+        'G': 12,  # Ver Detalle
+    })
+    ws_balance.fila(df_balance.columns, estilo=estilos('header'))
+    
+    cols_monto = {col: estilos('monto', '#,##0') for col in range(4, min(6, len(df_balance.columns)) + 1)}  # Debe, Haber, Saldo
+    col_link = len(df_balance.columns)
+    for fila in filas_dataframe(df_balance):
+        hoja = cuenta_a_hoja.get(fila[0])
+        columnas_fila = cols_monto
+        if hoja:
+            fila[-1] = 'Ver Detalle'
+            columnas_fila = {**cols_monto, col_link: {**estilos('link'), 'hyperlink': f"#'{hoja}'!A1"}}
+        ws_balance.fila(fila, estilo=estilos('dato'), columnas=columnas_fila)
+    
+    # Una hoja por cuenta
+    cuentas_procesadas = 0
+    for sheet_name, df_cuenta in hojas_cuentas:
+        ws_cuenta = libro.crear_hoja(sheet_name)
+        ws_cuenta.fila(df_cuenta.columns, estilo=estilos('header_cuenta'))
+        for fila in filas_dataframe(df_cuenta):
+            ws_cuenta.fila(fila)
+        
+        cuentas_procesadas += 1
+        
+        # Progreso
+        if (cuentas_procesadas % 10 == 0):
+            print(f'      Procesadas: {cuentas_procesadas}/{len(cuentas_a_procesar)}')
+    
+    libro.guardar(filename)
     
     print(f'\n   ✅ Excel generado: {filename}')
     print(f'      Cuentas con detalle: {cuentas_procesadas}')
@@ -921,7 +888,9 @@ def generar_balance_excel(rut, periodo=None):
 
 def reporte_completo(rut):
     """Genera un reporte completo con los 3 controles."""
-    config = cargar_config(rut)
+    # Un solo contexto: config y /sii/dte/recibidos se leen una vez
+    ctx = ContextoReporte(rut, api_get_all, cargar_config, obtener_dtes=dtes_recibidos)
+    config = ctx.config
     if not config:
         print(f'\n   ❌ No hay configuración para {rut}')
         print(f'   Ejecute primero: python skualo_control.py setup {rut}')
@@ -934,9 +903,9 @@ def reporte_completo(rut):
     print('=' * 80)
     
     # Ejecutar los 3 controles
-    r1 = movimientos_bancarios_pendientes(rut, mostrar=True)
-    r2 = documentos_por_aprobar_sii(rut, mostrar=True)
-    r3 = documentos_por_contabilizar(rut, mostrar=True)
+    r1 = movimientos_bancarios_pendientes(rut, mostrar=True, contexto=ctx)
+    r2 = documentos_por_aprobar_sii(rut, mostrar=True, contexto=ctx)
+    r3 = documentos_por_contabilizar(rut, mostrar=True, contexto=ctx)
     
     # Resumen
     print('\n' + '=' * 80)
@@ -953,6 +922,21 @@ def reporte_completo(rut):
     return {'bancos': r1, 'aprobar': r2, 'contabilizar': r3}
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# CACHÉ LOCAL
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def invalidar_balances(rut, periodo=None):
+    """Elimina balances tributarios de la caché local (rut 'todas' = todas las empresas)."""
+    cache = get_cache_balances()
+    if not cache:
+        print('\n   ⚠️ Caché desactivada (SKUALO_CACHE=false)')
+        return 0
+    borrados = cache.invalidar(None if rut.lower() == 'todas' else rut, periodo)
+    print(f'\n   🗑️  Balances cacheados eliminados: {borrados}')
+    return borrados
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # MAIN
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -978,6 +962,8 @@ CONTROLES DE PENDIENTES:
 REPORTES CONTABLES:
     balance <rut> [periodo]  Genera Balance en Excel con análisis por cuenta
                              Período opcional: YYYYMM (ej: 202511)
+    invalidar <rut> [periodo]
+                             Borra balances cacheados (rut "todas" = todas las empresas)
 
 Ejemplos:
     python skualo_control.py setup 77285542-7
@@ -996,7 +982,7 @@ def main():
     if comando == 'listar':
         listar_empresas_configuradas()
     
-    elif comando in ['setup', 'bancos', 'aprobar', 'contabilizar', 'reporte', 'balance']:
+    elif comando in ['setup', 'bancos', 'aprobar', 'contabilizar', 'reporte', 'balance', 'invalidar']:
         if len(sys.argv) < 3:
             print(f'Error: El comando "{comando}" requiere un RUT')
             print(f'Uso: python skualo_control.py {comando} <RUT>')
@@ -1017,6 +1003,9 @@ def main():
         elif comando == 'balance':
             periodo = sys.argv[3] if len(sys.argv) > 3 else None
             generar_balance_excel(rut, periodo)
+        elif comando == 'invalidar':
+            periodo = sys.argv[3] if len(sys.argv) > 3 else None
+            invalidar_balances(rut, periodo)
     
     else:
         print(f'Comando desconocido: {comando}')
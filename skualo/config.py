@@ -3,6 +3,7 @@ Gestión de configuración de empresas.
 """
 
 import os
+import copy
 import json
 from pathlib import Path
 from typing import Optional, List, Dict
@@ -11,6 +12,9 @@ from typing import Optional, List, Dict
 CONFIG_DIR = Path(__file__).parent / 'config' / 'empresas'
 CONFIG_DIR.mkdir(parents=True, exist_ok=True)
 
+# Configuraciones ya leídas: rut -> (mtime del archivo, config)
+_cache_config: Dict[str, tuple] = {}
+
 
 def get_config_path(rut: str) -> Path:
     """Obtiene la ruta del archivo de configuración de una empresa."""
@@ -33,10 +37,20 @@ def cargar_config(rut: str) -> Optional[Dict]:
         dict con la configuración o None si no existe
     """
     path = get_config_path(rut)
-    if not path.exists():
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        _cache_config.pop(rut, None)
         return None
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    
+    # Solo se vuelve a leer el JSON si el archivo cambió
+    cacheado = _cache_config.get(rut)
+    if cacheado is None or cacheado[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            cacheado = (mtime, json.load(f))
+        _cache_config[rut] = cacheado
+    # Copia para que quien la modifique no altere la caché
+    return copy.deepcopy(cacheado[1])
 
 
 def guardar_config(rut: str, config: dict) -> str:
@@ -53,6 +67,7 @@ def guardar_config(rut: str, config: dict) -> str:
     path = get_config_path(rut)
     with open(path, 'w', encoding='utf-8') as f:
         json.dump(config, f, indent=2, ensure_ascii=False)
+    _cache_config.pop(rut, None)
     return str(path)
 
 
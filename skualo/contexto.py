@@ -0,0 +1,74 @@
+"""
+Contexto de datos compartido durante un reporte.
+
+Un reporte completo ejecuta varios controles sobre la misma empresa y
+varios de ellos leen los mismos endpoints (por ejemplo /sii/dte/recibidos
+lo usan tanto "por aprobar" como "por contabilizar"). El contexto descarga
+cada endpoint una sola vez y entrega la misma lista a todos los controles.
+También carga la configuración de la empresa una sola vez.
+
+Uso:
+    ctx = ContextoReporte(rut, self._api_get_all, cargar_config)
+    aprobar = self.documentos_por_aprobar_sii(rut, contexto=ctx)
+    contabilizar = self.documentos_por_contabilizar(rut, contexto=ctx)
+"""
+
+import json
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class ContextoReporte:
+    """Memoiza la configuración y las descargas paginadas de una empresa."""
+
+    def __init__(self, rut: str, api_get_all: Callable, cargar_config: Callable,
+                 obtener_dtes: Callable = None):
+        """
+        Args:
+            rut: RUT de la empresa
+            api_get_all: Función (rut, endpoint, params=None) -> list
+            cargar_config: Función (rut) -> dict | None
+            obtener_dtes: Función (rut) -> list para los DTEs recibidos
+                          (ej: sincronización incremental). Default api_get_all.
+        """
+        self.rut = rut
+        self._api_get_all = api_get_all
+        self._cargar_config = cargar_config
+        self._obtener_dtes = obtener_dtes
+        self._config_cargada = False
+        self._config: Optional[Dict] = None
+        self._datos: Dict[tuple, List] = {}
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> Optional[Dict]:
+        """Configuración de la empresa (se lee del disco una sola vez)."""
+        if not self._config_cargada:
+            self._config = self._cargar_config(self.rut)
+            self._config_cargada = True
+        return self._config
+
+    def obtener_todos(self, endpoint: str, params: dict = None) -> List:
+        """
+        Registros paginados del endpoint, descargados una sola vez.
+
+        Si dos controles piden el mismo endpoint a la vez (en hilos
+        distintos), el segundo espera al primero en vez de repetir la descarga.
+        """
+        clave = (endpoint, json.dumps(params or {}, sort_keys=True))
+        return self._memoizar(clave, lambda: self._api_get_all(self.rut, endpoint, params))
+
+    def _memoizar(self, clave: tuple, obtener: Callable) -> List:
+        with self._lock:
+            lock = self._locks.setdefault(clave, threading.Lock())
+        with lock:
+            if clave not in self._datos:
+                self._datos[clave] = obtener()
+            return self._datos[clave]
+
+    def dtes_recibidos(self) -> List:
+        """DTEs recibidos desde el SII."""
+        if self._obtener_dtes is None:
+            return self.obtener_todos('/sii/dte/recibidos')
+        return self._memoizar(('/sii/dte/recibidos', '{}'), lambda: self._obtener_dtes(self.rut))
@@ -5,28 +5,35 @@ Esta clase encapsula todas las funciones de control y reportes
 para facilitar la integración con bots y APIs.
 """
 
+import calendar
 import os
 import json
-import requests
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List
 from dotenv import load_dotenv
 
 from .config import cargar_config, guardar_config, config_existe
+from .api import paginar, mapear_concurrente, CUENTA_WORKERS
+from .trafico import get_json
+from .bancos import PALABRAS_BANCO, detectar_cuentas_bancarias
+from .documentos import verificar_contabilizados
+from .cache import get_cache_contabilizados
+from .contexto import ContextoReporte
+from .reportes import obtener_analisis_cuentas, obtener_balance
+from . import sincronizacion
 
 # Cargar variables de entorno
 load_dotenv()
 
 
-class SkualoControl:
+class ControlBase:
     """
-    Clase principal para interactuar con Skualo ERP.
+    Lógica común de SkualoControl y AsyncSkualoControl (skualo.control_async).
     
-    Ejemplo:
-        ctrl = SkualoControl()
-        ctrl.setup_empresa('77285542-7')
-        resultado = ctrl.reporte_completo('77285542-7')
+    Contiene la configuración y el armado de los resultados a partir de los
+    datos ya descargados; cada subclase solo decide cómo se descargan
+    (requests en hilos o httpx con asyncio).
     """
     
     BASE_URL = 'https://api.skualo.cl'
@@ -42,27 +49,30 @@ class SkualoControl:
         110: 'FEXP',  # Factura de Exportación Electrónica
     }
     
-    # Palabras clave para detectar cuentas bancarias
-    PALABRAS_BANCO = [
-        'banco', 'santander', 'chile', 'estado', 'bci', 'scotiabank', 
-        'itau', 'itaú', 'security', 'bice', 'falabella', 'ripley',
-        'consorcio', 'internacional', 'corpbanca', 'tapp', 'tenpo',
-        'mercado pago', 'cuenta corriente', 'cta cte', 'cta. cte',
-        'coopeuch', 'bancoestado', 'bco.', 'bco '
-    ]
+    # Palabras clave para detectar cuentas bancarias (ver skualo.bancos)
+    PALABRAS_BANCO = PALABRAS_BANCO
     
-    def __init__(self, token: str = None):
+    def __init__(self, token: str = None, workers: int = None, incremental: bool = None):
         """
         Inicializa el controlador.
         
         Args:
             token: Token de API de Skualo. Si no se proporciona,
                    se lee de la variable de entorno SKUALO_API_TOKEN
+            workers: Páginas descargadas en paralelo por endpoint.
+                     Si no se proporciona, usa SKUALO_PAGE_WORKERS (1 = secuencial)
+            incremental: Sincronizar DTEs recibidos y movimientos bancarios de
+                         forma incremental (caché local + marca de agua).
+                         Si no se proporciona, usa SKUALO_DTE_INCREMENTAL y
+                         SKUALO_BANCO_INCREMENTAL respectivamente
         """
         self.token = token or os.getenv('SKUALO_API_TOKEN')
         if not self.token:
             raise ValueError("Token no proporcionado. Configure SKUALO_API_TOKEN en .env")
         
+        self.workers = workers
+        self.incremental = incremental
+        
         self.output_dir = Path(__file__).parent.parent / 'generados'
         self.output_dir.mkdir(exist_ok=True)
     
@@ -73,36 +83,385 @@ class SkualoControl:
             'accept': 'application/json'
         }
     
-    def _api_get(self, rut: str, endpoint: str, params: dict = None) -> Optional[Dict]:
-        """Realiza una llamada GET a la API."""
-        url = f'{self.BASE_URL}/{rut}{endpoint}'
+    def _url(self, rut: str, endpoint: str) -> str:
+        return f'{self.BASE_URL}/{rut}{endpoint}'
+    
+    # ═══════════════════════════════════════════════════════════════════════════
+    # ARMADO DE RESULTADOS (sin llamadas a la API)
+    # ═══════════════════════════════════════════════════════════════════════════
+    
+    @staticmethod
+    def _cuentas_activas(config: Dict) -> List[Dict]:
+        return [c for c in config.get('cuentas_bancarias') or [] if c.get('activa', True)]
+    
+    def _armar_movimientos(self, config: Dict, rut: str, cuentas: List[Dict],
+                           movimientos_por_cuenta: List[List]) -> Dict:
+        """Resultado de movimientos_bancarios_pendientes (en el orden de `cuentas`)."""
+        resultado = {
+            'empresa': config['nombre'],
+            'rut': rut,
+            'fecha': datetime.now().isoformat(),
+            'cuentas': [],
+            'total_sin_conciliar': 0
+        }
+        
+        for cuenta, movimientos in zip(cuentas, movimientos_por_cuenta):
+            codigo = cuenta['codigo']
+            nombre = cuenta['nombre']
+            
+            sin_conciliar = [m for m in movimientos if not m.get('conciliado', True)]
+            
+            cuenta_resultado = {
+                'codigo': codigo,
+                'nombre': nombre,
+                'total_movimientos': len(movimientos),
+                'sin_conciliar': len(sin_conciliar),
+                'movimientos': sin_conciliar
+            }
+            resultado['cuentas'].append(cuenta_resultado)
+            resultado['total_sin_conciliar'] += len(sin_conciliar)
+        
+        return resultado
+    
+    def _armar_por_aprobar(self, config: Dict, rut: str, dtes: List[Dict]) -> Dict:
+        """Resultado de documentos_por_aprobar_sii a partir de los DTEs recibidos."""
+        resultado = {
+            'empresa': config['nombre'],
+            'rut': rut,
+            'fecha': datetime.now().isoformat(),
+            'pendientes': [],
+            'total_pendientes': 0,
+            'monto_total': 0
+        }
+        
+        hoy = datetime.now()
+        
+        for dte in dtes:
+            if dte.get('fechaRespuesta'):
+                continue
+            
+            fecha_recep_str = dte.get('creadoEl', '')
+            if not fecha_recep_str:
+                continue
+            
+            try:
+                fecha_recep = datetime.fromisoformat(fecha_recep_str.split('.')[0])
+                dias = (hoy - fecha_recep).days
+            except:
+                continue
+            
+            if dias > self.DIAS_ACEPTACION_TACITA:
+                continue
+            
+            doc = {
+                'rut_emisor': dte.get('rutEmisor', ''),
+                'emisor': dte.get('emisor', ''),
+                'tipo_documento': dte.get('tipoDocumento', ''),
+                'tipo_dte': dte.get('idTipoDocumento'),
+                'folio': dte.get('folio'),
+                'fecha_emision': str(dte.get('fechaEmision', ''))[:10],
+                'monto': dte.get('montoTotal', 0),
+                'dias_restantes': self.DIAS_ACEPTACION_TACITA - dias
+            }
+            resultado['pendientes'].append(doc)
+            resultado['monto_total'] += doc['monto']
+        
+        resultado['total_pendientes'] = len(resultado['pendientes'])
+        return resultado
+    
+    def _dtes_aceptados(self, dtes: List[Dict]) -> List[Dict]:
+        """DTEs aceptados: con respuesta o con más días que la aceptación tácita."""
+        hoy = datetime.now()
+        
+        aceptados = []
+        for dte in dtes:
+            fecha_respuesta = dte.get('fechaRespuesta')
+            
+            if not fecha_respuesta:
+                fecha_recep_str = dte.get('creadoEl', '')
+                try:
+                    fecha_recep = datetime.fromisoformat(fecha_recep_str.split('.')[0])
+                    dias = (hoy - fecha_recep).days
+                    if dias <= self.DIAS_ACEPTACION_TACITA:
+                        continue
+                except:
+                    continue
+            
+            aceptados.append(dte)
+        return aceptados
+    
+    def _claves_documentos(self, dtes: List[Dict]) -> List[tuple]:
+        """(tipo_interno, folio, rut_emisor) de cada DTE, para verificar_contabilizados."""
+        return [
+            (self.TIPO_DTE_A_INTERNO.get(dte.get('idTipoDocumento'), 'FACE'), dte.get('folio'), dte.get('rutEmisor', ''))
+            for dte in dtes
+        ]
+    
+    def _armar_por_contabilizar(self, config: Dict, rut: str, aceptados: List[Dict],
+                                claves: List[tuple], contabilizados: List[bool]) -> Dict:
+        """Resultado de documentos_por_contabilizar a partir de la verificación."""
+        resultado = {
+            'empresa': config['nombre'],
+            'rut': rut,
+            'fecha': datetime.now().isoformat(),
+            'pendientes': [],
+            'ya_contabilizados': 0,
+            'total_pendientes': 0,
+            'monto_total': 0
+        }
+        
+        for dte, (tipo_interno, folio, _), contabilizado in zip(aceptados, claves, contabilizados):
+            tipo_dte = dte.get('idTipoDocumento')
+            
+            if contabilizado:
+                resultado['ya_contabilizados'] += 1
+            else:
+                pendiente = {
+                    'rut_emisor': dte.get('rutEmisor', ''),
+                    'emisor': dte.get('emisor', ''),
+                    'tipo_documento': dte.get('tipoDocumento', ''),
+                    'tipo_dte': tipo_dte,
+                    'tipo_interno': tipo_interno,
+                    'folio': folio,
+                    'fecha_emision': str(dte.get('fechaEmision', ''))[:10],
+                    'monto': dte.get('montoTotal', 0),
+                }
+                resultado['pendientes'].append(pendiente)
+                resultado['monto_total'] += pendiente['monto']
+        
+        resultado['total_pendientes'] = len(resultado['pendientes'])
+        return resultado
+    
+    @staticmethod
+    def _armar_reporte(config: Dict, rut: str, bancos: Optional[Dict], aprobar: Optional[Dict],
+                       contabilizar: Optional[Dict]) -> Dict:
+        """Resultado de reporte_completo con los 3 controles."""
+        return {
+            'empresa': config['nombre'],
+            'rut': rut,
+            'fecha': datetime.now().isoformat(),
+            'bancos': bancos,
+            'aprobar': aprobar,
+            'contabilizar': contabilizar,
+            'resumen': {
+                'movimientos_sin_conciliar': bancos['total_sin_conciliar'] if bancos else 0,
+                'documentos_por_aprobar': aprobar['total_pendientes'] if aprobar else 0,
+                'documentos_por_contabilizar': contabilizar['total_pendientes'] if contabilizar else 0,
+                'documentos_contabilizados': contabilizar['ya_contabilizados'] if contabilizar else 0,
+            }
+        }
+    
+    @staticmethod
+    def _fecha_corte(periodo: str) -> str:
+        """Último día del período YYYYMM, como YYYY-MM-DD."""
+        año = int(periodo[:4])
+        mes = int(periodo[4:6])
+        ultimo_dia = calendar.monthrange(año, mes)[1]
+        return f'{año}-{mes:02d}-{ultimo_dia:02d}'
+    
+    @staticmethod
+    def _cuentas_balance(balance: List[Dict]) -> List[Dict]:
+        """Cuentas del balance con movimientos (o todas, si ninguna tiene)."""
+        cuentas_con_mov = [c for c in balance if c.get('debe', 0) != 0 or c.get('haber', 0) != 0 or c.get('saldo', 0) != 0]
+        return cuentas_con_mov if cuentas_con_mov else balance
+    
+    def _escribir_balance_excel(self, config: Dict, periodo: str, balance: List[Dict],
+                                cuentas_a_procesar: List[Dict],
+                                analisis_por_cuenta: Dict[str, Optional[List]]) -> str:
+        """Escribe el Excel del balance con los datos ya descargados (sin red)."""
         try:
-            r = requests.get(url, headers=self._headers(), params=params, timeout=30)
-            if r.ok:
-                return r.json()
-        except Exception as e:
-            print(f'Error API: {e}')
-        return None
+            import pandas as pd
+            from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+            from common.excel import LibroStreaming, filas_dataframe, nombre_hoja_unico
+        except ImportError:
+            raise ImportError("Requiere pandas y openpyxl: pip install pandas openpyxl")
+        
+        # Crear Excel
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        nombre_empresa = config['nombre'].replace(' ', '_')[:20]
+        filename = self.output_dir / f'Balance_{nombre_empresa}_{periodo}_{timestamp}.xlsx'
+        
+        # Estilos con nombre por tipo de celda (NamedStyle, se registran una vez por libro)
+        border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+        header = {
+            'fill': PatternFill(start_color='1F4E79', end_color='1F4E79', fill_type='solid'),
+            'font': Font(bold=True, color='FFFFFF'),
+            'border': border,
+        }
+        estilos_celda = {
+            'header': {**header, 'alignment': Alignment(horizontal='center')},
+            'header_cuenta': header,
+            'dato': {'border': border},
+            'monto': {'border': border, 'alignment': Alignment(horizontal='right')},
+            'link': {'border': border, 'font': Font(color='0563C1', underline='single')},
+        }
+        
+        # DataFrame del balance
+        df_balance = pd.DataFrame(balance)
+        columnas = {
+            'idCuenta': 'Código',
+            'cuenta': 'Cuenta',
+            'tipo': 'Tipo',
+            'debe': 'Debe',
+            'haber': 'Haber',
+            'saldo': 'Saldo'
+        }
+        df_balance = df_balance.rename(columns=columnas)
+        cols_mostrar = [c for c in ['Código', 'Cuenta', 'Tipo', 'Debe', 'Haber', 'Saldo'] if c in df_balance.columns]
+        df_balance = df_balance[cols_mostrar]
+        df_balance['Ver Detalle'] = ''
+        
+        # Preparar hojas de cuentas (en modo streaming los nombres de hoja
+        # deben conocerse antes de escribir los hipervínculos del balance)
+        hojas_cuentas = []
+        cuenta_a_hoja = {}
+        nombres_usados = {'Balance Tributario'}
+        col_rename = {
+            'comprobante': 'Comp',
+            'idTipoDoc': 'Tipo',
+            'numDoc': 'N° Doc',
+            'auxiliar': 'Auxiliar',
+            'emision': 'Emisión',
+            'vencimiento': 'Vencimiento',
+            'valor': 'Valor',
+            'saldo': 'Saldo',
+            'glosa': 'Glosa'
+        }
+        for cuenta in cuentas_a_procesar:
+            codigo = cuenta.get('idCuenta', '')
+            nombre = cuenta.get('cuenta', '')
+            
+            analisis = analisis_por_cuenta.get(codigo)
+            if not analisis:
+                continue
+            
+            movimientos = [m for m in analisis if m.get('saldo', 0) != 0 or m.get('valor', 0) != 0]
+            if not movimientos:
+                continue
+            
+            df_cuenta = pd.DataFrame(movimientos).rename(columns=col_rename)
+            cols_cuenta = [c for c in ['Comp', 'Tipo', 'N° Doc', 'Auxiliar', 'Emisión', 'Vencimiento', 'Valor', 'Saldo', 'Glosa'] 
+                          if c in df_cuenta.columns]
+            df_cuenta = df_cuenta[cols_cuenta]
+            
+            for col in ['Emisión', 'Vencimiento']:
+                if col in df_cuenta.columns:
+                    df_cuenta[col] = df_cuenta[col].apply(lambda x: str(x)[:10] if x else '')
+            
+            sheet_name = nombre_hoja_unico(f"{codigo} {nombre}", nombres_usados)
+            cuenta_a_hoja.setdefault(codigo, sheet_name)
+            hojas_cuentas.append((sheet_name, df_cuenta))
+        
+        # Escritura streaming: cada fila se escribe una vez, ya con formato
+        libro = LibroStreaming()
+        estilos = libro.estilos(estilos_celda)
+        ws_balance = libro.crear_hoja('Balance Tributario', anchos={
+            'A': 12, 'B': 40, 'C': 12, 'D': 15, 'E': 15, 'F': 15, 'G': 12
+        })
+        ws_balance.fila(df_balance.columns, estilo=estilos('header'))
+        
+        cols_monto = {col: estilos('monto', '#,##0') for col in range(4, min(6, len(df_balance.columns)) + 1)}
+        col_link = len(df_balance.columns)
+        for fila in filas_dataframe(df_balance):
+            hoja = cuenta_a_hoja.get(fila[0])
+            columnas_fila = cols_monto
+            if hoja:
+                fila[-1] = 'Ver Detalle'
+                columnas_fila = {**cols_monto, col_link: {**estilos('link'), 'hyperlink': f"#'{hoja}'!A1"}}
+            ws_balance.fila(fila, estilo=estilos('dato'), columnas=columnas_fila)
+        
+        for sheet_name, df_cuenta in hojas_cuentas:
+            ws_cuenta = libro.crear_hoja(sheet_name)
+            ws_cuenta.fila(df_cuenta.columns, estilo=estilos('header_cuenta'))
+            for fila in filas_dataframe(df_cuenta):
+                ws_cuenta.fila(fila)
+        
+        libro.guardar(filename)
+        return str(filename)
+    
+    @staticmethod
+    def _texto_telegram(reporte: Dict) -> str:
+        """Reporte formateado en Markdown para Telegram."""
+        r = reporte['resumen']
+        fecha = datetime.now().strftime('%d/%m/%Y %H:%M')
+        
+        texto = f"""
+📊 *REPORTE DE CONTROL*
+_{reporte['empresa']}_
+_{fecha}_
+
+🏦 *Movimientos sin conciliar:* {r['movimientos_sin_conciliar']}
+📄 *Docs por aprobar SII:* {r['documentos_por_aprobar']}
+📋 *Docs por contabilizar:* {r['documentos_por_contabilizar']}
+✅ *Docs contabilizados:* {r['documentos_contabilizados']}
+"""
+        
+        # Detalle de pendientes de aprobar
+        if reporte['aprobar'] and reporte['aprobar']['pendientes']:
+            texto += "\n*📄 Pendientes de aprobar:*\n"
+            for doc in reporte['aprobar']['pendientes'][:5]:
+                texto += f"  • {doc['emisor'][:20]} - ${doc['monto']:,.0f} ({doc['dias_restantes']}d)\n"
+        
+        # Detalle de pendientes de contabilizar
+        if reporte['contabilizar'] and reporte['contabilizar']['pendientes']:
+            texto += "\n*📋 Pendientes de contabilizar:*\n"
+            for doc in reporte['contabilizar']['pendientes'][:5]:
+                texto += f"  • {doc['emisor'][:20]} - ${doc['monto']:,.0f}\n"
+            if len(reporte['contabilizar']['pendientes']) > 5:
+                texto += f"  _...y {len(reporte['contabilizar']['pendientes']) - 5} más_\n"
+        
+        return texto
+
+
+class SkualoControl(ControlBase):
+    """
+    Clase principal para interactuar con Skualo ERP.
+    
+    Ejemplo:
+        ctrl = SkualoControl()
+        ctrl.setup_empresa('77285542-7')
+        resultado = ctrl.reporte_completo('77285542-7')
+    
+    Para bots o servidores asyncio, ver AsyncSkualoControl (skualo.control_async).
+    """
+    
+    def _api_get(self, rut: str, endpoint: str, params: dict = None,
+                 estricto: bool = False) -> Optional[Dict]:
+        """
+        Realiza una llamada GET a la API (con límite de tasa y reintentos, ver skualo.trafico).
+
+        Retorna None si el recurso no existe (404/4xx). Si la API sigue
+        fallando tras los reintentos lanza ApiSkualoNoDisponible, para que
+        una paginación no termine en silencio con datos incompletos.
+        """
+        return get_json(rut, self._url(rut, endpoint), headers=self._headers(), params=params,
+                        estricto=estricto)
     
     def _api_get_all(self, rut: str, endpoint: str, params: dict = None) -> List:
-        """Obtiene todos los registros paginados de un endpoint."""
-        all_items = []
-        page = 1
-        base_params = params or {}
-        
-        while True:
-            paged_params = {**base_params, 'PageSize': 100, 'Page': page}
-            data = self._api_get(rut, endpoint, paged_params)
-            if not data:
-                break
-            items = data.get('items', data) if isinstance(data, dict) else data
-            if isinstance(items, list):
-                all_items.extend(items)
-            if not data.get('next'):
-                break
-            page += 1
-        
-        return all_items
+        """Obtiene todos los registros paginados de un endpoint (páginas en paralelo)."""
+        return paginar(self._api_get, rut, endpoint, params, workers=self.workers)
+    
+    def _contexto(self, rut: str, contexto: ContextoReporte = None) -> ContextoReporte:
+        """Retorna el contexto recibido o crea uno nuevo para esta consulta."""
+        return contexto or ContextoReporte(rut, self._api_get_all, cargar_config,
+                                           obtener_dtes=self._dtes_recibidos)
+    
+    def _movimientos_banco(self, rut: str, codigo: str) -> List:
+        """Movimientos de una cuenta: incrementales si está activo, si no historial completo."""
+        return sincronizacion.obtener_movimientos_banco(
+            self._api_get, rut, codigo, incremental=self.incremental, workers=self.workers
+        )
+    
+    def _dtes_recibidos(self, rut: str) -> List:
+        """DTEs recibidos: sincronización incremental si está activa, si no descarga completa."""
+        return sincronizacion.obtener_dtes_recibidos(
+            self._api_get, rut, incremental=self.incremental, workers=self.workers
+        )
     
     # ═══════════════════════════════════════════════════════════════════════════
     # SETUP DE EMPRESA
@@ -153,23 +512,12 @@ class SkualoControl:
         
         if balance:
             # Detectar cuentas bancarias
-            for cuenta in balance:
-                codigo = cuenta.get('idCuenta', '')
-                nombre = cuenta.get('cuenta', '').lower()
-                
-                es_banco = False
-                if codigo.startswith('1102') or codigo.startswith('1103'):
-                    es_banco = True
-                elif any(p in nombre for p in self.PALABRAS_BANCO):
-                    if codigo.startswith('1'):
-                        es_banco = True
-                
-                if es_banco:
-                    config['cuentas_bancarias'].append({
-                        'codigo': codigo,
-                        'nombre': cuenta.get('cuenta', ''),
-                        'activa': True
-                    })
+            for cuenta in detectar_cuentas_bancarias(balance):
+                config['cuentas_bancarias'].append({
+                    'codigo': cuenta.get('idCuenta', ''),
+                    'nombre': cuenta.get('cuenta', ''),
+                    'activa': True
+                })
             
             # Detectar cuenta de clientes y proveedores
             for cuenta in balance:
@@ -207,12 +555,13 @@ class SkualoControl:
     # FUNCIÓN 1: MOVIMIENTOS BANCARIOS PENDIENTES DE CONCILIAR
     # ═══════════════════════════════════════════════════════════════════════════
     
-    def movimientos_bancarios_pendientes(self, rut: str) -> Optional[Dict]:
+    def movimientos_bancarios_pendientes(self, rut: str, contexto: ContextoReporte = None) -> Optional[Dict]:
         """
         Obtiene movimientos bancarios pendientes de conciliar.
         
         Args:
             rut: RUT de la empresa
+            contexto: Datos ya descargados por reporte_completo (opcional)
         
         Returns:
             dict con:
@@ -222,48 +571,26 @@ class SkualoControl:
             - cuentas: Lista de cuentas con movimientos sin conciliar
             - total_sin_conciliar: Total de movimientos sin conciliar
         """
-        config = cargar_config(rut)
+        ctx = self._contexto(rut, contexto)
+        config = ctx.config
         if not config:
             return None
         
-        resultado = {
-            'empresa': config['nombre'],
-            'rut': rut,
-            'fecha': datetime.now().isoformat(),
-            'cuentas': [],
-            'total_sin_conciliar': 0
-        }
+        cuentas = self._cuentas_activas(config)
         
-        if not config.get('cuentas_bancarias'):
-            return resultado
-        
-        for cuenta in config['cuentas_bancarias']:
-            if not cuenta.get('activa', True):
-                continue
-            
-            codigo = cuenta['codigo']
-            nombre = cuenta['nombre']
-            
-            movimientos = self._api_get_all(rut, f'/bancos/{codigo}')
-            sin_conciliar = [m for m in movimientos if not m.get('conciliado', True)]
-            
-            cuenta_resultado = {
-                'codigo': codigo,
-                'nombre': nombre,
-                'total_movimientos': len(movimientos),
-                'sin_conciliar': len(sin_conciliar),
-                'movimientos': sin_conciliar
-            }
-            resultado['cuentas'].append(cuenta_resultado)
-            resultado['total_sin_conciliar'] += len(sin_conciliar)
+        # Las cuentas se descargan en paralelo; el resultado se arma en el
+        # orden de la configuración para que sea determinista
+        movimientos_por_cuenta = mapear_concurrente(
+            lambda c: self._movimientos_banco(rut, c['codigo']), cuentas, CUENTA_WORKERS
+        )
         
-        return resultado
+        return self._armar_movimientos(config, rut, cuentas, movimientos_por_cuenta)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # FUNCIÓN 2: DOCUMENTOS PENDIENTES DE APROBAR EN SII
     # ═══════════════════════════════════════════════════════════════════════════
     
-    def documentos_por_aprobar_sii(self, rut: str) -> Optional[Dict]:
+    def documentos_por_aprobar_sii(self, rut: str, contexto: ContextoReporte = None) -> Optional[Dict]:
         """
         Obtiene documentos pendientes de aprobar en el SII.
         
@@ -272,6 +599,7 @@ class SkualoControl:
         
         Args:
             rut: RUT de la empresa
+            contexto: Datos ya descargados por reporte_completo (opcional)
         
         Returns:
             dict con:
@@ -280,60 +608,18 @@ class SkualoControl:
             - total_pendientes: Cantidad de documentos
             - monto_total: Monto total de los documentos
         """
-        config = cargar_config(rut)
+        ctx = self._contexto(rut, contexto)
+        config = ctx.config
         if not config:
             return None
         
-        resultado = {
-            'empresa': config['nombre'],
-            'rut': rut,
-            'fecha': datetime.now().isoformat(),
-            'pendientes': [],
-            'total_pendientes': 0,
-            'monto_total': 0
-        }
-        
-        dtes = self._api_get_all(rut, '/sii/dte/recibidos')
-        hoy = datetime.now()
-        
-        for dte in dtes:
-            if dte.get('fechaRespuesta'):
-                continue
-            
-            fecha_recep_str = dte.get('creadoEl', '')
-            if not fecha_recep_str:
-                continue
-            
-            try:
-                fecha_recep = datetime.fromisoformat(fecha_recep_str.split('.')[0])
-                dias = (hoy - fecha_recep).days
-            except:
-                continue
-            
-            if dias > self.DIAS_ACEPTACION_TACITA:
-                continue
-            
-            doc = {
-                'rut_emisor': dte.get('rutEmisor', ''),
-                'emisor': dte.get('emisor', ''),
-                'tipo_documento': dte.get('tipoDocumento', ''),
-                'tipo_dte': dte.get('idTipoDocumento'),
-                'folio': dte.get('folio'),
-                'fecha_emision': str(dte.get('fechaEmision', ''))[:10],
-                'monto': dte.get('montoTotal', 0),
-                'dias_restantes': self.DIAS_ACEPTACION_TACITA - dias
-            }
-            resultado['pendientes'].append(doc)
-            resultado['monto_total'] += doc['monto']
-        
-        resultado['total_pendientes'] = len(resultado['pendientes'])
-        return resultado
+        return self._armar_por_aprobar(config, rut, ctx.dtes_recibidos())
     
     # ═══════════════════════════════════════════════════════════════════════════
     # FUNCIÓN 3: DOCUMENTOS PENDIENTES DE CONTABILIZAR
     # ═══════════════════════════════════════════════════════════════════════════
     
-    def documentos_por_contabilizar(self, rut: str) -> Optional[Dict]:
+    def documentos_por_contabilizar(self, rut: str, contexto: ContextoReporte = None) -> Optional[Dict]:
         """
         Obtiene documentos pendientes de contabilizar.
         
@@ -342,6 +628,7 @@ class SkualoControl:
         
         Args:
             rut: RUT de la empresa
+            contexto: Datos ya descargados por reporte_completo (opcional)
         
         Returns:
             dict con:
@@ -351,60 +638,22 @@ class SkualoControl:
             - total_pendientes: Cantidad de documentos pendientes
             - monto_total: Monto total de los documentos pendientes
         """
-        config = cargar_config(rut)
+        ctx = self._contexto(rut, contexto)
+        config = ctx.config
         if not config:
             return None
         
-        resultado = {
-            'empresa': config['nombre'],
-            'rut': rut,
-            'fecha': datetime.now().isoformat(),
-            'pendientes': [],
-            'ya_contabilizados': 0,
-            'total_pendientes': 0,
-            'monto_total': 0
-        }
-        
-        dtes = self._api_get_all(rut, '/sii/dte/recibidos')
-        hoy = datetime.now()
+        aceptados = self._dtes_aceptados(ctx.dtes_recibidos())
         
-        for dte in dtes:
-            fecha_respuesta = dte.get('fechaRespuesta')
-            
-            if not fecha_respuesta:
-                fecha_recep_str = dte.get('creadoEl', '')
-                try:
-                    fecha_recep = datetime.fromisoformat(fecha_recep_str.split('.')[0])
-                    dias = (hoy - fecha_recep).days
-                    if dias <= self.DIAS_ACEPTACION_TACITA:
-                        continue
-                except:
-                    continue
-            
-            tipo_dte = dte.get('idTipoDocumento')
-            folio = dte.get('folio')
-            tipo_interno = self.TIPO_DTE_A_INTERNO.get(tipo_dte, 'FACE')
-            
-            doc = self._api_get(rut, f'/documentos/{tipo_interno}/{folio}')
-            
-            if doc:
-                resultado['ya_contabilizados'] += 1
-            else:
-                pendiente = {
-                    'rut_emisor': dte.get('rutEmisor', ''),
-                    'emisor': dte.get('emisor', ''),
-                    'tipo_documento': dte.get('tipoDocumento', ''),
-                    'tipo_dte': tipo_dte,
-                    'tipo_interno': tipo_interno,
-                    'folio': folio,
-                    'fecha_emision': str(dte.get('fechaEmision', ''))[:10],
-                    'monto': dte.get('montoTotal', 0),
-                }
-                resultado['pendientes'].append(pendiente)
-                resultado['monto_total'] += pendiente['monto']
+        # Verificación en bloque: caché local y libro de compras (sin N+1)
+        claves = self._claves_documentos(aceptados)
+        contabilizados = verificar_contabilizados(
+            self._api_get, rut, claves, None, self.TIPO_DTE_A_INTERNO, workers=self.workers,
+            fechas=[dte.get('fechaEmision') for dte in aceptados],
+            cache=get_cache_contabilizados(),
+        )
         
-        resultado['total_pendientes'] = len(resultado['pendientes'])
-        return resultado
+        return self._armar_por_contabilizar(config, rut, aceptados, claves, contabilizados)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # REPORTE COMPLETO
@@ -426,28 +675,17 @@ class SkualoControl:
             - contabilizar: Resultado de documentos_por_contabilizar
             - resumen: Resumen ejecutivo con totales
         """
-        config = cargar_config(rut)
+        # Un solo contexto: config y /sii/dte/recibidos se leen una vez
+        ctx = self._contexto(rut)
+        config = ctx.config
         if not config:
             return None
         
-        bancos = self.movimientos_bancarios_pendientes(rut)
-        aprobar = self.documentos_por_aprobar_sii(rut)
-        contabilizar = self.documentos_por_contabilizar(rut)
+        bancos = self.movimientos_bancarios_pendientes(rut, contexto=ctx)
+        aprobar = self.documentos_por_aprobar_sii(rut, contexto=ctx)
+        contabilizar = self.documentos_por_contabilizar(rut, contexto=ctx)
         
-        return {
-            'empresa': config['nombre'],
-            'rut': rut,
-            'fecha': datetime.now().isoformat(),
-            'bancos': bancos,
-            'aprobar': aprobar,
-            'contabilizar': contabilizar,
-            'resumen': {
-                'movimientos_sin_conciliar': bancos['total_sin_conciliar'] if bancos else 0,
-                'documentos_por_aprobar': aprobar['total_pendientes'] if aprobar else 0,
-                'documentos_por_contabilizar': contabilizar['total_pendientes'] if contabilizar else 0,
-                'documentos_contabilizados': contabilizar['ya_contabilizados'] if contabilizar else 0,
-            }
-        }
+        return self._armar_reporte(config, rut, bancos, aprobar, contabilizar)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # GENERAR BALANCE EXCEL
@@ -465,12 +703,6 @@ class SkualoControl:
         Returns:
             Ruta del archivo Excel generado o None si falla
         """
-        try:
-            import pandas as pd
-            from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        except ImportError:
-            raise ImportError("Requiere pandas y openpyxl: pip install pandas openpyxl")
-        
         config = cargar_config(rut)
         if not config:
             return None
@@ -479,145 +711,21 @@ class SkualoControl:
             periodo = datetime.now().strftime('%Y%m')
         
         # Calcular fecha de corte
-        año = int(periodo[:4])
-        mes = int(periodo[4:6])
-        import calendar
-        ultimo_dia = calendar.monthrange(año, mes)[1]
-        fecha_corte = f'{año}-{mes:02d}-{ultimo_dia:02d}'
+        fecha_corte = self._fecha_corte(periodo)
         
-        # Obtener balance
-        balance = self._api_get(rut, f'/contabilidad/reportes/balancetributario/{periodo}')
+        # Obtener balance (caché local para períodos cerrados)
+        balance = obtener_balance(self._api_get, rut, periodo)
         if not balance:
             return None
         
-        # Crear Excel
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        nombre_empresa = config['nombre'].replace(' ', '_')[:20]
-        filename = self.output_dir / f'Balance_{nombre_empresa}_{periodo}_{timestamp}.xlsx'
+        cuentas_a_procesar = self._cuentas_balance(balance)
         
-        # Estilos
-        header_fill = PatternFill(start_color='1F4E79', end_color='1F4E79', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF')
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
+        # Fase de red: análisis de todas las cuentas en paralelo, antes de escribir
+        analisis_por_cuenta = obtener_analisis_cuentas(
+            self._api_get, rut, [c.get('idCuenta', '') for c in cuentas_a_procesar], fecha_corte
         )
         
-        def sanitize_sheet_name(codigo, nombre):
-            name = f"{codigo} {nombre}"
-            for char in ['\\', '/', '*', '?', '[', ']', ':']:
-                name = name.replace(char, '')
-            return name[:31]
-        
-        # DataFrame del balance
-        df_balance = pd.DataFrame(balance)
-        columnas = {
-            'idCuenta': 'Código',
-            'cuenta': 'Cuenta',
-            'tipo': 'Tipo',
-            'debe': 'Debe',
-            'haber': 'Haber',
-            'saldo': 'Saldo'
-        }
-        df_balance = df_balance.rename(columns=columnas)
-        cols_mostrar = [c for c in ['Código', 'Cuenta', 'Tipo', 'Debe', 'Haber', 'Saldo'] if c in df_balance.columns]
-        df_balance = df_balance[cols_mostrar]
-        df_balance['Ver Detalle'] = ''
-        
-        # Cuentas a procesar
-        cuentas_con_mov = [c for c in balance if c.get('debe', 0) != 0 or c.get('haber', 0) != 0 or c.get('saldo', 0) != 0]
-        cuentas_a_procesar = cuentas_con_mov if cuentas_con_mov else balance
-        
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            df_balance.to_excel(writer, sheet_name='Balance Tributario', index=False)
-            ws_balance = writer.sheets['Balance Tributario']
-            
-            # Formato encabezados
-            for col in range(1, len(df_balance.columns) + 1):
-                cell = ws_balance.cell(row=1, column=col)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center')
-                cell.border = border
-            
-            # Formato datos
-            for row in range(2, len(df_balance) + 2):
-                for col in range(1, len(df_balance.columns) + 1):
-                    cell = ws_balance.cell(row=row, column=col)
-                    cell.border = border
-                    if col >= 4 and col <= 6:
-                        cell.number_format = '#,##0'
-                        cell.alignment = Alignment(horizontal='right')
-            
-            # Ancho columnas
-            ws_balance.column_dimensions['A'].width = 12
-            ws_balance.column_dimensions['B'].width = 40
-            ws_balance.column_dimensions['C'].width = 12
-            ws_balance.column_dimensions['D'].width = 15
-            ws_balance.column_dimensions['E'].width = 15
-            ws_balance.column_dimensions['F'].width = 15
-            ws_balance.column_dimensions['G'].width = 12
-            
-            # Procesar cuentas
-            cuentas_procesadas = 0
-            for cuenta in cuentas_a_procesar:
-                codigo = cuenta.get('idCuenta', '')
-                nombre = cuenta.get('cuenta', '')
-                
-                analisis = self._api_get(rut, f'/contabilidad/reportes/analisisporcuenta/{codigo}?fechaCorte={fecha_corte}&soloPendientes=false')
-                if not analisis:
-                    continue
-                
-                movimientos = [m for m in analisis if m.get('saldo', 0) != 0 or m.get('valor', 0) != 0]
-                if not movimientos:
-                    continue
-                
-                sheet_name = sanitize_sheet_name(codigo, nombre)
-                df_cuenta = pd.DataFrame(movimientos)
-                
-                col_rename = {
-                    'comprobante': 'Comp',
-                    'idTipoDoc': 'Tipo',
-                    'numDoc': 'N° Doc',
-                    'auxiliar': 'Auxiliar',
-                    'emision': 'Emisión',
-                    'vencimiento': 'Vencimiento',
-                    'valor': 'Valor',
-                    'saldo': 'Saldo',
-                    'glosa': 'Glosa'
-                }
-                df_cuenta = df_cuenta.rename(columns=col_rename)
-                cols_cuenta = [c for c in ['Comp', 'Tipo', 'N° Doc', 'Auxiliar', 'Emisión', 'Vencimiento', 'Valor', 'Saldo', 'Glosa'] 
-                              if c in df_cuenta.columns]
-                df_cuenta = df_cuenta[cols_cuenta]
-                
-                for col in ['Emisión', 'Vencimiento']:
-                    if col in df_cuenta.columns:
-                        df_cuenta[col] = df_cuenta[col].apply(lambda x: str(x)[:10] if x else '')
-                
-                df_cuenta.to_excel(writer, sheet_name=sheet_name, index=False)
-                
-                ws_cuenta = writer.sheets[sheet_name]
-                for col in range(1, len(df_cuenta.columns) + 1):
-                    cell = ws_cuenta.cell(row=1, column=col)
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.border = border
-                
-                # Hipervínculo
-                for row in range(2, len(df_balance) + 2):
-                    if ws_balance.cell(row=row, column=1).value == codigo:
-                        cell_link = ws_balance.cell(row=row, column=7)
-                        cell_link.value = 'Ver Detalle'
-                        cell_link.hyperlink = f"#'{sheet_name}'!A1"
-                        cell_link.font = Font(color='0563C1', underline='single')
-                        break
-                
-                cuentas_procesadas += 1
-        
-        return str(filename)
+        return self._escribir_balance_excel(config, periodo, balance, cuentas_a_procesar, analisis_por_cuenta)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # MÉTODOS DE FORMATO PARA BOT
@@ -637,33 +745,4 @@ class SkualoControl:
         if not reporte:
             return f"❌ No hay configuración para {rut}"
         
-        r = reporte['resumen']
-        fecha = datetime.now().strftime('%d/%m/%Y %H:%M')
-        
-        texto = f"""
-📊 *REPORTE DE CONTROL*
-_{reporte['empresa']}_
-_{fecha}_
-
-🏦 *Movimientos sin conciliar:* {r['movimientos_sin_conciliar']}
-📄 *Docs por aprobar SII:* {r['documentos_por_aprobar']}
-📋 *Docs por contabilizar:* {r['documentos_por_contabilizar']}
-✅ *Docs contabilizados:* {r['documentos_contabilizados']}
-"""
-        
-        # Detalle de pendientes de aprobar
-        if reporte['aprobar'] and reporte['aprobar']['pendientes']:
-            texto += "\n*📄 Pendientes de aprobar:*\n"
-            for doc in reporte['aprobar']['pendientes'][:5]:
-                texto += f"  • {doc['emisor'][:20]} - ${doc['monto']:,.0f} ({doc['dias_restantes']}d)\n"
-        
-        # Detalle de pendientes de contabilizar
-        if reporte['contabilizar'] and reporte['contabilizar']['pendientes']:
-            texto += "\n*📋 Pendientes de contabilizar:*\n"
-            for doc in reporte['contabilizar']['pendientes'][:5]:
-                texto += f"  • {doc['emisor'][:20]} - ${doc['monto']:,.0f}\n"
-            if len(reporte['contabilizar']['pendientes']) > 5:
-                texto += f"  _...y {len(reporte['contabilizar']['pendientes']) - 5} más_\n"
-        
-        return texto
-
+        return self._texto_telegram(reporte)
@@ -0,0 +1,344 @@
+"""
+Skualo Control asíncrono - SkualoControl para bots y webhooks asyncio.
+
+AsyncSkualoControl tiene los mismos controles que SkualoControl, como
+corrutinas, sobre un cliente httpx.AsyncClient. Así un handler async
+(bot de Telegram, webhook) no bloquea su event loop esperando a la API.
+
+Dentro de cada control todas las llamadas se lanzan a la vez: las cuentas
+bancarias, las páginas de cada endpoint, los libros de compras y los
+análisis por cuenta. reportes_completos() hace lo mismo con varias
+empresas. La concurrencia real la limitan:
+
+    SKUALO_ASYNC_MAX=16           # Requests simultáneos en total
+    SKUALO_ASYNC_MAX_EMPRESA=6    # Máximo de requests simultáneos por empresa (tenant)
+
+El límite por empresa es adaptativo (skualo.trafico): parte en el máximo,
+se reduce a la mitad con cada 429/503 y vuelve a subir con las respuestas
+OK. Los requests pasan además por el límite de tasa global (SKUALO_RATE),
+los reintentos con backoff y el circuit breaker por empresa, igual que
+SkualoControl.
+
+El armado de los resultados es el de SkualoControl (skualo.control.ControlBase),
+así que ambas clases entregan lo mismo. Con sincronización incremental
+(SKUALO_DTE_INCREMENTAL / SKUALO_BANCO_INCREMENTAL) la lógica de
+skualo.sincronizacion corre en un hilo y sus requests pasan igual por el
+cliente asíncrono y sus semáforos. La configuración de la empresa y las
+cachés locales (SQLite) también se leen en un hilo (asyncio.to_thread),
+para no bloquear el event loop.
+
+Requiere httpx (opcional):
+    pip install httpx
+
+Uso:
+    from skualo.control_async import AsyncSkualoControl
+
+    async with AsyncSkualoControl() as ctrl:
+        reporte = await ctrl.reporte_completo('77285542-7')
+        reportes = await ctrl.reportes_completos(['77285542-7', '77949039-4'])
+        archivo = await ctrl.generar_balance_excel('77285542-7', '202511')
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from common.entorno import env_int
+
+from .api import mapear_async, paginar_async
+from .cache import get_cache_contabilizados
+from .config import cargar_config
+from .control import ControlBase
+from .documentos import verificar_contabilizados_async
+from .reportes import obtener_analisis_cuentas_async, obtener_balance_async
+from .trafico import (ApiSkualoNoDisponible, ConcurrenciaAdaptativaAsync, ControlTrafico,
+                      cuerpo_json, get_bucket, segundos_retry_after)
+from . import sincronizacion
+
+MAX_CONCURRENCIA = env_int('SKUALO_ASYNC_MAX', 16)
+MAX_POR_EMPRESA = env_int('SKUALO_ASYNC_MAX_EMPRESA', 6)
+TIMEOUT = 30
+
+
+def _importar_httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError("AsyncSkualoControl requiere httpx: pip install httpx")
+    return httpx
+
+
+class AsyncSkualoControl(ControlBase):
+    """
+    Controles de Skualo como corrutinas (httpx + asyncio).
+
+    Ejemplo:
+        async with AsyncSkualoControl() as ctrl:
+            texto = await ctrl.formato_reporte_telegram('77285542-7')
+    """
+
+    def __init__(self, token: str = None, workers: int = None, incremental: bool = None,
+                 max_concurrencia: int = None, max_por_empresa: int = None, cliente=None):
+        """
+        Inicializa el controlador.
+
+        Args:
+            token: Token de API de Skualo (default SKUALO_API_TOKEN)
+            workers: Páginas por lote cuando la API no informa el total
+                     (default SKUALO_PAGE_WORKERS)
+            incremental: Sincronización incremental (ver SkualoControl)
+            max_concurrencia: Requests simultáneos en total (default SKUALO_ASYNC_MAX)
+            max_por_empresa: Máximo de requests simultáneos por empresa; el límite
+                             efectivo se adapta a los 429 (default SKUALO_ASYNC_MAX_EMPRESA)
+            cliente: httpx.AsyncClient a reutilizar (no se cierra al salir).
+                     Si no se entrega, se crea uno en el primer request.
+        """
+        super().__init__(token, workers, incremental)
+        self.max_concurrencia = max(1, max_concurrencia or MAX_CONCURRENCIA)
+        self.max_por_empresa = max(1, max_por_empresa or MAX_POR_EMPRESA)
+        self._cliente = cliente
+        self._cliente_propio = cliente is None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._traficos: Dict[str, ControlTrafico] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+
+    async def cerrar(self):
+        """Cierra el cliente HTTP (si lo creó este controlador)."""
+        if self._cliente is not None and self._cliente_propio:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def _get_cliente(self):
+        if self._cliente is None:
+            httpx = _importar_httpx()
+            self._cliente = httpx.AsyncClient(
+                timeout=TIMEOUT,
+                limits=httpx.Limits(max_connections=self.max_concurrencia,
+                                    max_keepalive_connections=self.max_concurrencia),
+            )
+        return self._cliente
+
+    async def _usar_loop(self):
+        """
+        Asocia el controlador al event loop en uso.
+
+        Los semáforos y límites por empresa (y el cliente propio) quedan
+        ligados a un loop; si el controlador se usa desde otro (ej: varios
+        asyncio.run), se recrean y el cliente propio anterior se cierra.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+            self._traficos = {}
+            if self._cliente_propio and self._cliente is not None:
+                anterior, self._cliente = self._cliente, None
+                try:
+                    await anterior.aclose()
+                except RuntimeError:
+                    # Conexiones de un loop ya cerrado: no se pueden cerrar desde este
+                    pass
+
+    async def _trafico(self, rut: str):
+        """Semáforo global y control de tráfico de la empresa."""
+        await self._usar_loop()
+        trafico = self._traficos.get(rut)
+        if trafico is None:
+            trafico = self._traficos[rut] = ControlTrafico(
+                rut, get_bucket(), ConcurrenciaAdaptativaAsync(self.max_por_empresa)
+            )
+        return self._semaforo, trafico
+
+    async def _api_get(self, rut: str, endpoint: str, params: dict = None,
+                       estricto: bool = False) -> Optional[Dict]:
+        """
+        Realiza una llamada GET a la API (límites de concurrencia y tasa, reintentos).
+
+        Retorna None si el recurso no existe (404/4xx); lanza
+        ApiSkualoNoDisponible si la API sigue fallando tras los reintentos.
+        Con `estricto` ver skualo.trafico.get_json.
+        """
+        httpx = _importar_httpx()
+        semaforo, trafico = await self._trafico(rut)
+        cliente = self._get_cliente()
+        intento = 0
+        while True:
+            espera, prueba = trafico.antes()
+            try:
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                error = None
+                await trafico.concurrencia.adquirir()
+                try:
+                    async with semaforo:
+                        r = await cliente.get(self._url(rut, endpoint), headers=self._headers(),
+                                              params=params, timeout=TIMEOUT)
+                    status, retry_after = r.status_code, segundos_retry_after(r.headers.get('Retry-After'))
+                except httpx.TransportError as e:
+                    status, retry_after, error = None, None, e
+                finally:
+                    await trafico.concurrencia.liberar()
+
+                try:
+                    reintentar_en = trafico.despues(status, retry_after, intento, prueba)
+                except ApiSkualoNoDisponible as e:
+                    raise e from error
+                finally:
+                    prueba = False  # despues ya entregó la prueba
+            finally:
+                if prueba:
+                    # Prueba del circuito semiabierto cortada por una excepción (ej: cancelación)
+                    trafico.circuito.liberar()
+            if reintentar_en is None:
+                break
+            await asyncio.sleep(reintentar_en)
+            intento += 1
+
+        url = self._url(rut, endpoint)
+        return cuerpo_json(r.is_success, status, r.json, url, estricto)
+
+    def estadisticas(self) -> List[Dict]:
+        """Contadores por empresa: límite de concurrencia actual, OK, 429/503, errores, reintentos."""
+        return [trafico.estadisticas() for trafico in self._traficos.values()]
+
+    def _api_get_hilo(self, rut: str, endpoint: str, params: dict = None,
+                      estricto: bool = False) -> Optional[Dict]:
+        """_api_get para código síncrono que corre en un hilo (asyncio.to_thread)."""
+        return asyncio.run_coroutine_threadsafe(
+            self._api_get(rut, endpoint, params, estricto), self._loop
+        ).result()
+
+    async def _en_hilo(self, fn, *args, **kwargs):
+        """Ejecuta lógica síncrona de skualo en un hilo, con requests por _api_get_hilo."""
+        await self._usar_loop()
+        return await asyncio.to_thread(fn, self._api_get_hilo, *args, **kwargs)
+
+    async def _api_get_all(self, rut: str, endpoint: str, params: dict = None) -> List:
+        """Obtiene todos los registros paginados de un endpoint."""
+        return await paginar_async(self._api_get, rut, endpoint, params, workers=self.workers)
+
+    async def _movimientos_banco(self, rut: str, codigo: str) -> List:
+        """Movimientos de una cuenta: incrementales si está activo, si no historial completo."""
+        incremental = sincronizacion.BANCO_INCREMENTAL if self.incremental is None else self.incremental
+        if incremental:
+            return await self._en_hilo(sincronizacion.obtener_movimientos_banco, rut, codigo,
+                                       incremental=True, workers=self.workers)
+        return await self._api_get_all(rut, f'/bancos/{codigo}')
+
+    async def _dtes_recibidos(self, rut: str) -> List:
+        """DTEs recibidos: sincronización incremental si está activa, si no descarga completa."""
+        incremental = sincronizacion.INCREMENTAL if self.incremental is None else self.incremental
+        if incremental:
+            return await self._en_hilo(sincronizacion.obtener_dtes_recibidos, rut,
+                                       incremental=True, workers=self.workers)
+        return await self._api_get_all(rut, sincronizacion.ENDPOINT_DTES)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # CONTROLES (mismos resultados que SkualoControl)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    async def movimientos_bancarios_pendientes(self, rut: str) -> Optional[Dict]:
+        """Movimientos bancarios pendientes de conciliar (ver SkualoControl)."""
+        config = await asyncio.to_thread(cargar_config, rut)
+        if not config:
+            return None
+        return await self._movimientos(config, rut)
+
+    async def documentos_por_aprobar_sii(self, rut: str) -> Optional[Dict]:
+        """Documentos pendientes de aprobar en el SII (ver SkualoControl)."""
+        config = await asyncio.to_thread(cargar_config, rut)
+        if not config:
+            return None
+        return self._armar_por_aprobar(config, rut, await self._dtes_recibidos(rut))
+
+    async def documentos_por_contabilizar(self, rut: str) -> Optional[Dict]:
+        """Documentos aceptados pendientes de contabilizar (ver SkualoControl)."""
+        config = await asyncio.to_thread(cargar_config, rut)
+        if not config:
+            return None
+        return await self._por_contabilizar(config, rut, await self._dtes_recibidos(rut))
+
+    async def _movimientos(self, config: Dict, rut: str) -> Dict:
+        cuentas = self._cuentas_activas(config)
+        movimientos_por_cuenta = await mapear_async(lambda c: self._movimientos_banco(rut, c['codigo']), cuentas)
+        return self._armar_movimientos(config, rut, cuentas, movimientos_por_cuenta)
+
+    async def _por_contabilizar(self, config: Dict, rut: str, dtes: List[Dict]) -> Dict:
+        aceptados = self._dtes_aceptados(dtes)
+        claves = self._claves_documentos(aceptados)
+        contabilizados = await verificar_contabilizados_async(
+            self._api_get, rut, claves, None, self.TIPO_DTE_A_INTERNO,
+            fechas=[dte.get('fechaEmision') for dte in aceptados],
+            cache=await asyncio.to_thread(get_cache_contabilizados),
+        )
+        return self._armar_por_contabilizar(config, rut, aceptados, claves, contabilizados)
+
+    async def reporte_completo(self, rut: str) -> Optional[Dict]:
+        """
+        Reporte completo con los 3 controles (ver SkualoControl).
+
+        Los DTEs recibidos se descargan una vez; la verificación de
+        contabilizados parte apenas llegan, mientras siguen bajando los
+        movimientos bancarios.
+        """
+        config = await asyncio.to_thread(cargar_config, rut)
+        if not config:
+            return None
+
+        async def documentos():
+            dtes = await self._dtes_recibidos(rut)
+            return dtes, await self._por_contabilizar(config, rut, dtes)
+
+        bancos, (dtes, contabilizar) = await asyncio.gather(self._movimientos(config, rut), documentos())
+        aprobar = self._armar_por_aprobar(config, rut, dtes)
+
+        return self._armar_reporte(config, rut, bancos, aprobar, contabilizar)
+
+    async def reportes_completos(self, ruts: List[str]) -> List[Optional[Dict]]:
+        """Reporte completo de varias empresas a la vez, en el orden de `ruts`."""
+        return await mapear_async(self.reporte_completo, ruts)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # GENERAR BALANCE EXCEL
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    async def generar_balance_excel(self, rut: str, periodo: str = None) -> Optional[str]:
+        """
+        Excel con el Balance Tributario y Análisis por Cuenta (ver SkualoControl).
+
+        La descarga es asíncrona; la escritura del Excel corre en un hilo
+        para no bloquear el event loop.
+        """
+        config = await asyncio.to_thread(cargar_config, rut)
+        if not config:
+            return None
+
+        if not periodo:
+            periodo = datetime.now().strftime('%Y%m')
+        fecha_corte = self._fecha_corte(periodo)
+
+        balance = await obtener_balance_async(self._api_get, rut, periodo)
+        if not balance:
+            return None
+
+        cuentas_a_procesar = self._cuentas_balance(balance)
+        analisis_por_cuenta = await obtener_analisis_cuentas_async(
+            self._api_get, rut, [c.get('idCuenta', '') for c in cuentas_a_procesar], fecha_corte
+        )
+
+        return await asyncio.to_thread(
+            self._escribir_balance_excel, config, periodo, balance, cuentas_a_procesar, analisis_por_cuenta
+        )
+
+    async def formato_reporte_telegram(self, rut: str) -> str:
+        """Reporte formateado para Telegram (Markdown)."""
+        reporte = await self.reporte_completo(rut)
+        if not reporte:
+            return f"❌ No hay configuración para {rut}"
+        return self._texto_telegram(reporte)
@@ -0,0 +1,323 @@
+"""
+Verificación masiva de documentos contabilizados.
+
+En vez de consultar GET /documentos/{tipo}/{folio} por cada DTE aceptado
+(N+1 llamadas), se descarga el libro de compras de los períodos
+involucrados una sola vez por empresa y se arma un índice en memoria
+(tipo_interno, folio, rut_emisor). Cada DTE se verifica contra el índice
+en O(1).
+
+Para los DTEs emitidos en los últimos SKUALO_LIBRO_MESES meses se
+descargan los libros desde el mes de emisión hasta el mes actual: si el DTE
+no aparece en ninguno, no está contabilizado, sin más consultas. Solo se
+confirman contra /documentos/{tipo}/{folio} (la fuente autoritativa):
+    - los DTEs más antiguos, cuyo libro se revisa solo en el mes de emisión
+      y el siguiente (pueden estar contabilizados en un período no cubierto);
+    - los DTEs cuyo libro de algún período no se pudo descargar;
+    - los que calzan solo con una fila del libro sin RUT de emisor (mismo
+      tipo y folio, pero podría ser el documento de otro proveedor).
+
+Configuración (.env, opcional):
+    SKUALO_LIBRO_MESES=3          # Meses (incluido el actual) con libro completo hasta hoy
+
+Uso:
+    from skualo.documentos import verificar_contabilizados, periodos_desde_fechas
+
+    claves = [(tipo_interno, folio, rut_emisor), ...]
+    periodos = periodos_desde_fechas([d['fechaEmision'] for d in dtes])
+    flags = verificar_contabilizados(api_get, rut, claves, periodos, TIPO_DTE_A_INTERNO)
+
+Con `cache` (skualo.cache.ContabilizadosCache) las claves ya confirmadas
+en corridas anteriores no se vuelven a consultar.
+
+verificar_contabilizados_async hace lo mismo con api_get asíncrono
+(skualo.control_async).
+"""
+
+import asyncio
+import re
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from common.entorno import env_int
+
+from .api import mapear_async, mapear_concurrente
+
+LIBRO_MESES = env_int('SKUALO_LIBRO_MESES', 3)
+
+# Nombres de campo posibles en las filas del libro de compras
+CAMPOS_FOLIO = ('numDoc', 'NumDoc', 'folio', 'Folio', 'numero')
+CAMPOS_TIPO = ('idTipoDoc', 'IdTipoDoc', 'idTipoDocumento', 'IdTipoDocumento', 'tipoDoc')
+CAMPOS_RUT = ('rutEmisor', 'RutEmisor', 'rut', 'Rut', 'idAuxiliar', 'IdAuxiliar', 'rutProveedor')
+
+
+def normalizar_rut(rut) -> str:
+    """Deja solo dígitos y K (sin puntos ni guión) para comparar RUTs."""
+    if not rut:
+        return ''
+    return re.sub(r'[^0-9K]', '', str(rut).upper())
+
+
+def normalizar_folio(folio) -> str:
+    if folio is None:
+        return ''
+    texto = str(folio).strip()
+    try:
+        return str(int(float(texto)))
+    except ValueError:
+        return texto
+
+
+def _primer_valor(fila: dict, campos: Tuple[str, ...]):
+    for campo in campos:
+        valor = fila.get(campo)
+        if valor not in (None, ''):
+            return valor
+    return None
+
+
+class IndiceDocumentos:
+    """
+    Índice en memoria de documentos contabilizados.
+
+    Las filas que traen RUT del emisor se indexan por (tipo, folio, rut);
+    las que no lo traen, por (tipo, folio). contiene() exige el RUT: una
+    fila sin emisor no basta para dar un DTE por contabilizado
+    (coincide_sin_emisor() permite derivarlo a /documentos).
+
+    `periodos` son los períodos YYYYMM cuyo libro se indexó completo.
+    """
+
+    def __init__(self):
+        self._claves = set()
+        self._sin_emisor = set()
+        self.periodos = set()
+
+    def __len__(self):
+        return len(self._claves) + len(self._sin_emisor)
+
+    def agregar(self, tipo_interno: str, folio, rut_emisor: str = ''):
+        tipo = str(tipo_interno or '').upper()
+        folio = normalizar_folio(folio)
+        rut = normalizar_rut(rut_emisor)
+        if rut:
+            self._claves.add((tipo, folio, rut))
+        else:
+            self._sin_emisor.add((tipo, folio))
+
+    def contiene(self, tipo_interno: str, folio, rut_emisor: str = '') -> bool:
+        tipo = str(tipo_interno or '').upper()
+        return (tipo, normalizar_folio(folio), normalizar_rut(rut_emisor)) in self._claves
+
+    def coincide_sin_emisor(self, tipo_interno: str, folio, rut_emisor: str = '') -> bool:
+        """True si hay una fila con el mismo tipo y folio pero sin RUT de emisor."""
+        return (str(tipo_interno or '').upper(), normalizar_folio(folio)) in self._sin_emisor
+
+    def agregar_libro(self, filas: Iterable[dict], tipo_dte_a_interno: Dict[int, str]):
+        """Indexa las filas del libro de compras de un período."""
+        for fila in filas:
+            if not isinstance(fila, dict):
+                continue
+            folio = _primer_valor(fila, CAMPOS_FOLIO)
+            tipo = _primer_valor(fila, CAMPOS_TIPO)
+            if folio is None or tipo is None:
+                continue
+            # El libro puede traer el código SII (33) o el tipo interno (FACE)
+            if isinstance(tipo, int) or str(tipo).isdigit():
+                tipo = tipo_dte_a_interno.get(int(tipo), 'FACE')
+            self.agregar(tipo, folio, _primer_valor(fila, CAMPOS_RUT) or '')
+
+
+def _año_mes(fecha) -> Optional[Tuple[int, int]]:
+    texto = str(fecha or '')[:7]
+    if len(texto) < 7 or texto[4] != '-':
+        return None
+    try:
+        return int(texto[:4]), int(texto[5:7])
+    except ValueError:
+        return None
+
+
+def _periodos_entre(año: int, mes: int, meses: int) -> List[str]:
+    """`meses` períodos YYYYMM consecutivos a partir de año/mes."""
+    return [f'{año + (mes + i - 1) // 12}{(mes + i - 1) % 12 + 1:02d}' for i in range(meses)]
+
+
+def periodos_hasta_hoy(fecha, hoy: date = None) -> Optional[List[str]]:
+    """Períodos desde el mes de `fecha` hasta el mes actual (None si la fecha no es válida)."""
+    año_mes = _año_mes(fecha)
+    if año_mes is None:
+        return None
+    hoy = hoy or date.today()
+    meses = (hoy.year - año_mes[0]) * 12 + hoy.month - año_mes[1] + 1
+    return _periodos_entre(*año_mes, max(meses, 1))
+
+
+def periodos_desde_fechas(fechas: Iterable, meses_siguientes: int = 1,
+                          meses_completos: int = None, hoy: date = None) -> List[str]:
+    """
+    Períodos YYYYMM a revisar en el libro de compras.
+
+    Para fechas de los últimos `meses_completos` meses (default
+    SKUALO_LIBRO_MESES) incluye todos los meses hasta el actual; para las
+    anteriores, el mes de la fecha y los `meses_siguientes` meses
+    posteriores, porque un DTE emitido a fin de mes suele contabilizarse
+    el mes siguiente.
+    """
+    if meses_completos is None:
+        meses_completos = LIBRO_MESES
+    periodos = set()
+    for fecha in fechas:
+        hasta_hoy = periodos_hasta_hoy(fecha, hoy)
+        if hasta_hoy is None:
+            continue
+        if len(hasta_hoy) <= meses_completos:
+            periodos.update(hasta_hoy)
+        else:
+            periodos.update(_periodos_entre(*_año_mes(fecha), meses_siguientes + 1))
+    return sorted(periodos)
+
+
+def construir_indice(api_get: Callable, rut: str, periodos: Iterable[str],
+                     tipo_dte_a_interno: Dict[int, str], workers: int = None) -> IndiceDocumentos:
+    """Descarga el libro de compras de cada período (en paralelo) y arma el índice."""
+    def obtener_libro(periodo):
+        return api_get(rut, f'/contabilidad/reportes/librocompras/{periodo}')
+
+    periodos = list(periodos)
+    libros = mapear_concurrente(obtener_libro, periodos, workers)
+    return _indice_de_libros(periodos, libros, tipo_dte_a_interno)
+
+
+def _indice_de_libros(periodos: List[str], libros: Iterable,
+                      tipo_dte_a_interno: Dict[int, str]) -> IndiceDocumentos:
+    indice = IndiceDocumentos()
+    for periodo, libro in zip(periodos, libros):
+        if libro is None:
+            continue  # No se pudo descargar: el período no cuenta como revisado
+        filas = libro.get('items', []) if isinstance(libro, dict) else libro
+        indice.agregar_libro(filas, tipo_dte_a_interno)
+        indice.periodos.add(periodo)
+    return indice
+
+
+def _clasificar(indice: IndiceDocumentos, claves: List[Tuple[str, object, str]],
+                por_verificar: List[int], fechas: Optional[List],
+                resultado: List[bool]) -> List[int]:
+    """
+    Marca en `resultado` los DTEs encontrados en el índice y retorna los que
+    hay que confirmar contra /documentos.
+
+    Un DTE que no está en el libro queda pendiente sin consultar /documentos
+    si se revisaron todos los libros desde su mes de emisión hasta hoy.
+    """
+    faltantes = []
+    for i in por_verificar:
+        if indice.contiene(*claves[i]):
+            resultado[i] = True
+            continue
+        revisar = periodos_hasta_hoy(fechas[i]) if fechas else None
+        completo = revisar is not None and indice.periodos.issuperset(revisar)
+        if not completo or indice.coincide_sin_emisor(*claves[i]):
+            faltantes.append(i)
+    return faltantes
+
+
+def verificar_contabilizados(api_get: Callable, rut: str,
+                             claves: List[Tuple[str, object, str]],
+                             periodos: Optional[Iterable[str]],
+                             tipo_dte_a_interno: Dict[int, str],
+                             workers: int = None,
+                             indice: Optional[IndiceDocumentos] = None,
+                             fechas: Optional[List] = None,
+                             cache=None) -> List[bool]:
+    """
+    Indica, para cada (tipo_interno, folio, rut_emisor), si ya está contabilizado.
+
+    Args:
+        api_get: Función (rut, endpoint, params=None) -> dict | None
+        rut: RUT de la empresa
+        claves: Lista de (tipo_interno, folio, rut_emisor) a verificar
+        periodos: Períodos YYYYMM del libro de compras a indexar
+                  (None = calcularlos desde `fechas` de los no cacheados)
+        tipo_dte_a_interno: Mapeo de código SII a tipo interno Skualo
+        workers: Requests simultáneos (default SKUALO_PAGE_WORKERS)
+        indice: Índice ya construido (evita volver a descargar el libro)
+        fechas: Fecha de emisión de cada clave (mismo orden que `claves`); sin
+                ellas, todo DTE que no esté en el libro se confirma contra /documentos
+        cache: ContabilizadosCache; las claves ya confirmadas no se consultan
+               y las recién confirmadas se guardan
+
+    Returns:
+        Lista de bool en el mismo orden que `claves`
+    """
+    resultado = cache.filtrar_confirmados(rut, claves) if cache else [False] * len(claves)
+    por_verificar = [i for i, confirmado in enumerate(resultado) if not confirmado]
+    if not por_verificar:
+        return resultado
+
+    if periodos is None:
+        periodos = periodos_desde_fechas(fechas[i] for i in por_verificar) if fechas else []
+    if indice is None:
+        indice = construir_indice(api_get, rut, periodos, tipo_dte_a_interno, workers)
+
+    # Los que el libro no resuelve se confirman contra /documentos
+    faltantes = _clasificar(indice, claves, por_verificar, fechas, resultado)
+
+    def existe_documento(i):
+        tipo, folio, _ = claves[i]
+        return bool(api_get(rut, f'/documentos/{tipo}/{folio}'))
+
+    for i, existe in zip(faltantes, mapear_concurrente(existe_documento, faltantes, workers)):
+        resultado[i] = existe
+
+    if cache:
+        cache.marcar(rut, [claves[i] for i in por_verificar if resultado[i]])
+
+    return resultado
+
+
+async def verificar_contabilizados_async(api_get: Callable, rut: str,
+                                         claves: List[Tuple[str, object, str]],
+                                         periodos: Optional[Iterable[str]],
+                                         tipo_dte_a_interno: Dict[int, str],
+                                         indice: Optional[IndiceDocumentos] = None,
+                                         fechas: Optional[List] = None,
+                                         cache=None) -> List[bool]:
+    """
+    Como verificar_contabilizados, con api_get asíncrono.
+
+    Los libros de compras de todos los períodos, y luego los documentos
+    faltantes, se piden a la vez (el límite lo pone el cliente HTTP). La
+    caché SQLite se consulta en un hilo para no bloquear el event loop.
+    """
+    if cache:
+        resultado = await asyncio.to_thread(cache.filtrar_confirmados, rut, claves)
+    else:
+        resultado = [False] * len(claves)
+    por_verificar = [i for i, confirmado in enumerate(resultado) if not confirmado]
+    if not por_verificar:
+        return resultado
+
+    if periodos is None:
+        periodos = periodos_desde_fechas(fechas[i] for i in por_verificar) if fechas else []
+    if indice is None:
+        async def obtener_libro(periodo):
+            return await api_get(rut, f'/contabilidad/reportes/librocompras/{periodo}')
+
+        periodos = list(periodos)
+        indice = _indice_de_libros(periodos, await mapear_async(obtener_libro, periodos), tipo_dte_a_interno)
+
+    faltantes = _clasificar(indice, claves, por_verificar, fechas, resultado)
+
+    async def existe_documento(i):
+        tipo, folio, _ = claves[i]
+        return bool(await api_get(rut, f'/documentos/{tipo}/{folio}'))
+
+    for i, existe in zip(faltantes, await mapear_async(existe_documento, faltantes)):
+        resultado[i] = existe
+
+    if cache:
+        await asyncio.to_thread(cache.marcar, rut, [claves[i] for i in por_verificar if resultado[i]])
+
+    return resultado
@@ -0,0 +1,336 @@
+"""
+Descarga de reportes contables para la generación de Excel.
+
+Los generadores de balance separan la descarga (fase de red, en paralelo)
+de la escritura del Excel (fase local, secuencial): primero se obtienen
+todos los análisis por cuenta y recién después se abre el ExcelWriter.
+
+El detalle por cuenta puede salir de dos fuentes:
+    analisis    Una llamada a /analisisporcuenta/{idCuenta} por cuenta (default)
+    libromayor  Pocas llamadas a /libromayor por rangos de cuentas
+                (IdCuentaInicio/IdCuentaFin), agrupadas localmente por idCuenta.
+                Entrega movimientos contables del año hasta la fecha de corte
+                (no partidas abiertas), con saldo acumulado por cuenta. Las
+                cuentas de balance (clases 1 y 2) parten del saldo al 31 de
+                diciembre anterior (balance tributario de ese período).
+
+Configuración (.env, opcional):
+    SKUALO_ANALISIS_WORKERS=8     # Cuentas (o rangos) consultados en paralelo
+    SKUALO_DETALLE_FUENTE=analisis  # analisis | libromayor
+
+Uso:
+    from skualo.reportes import obtener_analisis_cuentas
+    analisis = obtener_analisis_cuentas(api_get, rut, codigos, '2025-11-30')
+    for codigo in codigos:
+        movimientos = analisis[codigo]
+
+Las funciones *_async son las mismas descargas con api_get asíncrono
+(skualo.control_async); todas las cuentas o rangos se piden a la vez.
+"""
+
+import asyncio
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlencode
+
+from common.entorno import env_int
+
+from .api import mapear_async, mapear_concurrente, paginar, paginar_async
+from .cache import get_cache_balances
+
+ANALISIS_WORKERS = env_int('SKUALO_ANALISIS_WORKERS', 8)
+DETALLE_FUENTE = (os.getenv('SKUALO_DETALLE_FUENTE') or 'analisis').strip().lower()
+
+
+def obtener_balance(api_get: Callable, rut: str, periodo: str, usar_cache: bool = True):
+    """
+    Balance tributario de un período, usando la caché local si está vigente.
+
+    Los períodos cerrados se sirven siempre desde la caché; los abiertos
+    se vuelven a pedir cuando vence SKUALO_BALANCE_TTL.
+    """
+    cache = get_cache_balances() if usar_cache else None
+    if cache:
+        balance = cache.obtener(rut, periodo)
+        if balance is not None:
+            return balance
+    balance = api_get(rut, f'/contabilidad/reportes/balancetributario/{periodo}')
+    if cache and balance:
+        cache.guardar(rut, periodo, balance)
+    return balance
+
+
+async def obtener_balance_async(api_get: Callable, rut: str, periodo: str, usar_cache: bool = True):
+    """Como obtener_balance, con api_get asíncrono (la caché SQLite se usa desde un hilo)."""
+    cache = await asyncio.to_thread(get_cache_balances) if usar_cache else None
+    if cache:
+        balance = await asyncio.to_thread(cache.obtener, rut, periodo)
+        if balance is not None:
+            return balance
+    balance = await api_get(rut, f'/contabilidad/reportes/balancetributario/{periodo}')
+    if cache and balance:
+        await asyncio.to_thread(cache.guardar, rut, periodo, balance)
+    return balance
+
+
+def obtener_balances(api_get: Callable, rut: str, periodos: Iterable[str],
+                     workers: int = None) -> List:
+    """Balances de varios períodos en paralelo (con caché), en el orden de `periodos`."""
+    if workers is None:
+        workers = ANALISIS_WORKERS
+    return mapear_concurrente(lambda periodo: obtener_balance(api_get, rut, periodo), periodos, workers)
+
+
+class MatrizBalances:
+    """
+    Balances de varios períodos como matriz cuenta × período (NumPy).
+
+    Se arma en una sola pasada sobre los balances; luego cada campo
+    (activos, pasivos, ...) es una matriz donde la fila es la cuenta
+    (en orden de código) y la columna el período. Los períodos sin balance
+    o las cuentas que no aparecen en un período quedan en 0.
+
+    Uso:
+        matriz = MatrizBalances(['Dic 2024', 'Nov 2025'], [balance_2024, balance_2025])
+        filas = matriz.filas(['1101001', '1102001'])
+        activos = matriz.valores['activos'][filas]     # (2 cuentas × 2 períodos)
+    """
+
+    CAMPOS = ('debitos', 'creditos', 'deudor', 'acreedor',
+              'activos', 'pasivos', 'perdidas', 'ganancias')
+
+    def __init__(self, periodos: List[str], balances: List[Optional[List[dict]]]):
+        import numpy as np
+
+        self.periodos = list(periodos)
+        self.codigos = sorted({c['idCuenta'] for b in balances if b for c in b})
+        self._fila = {codigo: i for i, codigo in enumerate(self.codigos)}
+        self.nombres: Dict[str, str] = {}
+        self.con_datos = [bool(b) for b in balances]
+
+        forma = (len(self.codigos), len(self.periodos))
+        self.valores = {campo: np.zeros(forma) for campo in self.CAMPOS}
+        for j, balance in enumerate(balances):
+            for cuenta in balance or []:
+                codigo = cuenta['idCuenta']
+                i = self._fila[codigo]
+                self.nombres.setdefault(codigo, cuenta.get('cuenta', ''))
+                for campo in self.CAMPOS:
+                    self.valores[campo][i, j] = cuenta.get(campo, 0) or 0
+
+    def __bool__(self):
+        return any(self.con_datos)
+
+    def filas(self, codigos: Iterable[str]) -> List[int]:
+        """Índices de fila de los códigos indicados."""
+        return [self._fila[c] for c in codigos]
+
+
+def endpoint_analisis(codigo: str, fecha_corte: str) -> str:
+    """Endpoint de análisis por cuenta (todas las partidas, no solo pendientes)."""
+    return f'/contabilidad/reportes/analisisporcuenta/{codigo}?fechaCorte={fecha_corte}&soloPendientes=false'
+
+
+def obtener_analisis_cuentas(api_get: Callable, rut: str, codigos: Iterable[str],
+                             fecha_corte: str, workers: int = None,
+                             fuente: str = None) -> Dict[str, Optional[List]]:
+    """
+    Obtiene el análisis por cuenta de varias cuentas en paralelo.
+
+    Args:
+        api_get: Función (rut, endpoint) -> list | None
+        rut: RUT de la empresa
+        codigos: Códigos de cuenta (idCuenta)
+        fecha_corte: Fecha de corte YYYY-MM-DD
+        workers: Requests simultáneos (default SKUALO_ANALISIS_WORKERS)
+        fuente: 'analisis' o 'libromayor' (default SKUALO_DETALLE_FUENTE)
+
+    Returns:
+        dict codigo -> análisis (None si la consulta falló), en el orden de `codigos`
+    """
+    codigos = list(codigos)
+    if workers is None:
+        workers = ANALISIS_WORKERS
+    if (fuente or DETALLE_FUENTE) == 'libromayor':
+        desde = f'{fecha_corte[:4]}-01-01'
+        return obtener_detalle_libro_mayor(api_get, rut, codigos, desde, fecha_corte, workers)
+    resultados = mapear_concurrente(
+        lambda codigo: api_get(rut, endpoint_analisis(codigo, fecha_corte)), codigos, workers
+    )
+    return dict(zip(codigos, resultados))
+
+
+async def obtener_analisis_cuentas_async(api_get: Callable, rut: str, codigos: Iterable[str],
+                                         fecha_corte: str,
+                                         fuente: str = None) -> Dict[str, Optional[List]]:
+    """Como obtener_analisis_cuentas, con api_get asíncrono."""
+    codigos = list(codigos)
+    if (fuente or DETALLE_FUENTE) == 'libromayor':
+        desde = f'{fecha_corte[:4]}-01-01'
+        return await obtener_detalle_libro_mayor_async(api_get, rut, codigos, desde, fecha_corte)
+
+    async def obtener(codigo):
+        return await api_get(rut, endpoint_analisis(codigo, fecha_corte))
+
+    return dict(zip(codigos, await mapear_async(obtener, codigos)))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LIBRO MAYOR (DETALLE EN BLOQUE)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+ENDPOINT_LIBRO_MAYOR = '/contabilidad/reportes/libromayor'
+
+
+def rangos_de_cuentas(codigos: Iterable[str]) -> List[tuple]:
+    """
+    Agrupa los códigos en rangos (inicio, fin), uno por clase de cuenta
+    (primer dígito: 1 activo, 2 pasivo, 3..9 resultado, etc.).
+    """
+    por_clase = defaultdict(list)
+    for codigo in codigos:
+        codigo = str(codigo)
+        if codigo:
+            por_clase[codigo[0]].append(codigo)
+    return [(min(grupo), max(grupo)) for _, grupo in sorted(por_clase.items())]
+
+
+def _fila_analisis(mov: dict, saldo: float) -> dict:
+    """Convierte una línea del libro mayor a la forma de una fila de análisis."""
+    debe = mov.get('montoDebe', 0) or 0
+    haber = mov.get('montoHaber', 0) or 0
+    return {
+        'fecha': mov.get('fecha'),
+        'comprobante': mov.get('comprobante'),
+        'numero': mov.get('comprobante'),
+        'idTipoDoc': mov.get('idTipoDoc'),
+        'tipo': mov.get('idTipoDoc'),
+        'numDoc': mov.get('numDoc'),
+        'idAuxiliar': mov.get('idAuxiliar'),
+        'auxiliar': mov.get('auxiliar'),
+        'emision': mov.get('emision'),
+        'vencimiento': mov.get('vencimiento'),
+        'glosa': mov.get('glosa'),
+        'debe': debe,
+        'haber': haber,
+        'valor': debe - haber,
+        'saldo': saldo,
+    }
+
+
+def obtener_detalle_libro_mayor(api_get: Callable, rut: str, codigos: Iterable[str],
+                                desde: str, hasta: str,
+                                workers: int = None) -> Dict[str, Optional[List]]:
+    """
+    Detalle por cuenta desde el libro mayor, con pocas llamadas en bloque.
+
+    Se pide un rango IdCuentaInicio/IdCuentaFin por clase de cuenta (en
+    paralelo) y las líneas se agrupan localmente por idCuenta, con saldo
+    acumulado (debe - haber) en orden de fecha. Las cuentas de balance
+    parten del saldo del balance tributario de diciembre del año anterior,
+    por lo que `desde` debe ser el 1 de enero.
+
+    Args:
+        api_get: Función (rut, endpoint) -> list | dict | None
+        rut: RUT de la empresa
+        codigos: Códigos de cuenta a incluir
+        desde: Fecha inicio YYYY-01-01
+        hasta: Fecha fin YYYY-MM-DD
+        workers: Rangos consultados en paralelo (default SKUALO_ANALISIS_WORKERS)
+
+    Returns:
+        dict codigo -> filas con forma de análisis (None si no hubo movimientos)
+    """
+    codigos = [str(c) for c in codigos]
+    if workers is None:
+        workers = ANALISIS_WORKERS
+
+    # El query va en el path para aceptar api_get con o sin `params`
+    def get_con_query(rut_, endpoint, params=None):
+        return api_get(rut_, f'{endpoint}?{urlencode(params or {})}')
+
+    def obtener_rango(rango):
+        return paginar(get_con_query, rut, ENDPOINT_LIBRO_MAYOR, _params_libro_mayor(rango, desde, hasta), workers=1)
+
+    lotes = mapear_concurrente(obtener_rango, rangos_de_cuentas(codigos), workers)
+    apertura = obtener_balance(api_get, rut, periodo_apertura(desde))
+    return _detalle_por_cuenta(codigos, lotes, saldos_apertura(apertura))
+
+
+async def obtener_detalle_libro_mayor_async(api_get: Callable, rut: str, codigos: Iterable[str],
+                                            desde: str, hasta: str) -> Dict[str, Optional[List]]:
+    """Como obtener_detalle_libro_mayor, con api_get asíncrono."""
+    codigos = [str(c) for c in codigos]
+
+    async def get_con_query(rut_, endpoint, params=None):
+        return await api_get(rut_, f'{endpoint}?{urlencode(params or {})}')
+
+    async def obtener_rango(rango):
+        return await paginar_async(get_con_query, rut, ENDPOINT_LIBRO_MAYOR,
+                                   _params_libro_mayor(rango, desde, hasta), workers=1)
+
+    lotes, apertura = await asyncio.gather(
+        mapear_async(obtener_rango, rangos_de_cuentas(codigos)),
+        obtener_balance_async(api_get, rut, periodo_apertura(desde)),
+    )
+    return _detalle_por_cuenta(codigos, lotes, saldos_apertura(apertura))
+
+
+def _params_libro_mayor(rango: tuple, desde: str, hasta: str) -> dict:
+    inicio, fin = rango
+    return {
+        'IdCuentaInicio': inicio,
+        'IdCuentaFin': fin,
+        'desde': desde,
+        'hasta': hasta,
+        'IdSucursal': 0,
+        'IncluyeAjusteTributario': 'false',
+    }
+
+
+# Clases de cuenta cuyo saldo se arrastra de un año a otro (activo, pasivo y patrimonio)
+CLASES_BALANCE = ('1', '2')
+
+
+def periodo_apertura(desde: str) -> str:
+    """Período YYYYMM del cierre anterior a `desde` (diciembre del año previo)."""
+    return f'{int(desde[:4]) - 1}12'
+
+
+def saldos_apertura(balance: Optional[List[dict]]) -> Dict[str, float]:
+    """
+    Saldo inicial (deudor - acreedor) de las cuentas de balance, desde el
+    balance tributario del cierre anterior. Las cuentas de resultado
+    parten en 0 cada año.
+    """
+    saldos = {}
+    for cuenta in balance or []:
+        codigo = str(cuenta.get('idCuenta', ''))
+        if codigo[:1] in CLASES_BALANCE:
+            saldos[codigo] = (cuenta.get('deudor', 0) or 0) - (cuenta.get('acreedor', 0) or 0)
+    return saldos
+
+
+def _detalle_por_cuenta(codigos: List[str], lotes: Iterable[List],
+                        saldos_iniciales: Dict[str, float] = None) -> Dict[str, Optional[List]]:
+    """
+    Agrupa las líneas del libro mayor por idCuenta, con saldo acumulado
+    desde el saldo inicial de cada cuenta (0 si no se indica).
+    """
+    saldos_iniciales = saldos_iniciales or {}
+    por_cuenta = defaultdict(list)
+    for lineas in lotes:
+        for mov in lineas:
+            por_cuenta[str(mov.get('idCuenta', ''))].append(mov)
+
+    resultado = {}
+    for codigo in codigos:
+        movimientos = sorted(por_cuenta.get(codigo, []), key=lambda m: str(m.get('fecha') or ''))
+        saldo = saldos_iniciales.get(codigo, 0)
+        filas = []
+        for mov in movimientos:
+            saldo += (mov.get('montoDebe', 0) or 0) - (mov.get('montoHaber', 0) or 0)
+            filas.append(_fila_analisis(mov, saldo))
+        resultado[codigo] = filas or None
+    return resultado
@@ -4,13 +4,15 @@ Balance Tributario + Análisis por Cuenta a Excel
 
 import os
 import json
-import requests
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import numbers, Font, Alignment, PatternFill, Border, Side
 
+from skualo.trafico import get_json
+from skualo.reportes import obtener_analisis_cuentas, obtener_balance
+
 # Carpeta para archivos generados
 OUTPUT_DIR = "generados"
 
@@ -31,20 +33,12 @@ def api_get(tenant_rut, path):
         "Authorization": f"Bearer {TOKEN}",
         "accept": "application/json"
     }
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        return response.json()
-    return None
+    return get_json(tenant_rut, url, headers=headers)
 
 
 def get_balance(tenant_rut, id_periodo):
-    """Obtener Balance Tributario"""
-    return api_get(tenant_rut, f"/contabilidad/reportes/balancetributario/{id_periodo}")
-
-
-def get_analisis_cuenta(tenant_rut, id_cuenta, fecha_corte):
-    """Obtener Análisis por Cuenta"""
-    return api_get(tenant_rut, f"/contabilidad/reportes/analisisporcuenta/{id_cuenta}?fechaCorte={fecha_corte}&soloPendientes=false")
+    """Obtener Balance Tributario (caché local para períodos cerrados)"""
+    return obtener_balance(api_get, tenant_rut, id_periodo)
 
 
 def sanitize_sheet_name(codigo, nombre):
@@ -1396,6 +1390,12 @@ def main():
     # Mapeo de código de cuenta -> nombre de hoja
     cuenta_a_hoja = {}
     
+    # Análisis por cuenta: se descargan en paralelo antes de abrir el Excel
+    print(f"\n📥 Obteniendo análisis de {len(balance_filtrado)} cuentas...")
+    analisis_por_cuenta = obtener_analisis_cuentas(
+        api_get, tenant["rut"], [c["idCuenta"] for c in balance_filtrado], fecha_corte
+    )
+    
     with pd.ExcelWriter(filename, engine="openpyxl") as writer:
         # 3. Crear hoja Resumen primero (será la primera hoja)
         print("\n📈 Generando Resumen (Balance + EERR + KPIs)...")
@@ -1436,7 +1436,7 @@ def main():
         sheet_names = {"Balance Tributario", "Resumen", "EEFF Comparativos", "Documentación"}
 
         for cuenta in balance_filtrado:
-            analisis = get_analisis_cuenta(tenant["rut"], cuenta["idCuenta"], fecha_corte)
+            analisis = analisis_por_cuenta.get(cuenta["idCuenta"])
             
             if analisis and len(analisis) > 0:
                 # Crear DataFrame y filtrar saldos 0
@@ -11,14 +11,20 @@ Configuración en: config/empresas_config.xlsx (una hoja por empresa)
 import os
 import sys
 import json
-import requests
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from functools import lru_cache
 from dotenv import load_dotenv
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
+from common.clasificacion import ClasificadorCuentas
+from common.excel import LibroStreaming, filas_dataframe, nombre_hoja_unico
+from skualo.trafico import get_json
+from skualo.reportes import obtener_analisis_cuentas, obtener_balance, obtener_balances, MatrizBalances
+
 load_dotenv()
 
 API_BASE = "https://api.skualo.cl"
@@ -37,34 +43,18 @@ def api_get(tenant_rut, path):
         "Authorization": f"Bearer {TOKEN}",
         "accept": "application/json"
     }
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        return response.json()
-    return None
+    return get_json(tenant_rut, url, headers=headers)
 
 
 def get_balance(tenant_rut, id_periodo):
-    """Obtener Balance Tributario"""
-    return api_get(tenant_rut, f"/contabilidad/reportes/balancetributario/{id_periodo}")
-
-
-def get_analisis_cuenta(tenant_rut, id_cuenta, fecha_corte):
-    """Obtener Análisis por Cuenta"""
-    return api_get(tenant_rut, f"/contabilidad/reportes/analisisporcuenta/{id_cuenta}?fechaCorte={fecha_corte}&soloPendientes=false")
+    """Obtener Balance Tributario (caché local para períodos cerrados)"""
+    return obtener_balance(api_get, tenant_rut, id_periodo)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # UTILIDADES
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def sanitize_sheet_name(codigo, nombre):
-    """Limpiar nombre para hoja Excel (max 31 chars)"""
-    name = f"{codigo} {nombre}"
-    for char in ['\\', '/', '*', '?', '[', ']', ':']:
-        name = name.replace(char, '')
-    return name[:31]
-
-
 def cargar_config_desde_excel(empresa_key):
     """
     Carga la configuración de una empresa desde el archivo Excel.
@@ -200,33 +190,28 @@ def cargar_config_desde_excel(empresa_key):
     return config
 
 
+def clasificador_balance(config_balance):
+    """
+    Clasificador compilado para la configuración de balance clasificado.
+
+    Se compila una vez por configuración (Resumen y EEFF Comparativos
+    comparten el mismo, con la memoización por código).
+    """
+    # Sin sort_keys: el orden de las categorías define la precedencia
+    return _clasificador_compilado(json.dumps(config_balance))
+
+
+@lru_cache(maxsize=8)
+def _clasificador_compilado(config_json):
+    return ClasificadorCuentas(json.loads(config_json))
+
+
 def clasificar_cuenta(codigo, config_balance):
     """
     Determina a qué categoría pertenece una cuenta según la configuración.
     Retorna el nombre de la categoría o None si no aplica.
     """
-    for categoria, reglas in config_balance.items():
-        # Primero verificar cuentas específicas
-        if "cuentas_especificas" in reglas:
-            if codigo in reglas["cuentas_especificas"]:
-                return categoria
-    
-    for categoria, reglas in config_balance.items():
-        if "cuentas_especificas" in reglas:
-            continue  # Ya procesadas arriba
-            
-        # Verificar si está excluida
-        excluidas = reglas.get("excluir_cuentas", [])
-        if codigo in excluidas:
-            continue
-            
-        # Verificar prefijos
-        prefijos = reglas.get("prefijos", [])
-        for prefijo in prefijos:
-            if codigo.startswith(prefijo):
-                return categoria
-    
-    return None
+    return clasificador_balance(config_balance).clasificar(codigo)
 
 
 def calcular_eerr(balance, config_eerr):
@@ -300,12 +285,62 @@ ESTILOS = {
     "formato_miles": '#,##0'
 }
 
+NAV_RESUMEN = {"hyperlink": "#'Resumen'!A1", "style": "Hyperlink"}
+NAV_DOCUMENTACION = {"hyperlink": "#'Documentación'!A1", "style": "Hyperlink"}
+
+# Estilos con nombre por tipo de fila (NamedStyle, se registran una vez por libro)
+ESTILOS_FILA = {
+    "header": {"font": ESTILOS["font_header"], "fill": ESTILOS["fill_header"],
+               "alignment": Alignment(horizontal='center')},
+    "header_tabla": {"font": ESTILOS["font_header"], "fill": ESTILOS["fill_header"],
+                     "alignment": Alignment(horizontal='center'), "border": ESTILOS["thin_border"]},
+    "dato": {"border": ESTILOS["thin_border"]},
+    "titulo": {"font": ESTILOS["font_titulo"]},
+    "titulo_balance": {"font": Font(bold=True, size=12, color="006400")},
+    "titulo_cuenta": {"font": Font(bold=True, size=11, color="006400")},
+    "dashboard": {"font": Font(bold=True, size=10, color="666666")},
+    "header_main": {"font": Font(bold=True, size=16, color="006400")},
+    "section_title": {"font": ESTILOS["font_section"], "fill": ESTILOS["fill_section"]},
+    "category": {"font": ESTILOS["font_category"]},
+    "subcategory": {"font": ESTILOS["font_subcategory"]},
+    "subcategory_resumen": {"font": Font(bold=True, italic=True)},
+    "subtotal": {"font": ESTILOS["font_subtotal"], "fill": ESTILOS["fill_subtotal"]},
+    "subtotal_resumen": {"font": ESTILOS["font_subtotal"]},
+    "total": {"font": ESTILOS["font_total"]},
+    "total_final": {"font": ESTILOS["font_total_final"], "fill": ESTILOS["fill_total_final"]},
+    "verification_ok": {"font": Font(bold=True, color="006400")},  # Verde
+    "verification_error": {"font": Font(bold=True, color="FF0000")},  # Rojo
+    "negrita": {"font": Font(bold=True)},
+    "kpi": {"font": Font(bold=True, color="006400")},
+    "kpi_centrado": {"font": Font(bold=True, color="006400"), "alignment": Alignment(horizontal='center')},
+}
+
+# Hoja Resumen: tipo de fila -> {columna: estilo}
+FORMATO_RESUMEN = {
+    "nav_row": {1: "dashboard"},
+    "header_main": {1: "header_main"},
+    "section_title": {1: "section_title"},
+    "category": {1: "category"},
+    "subcategory": {1: "subcategory_resumen"},
+    "subtotal": {1: "subtotal_resumen", 2: "subtotal_resumen"},
+    "total": {1: "total", 2: "total"},
+    "total_final": {1: "total_final", 2: "total_final"},
+    "verification_ok": {1: "verification_ok"},
+    "verification_error": {1: "verification_error"},
+    "header_kpi": {1: "negrita", 2: "negrita", 3: "negrita"},
+    "kpi": {2: "kpi"},
+}
+
+# EEFF Comparativos: tipos de fila con estilo en todas las columnas
+FILAS_COMPLETAS_EEFF = {"header", "section_title", "category", "subcategory",
+                        "subtotal", "total", "total_final"}
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # GENERADORES DE HOJAS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def crear_resumen(balance, writer, config):
+def crear_resumen(balance, libro, config):
     """Crea la hoja Resumen con Balance Clasificado, Estado de Resultados y KPIs"""
     
     tenant_name = config["tenant"]["nombre"]
@@ -321,11 +356,9 @@ def crear_resumen(balance, writer, config):
     # ═══════════════════════════════════════════════════════════
     
     categorias = {cat: [] for cat in config_balance.keys()}
+    clasificacion = clasificador_balance(config_balance).clasificar_lote(c["idCuenta"] for c in balance)
     
-    for c in balance:
-        codigo = c["idCuenta"]
-        categoria = clasificar_cuenta(codigo, config_balance)
-        
+    for c, categoria in zip(balance, clasificacion):
         if categoria:
             # Determinar si es activo o pasivo
             if categoria in ["activo_corriente", "activo_no_corriente", "intangibles"]:
@@ -572,63 +605,17 @@ def crear_resumen(balance, writer, config):
     rows.append(["Ratio de Endeudamiento", f"{kpis['ratio_deuda']:.1f}%", "Nivel de apalancamiento", "", ""])
     row_types.append("kpi")
     
-    # Escribir a Excel
-    df = pd.DataFrame(rows)
-    df.to_excel(writer, sheet_name="Resumen", index=False, header=False)
-    
-    ws = writer.sheets["Resumen"]
-    
-    # Aplicar formatos
-    for row_idx, row_type in enumerate(row_types, start=1):
-        cell_a = ws.cell(row=row_idx, column=1)
-        cell_b = ws.cell(row=row_idx, column=2)
-        cell_e = ws.cell(row=row_idx, column=5)
-        
-        if row_type == "header_main":
-            cell_a.font = Font(bold=True, size=16, color="006400")
-        elif row_type == "section_title":
-            cell_a.font = ESTILOS["font_section"]
-            cell_a.fill = ESTILOS["fill_section"]
-            cell_e.hyperlink = "#'Documentación'!A1"
-            cell_e.style = "Hyperlink"
-        elif row_type == "category":
-            cell_a.font = ESTILOS["font_category"]
-        elif row_type == "subcategory":
-            cell_a.font = Font(bold=True, italic=True)
-        elif row_type == "subtotal":
-            cell_a.font = ESTILOS["font_subtotal"]
-            cell_b.font = ESTILOS["font_subtotal"]
-        elif row_type == "total":
-            cell_a.font = ESTILOS["font_total"]
-            cell_b.font = ESTILOS["font_total"]
-        elif row_type == "total_final":
-            cell_a.font = ESTILOS["font_total_final"]
-            cell_a.fill = ESTILOS["fill_total_final"]
-            cell_b.font = ESTILOS["font_total_final"]
-            cell_b.fill = ESTILOS["fill_total_final"]
-        elif row_type == "verification_ok":
-            cell_a.font = Font(bold=True, color="006400")  # Verde
-        elif row_type == "verification_error":
-            cell_a.font = Font(bold=True, color="FF0000")  # Rojo
-        elif row_type == "header_kpi":
-            cell_a.font = Font(bold=True)
-            cell_b.font = Font(bold=True)
-            ws.cell(row=row_idx, column=3).font = Font(bold=True)
-        elif row_type == "kpi":
-            cell_b.font = Font(bold=True, color="006400")
-        
-        if isinstance(rows[row_idx-1][1], (int, float)):
-            cell_b.number_format = ESTILOS["formato_miles"]
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 45
-    ws.column_dimensions['B'].width = 18
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['E'].width = 22
-    
     # Navegación en A1
-    ws.cell(row=1, column=1).value = "📊 DASHBOARD PRINCIPAL"
-    ws.cell(row=1, column=1).font = Font(bold=True, size=10, color="666666")
+    rows[0][0] = "📊 DASHBOARD PRINCIPAL"
+    
+    # Escribir a Excel (cada fila con su formato según el tipo)
+    estilos = libro.estilos(ESTILOS_FILA)
+    ws = libro.crear_hoja("Resumen", anchos={'A': 45, 'B': 18, 'C': 30, 'E': 22})
+    for row, row_type in zip(rows, row_types):
+        columnas = estilos.columnas(row, FORMATO_RESUMEN.get(row_type, {}), [2], ESTILOS["formato_miles"])
+        if row_type == "section_title":
+            columnas[5] = NAV_DOCUMENTACION
+        ws.fila(row, columnas=columnas)
     
     return {
         "ingresos": eerr["ingresos"],
@@ -641,7 +628,7 @@ def crear_resumen(balance, writer, config):
     }
 
 
-def crear_eeff_comparativos(tenant_rut, config, writer):
+def crear_eeff_comparativos(tenant_rut, config, libro):
     """Crea hoja de Estados Financieros Comparativos"""
     
     periodos = config["periodos"]["comparativos"]
@@ -649,23 +636,19 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
     config_eerr = config["estado_resultados"]
     tasa_impuesto = config["impuesto_renta"]["tasa"]
     
-    # Obtener balances
-    balances = {}
-    for periodo in periodos:
-        print(f"   📊 Obteniendo balance {periodo['nombre']}...")
-        balance = get_balance(tenant_rut, periodo["id"])
-        if balance:
-            balances[periodo["nombre"]] = {c["idCuenta"]: c for c in balance}
+    nombres_periodos = [p["nombre"] for p in periodos]
     
-    if not balances:
-        return
+    # Obtener balances (todos los períodos en paralelo, con caché)
+    print(f"   📊 Obteniendo {len(periodos)} balances: {', '.join(nombres_periodos)}...")
+    balances = obtener_balances(api_get, tenant_rut, [p["id"] for p in periodos])
     
-    todas_cuentas = set()
-    for balance_dict in balances.values():
-        todas_cuentas.update(balance_dict.keys())
-    cuentas_ordenadas = sorted(todas_cuentas)
+    # Matriz cuenta × período: una sola pasada sobre los balances
+    matriz = MatrizBalances(nombres_periodos, balances)
+    if not matriz:
+        return
     
-    nombres_periodos = [p["nombre"] for p in periodos]
+    # Clasificar cada cuenta una sola vez (códigos en orden)
+    cuentas_por_categoria = clasificador_balance(config_balance).agrupar(matriz.codigos)
     
     # Construir datos
     rows = []
@@ -687,6 +670,21 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
     # Totales por período y categoría
     totales = {nombre: {cat: 0 for cat in config_balance.keys()} for nombre in nombres_periodos}
     
+    def agregar_cuentas(cat_key, valores, sangria):
+        """Agrega las cuentas de la categoría (solo las con algún valor) y acumula totales."""
+        codigos = cuentas_por_categoria.get(cat_key, [])
+        if not codigos:
+            return
+        for codigo, fila in zip(codigos, valores.tolist()):
+            if any(v != 0 for v in fila):
+                rows.append([codigo, f"{sangria}{matriz.nombres[codigo]}"] + fila)
+                row_types.append("item")
+        for n, total in zip(nombres_periodos, valores.sum(axis=0).tolist()):
+            totales[n][cat_key] += total
+    
+    def bloque(campo, cat_key):
+        return matriz.valores[campo][matriz.filas(cuentas_por_categoria.get(cat_key, []))]
+    
     # ─────────────────────────────────────────────────────────
     # BALANCE GENERAL
     # ─────────────────────────────────────────────────────────
@@ -709,32 +707,7 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
         rows.append(["", f"  {cat_nombre}"] + [""] * len(periodos))
         row_types.append("subcategory")
         
-        for codigo in cuentas_ordenadas:
-            categoria = clasificar_cuenta(codigo, config_balance)
-            if categoria != cat_key:
-                continue
-            
-            nombre_cuenta = ""
-            for balance_dict in balances.values():
-                if codigo in balance_dict:
-                    nombre_cuenta = balance_dict[codigo]["cuenta"]
-                    break
-            
-            valores = []
-            tiene_valor = False
-            for nombre_periodo in nombres_periodos:
-                if nombre_periodo in balances and codigo in balances[nombre_periodo]:
-                    val = balances[nombre_periodo][codigo]["activos"]
-                    valores.append(val)
-                    totales[nombre_periodo][cat_key] += val
-                    if val != 0:
-                        tiene_valor = True
-                else:
-                    valores.append(0)
-            
-            if tiene_valor:
-                rows.append([codigo, f"    {nombre_cuenta}"] + valores)
-                row_types.append("item")
+        agregar_cuentas(cat_key, bloque("activos", cat_key), "    ")
         
         rows.append(["", f"  Total {cat_nombre}"] + [totales[n][cat_key] for n in nombres_periodos])
         row_types.append("subtotal")
@@ -766,32 +739,7 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
         rows.append(["", f"  {cat_nombre}"] + [""] * len(periodos))
         row_types.append("subcategory")
         
-        for codigo in cuentas_ordenadas:
-            categoria = clasificar_cuenta(codigo, config_balance)
-            if categoria != cat_key:
-                continue
-            
-            nombre_cuenta = ""
-            for balance_dict in balances.values():
-                if codigo in balance_dict:
-                    nombre_cuenta = balance_dict[codigo]["cuenta"]
-                    break
-            
-            valores = []
-            tiene_valor = False
-            for nombre_periodo in nombres_periodos:
-                if nombre_periodo in balances and codigo in balances[nombre_periodo]:
-                    val = balances[nombre_periodo][codigo]["pasivos"]
-                    valores.append(val)
-                    totales[nombre_periodo][cat_key] += val
-                    if val != 0:
-                        tiene_valor = True
-                else:
-                    valores.append(0)
-            
-            if tiene_valor:
-                rows.append([codigo, f"    {nombre_cuenta}"] + valores)
-                row_types.append("item")
+        agregar_cuentas(cat_key, bloque("pasivos", cat_key), "    ")
         
         rows.append(["", f"  Total {cat_nombre}"] + [totales[n][cat_key] for n in nombres_periodos])
         row_types.append("subtotal")
@@ -811,33 +759,10 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
     rows.append(["", "PATRIMONIO"] + [""] * len(periodos))
     row_types.append("category")
     
-    for codigo in cuentas_ordenadas:
-        categoria = clasificar_cuenta(codigo, config_balance)
-        if categoria != "patrimonio":
-            continue
-        
-        nombre_cuenta = ""
-        for balance_dict in balances.values():
-            if codigo in balance_dict:
-                nombre_cuenta = balance_dict[codigo]["cuenta"]
-                break
-        
-        valores = []
-        tiene_valor = False
-        for nombre_periodo in nombres_periodos:
-            if nombre_periodo in balances and codigo in balances[nombre_periodo]:
-                c = balances[nombre_periodo][codigo]
-                val = c["pasivos"] if c["pasivos"] != 0 else -c["activos"]
-                valores.append(val)
-                totales[nombre_periodo]["patrimonio"] += val
-                if val != 0:
-                    tiene_valor = True
-            else:
-                valores.append(0)
-        
-        if tiene_valor:
-            rows.append([codigo, f"  {nombre_cuenta}"] + valores)
-            row_types.append("item")
+    # Patrimonio: saldo pasivo, o el activo con signo invertido si no hay pasivo
+    pasivos_pat = bloque("pasivos", "patrimonio")
+    activos_pat = bloque("activos", "patrimonio")
+    agregar_cuentas("patrimonio", np.where(pasivos_pat != 0, pasivos_pat, -activos_pat), "  ")
     
     rows.append(["", "TOTAL PATRIMONIO"] + [totales[n]["patrimonio"] for n in nombres_periodos])
     row_types.append("total")
@@ -865,12 +790,8 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
     
     # Calcular EERR por período
     eerr_periodos = {}
-    for nombre_periodo in nombres_periodos:
-        if nombre_periodo in balances:
-            balance_list = [{"idCuenta": k, **v} for k, v in balances[nombre_periodo].items()]
-            eerr_periodos[nombre_periodo] = calcular_eerr(balance_list, config_eerr)
-        else:
-            eerr_periodos[nombre_periodo] = {}
+    for nombre_periodo, balance in zip(nombres_periodos, balances):
+        eerr_periodos[nombre_periodo] = calcular_eerr(balance, config_eerr) if balance else {}
     
     def eerr_row(concepto, campo, tipo="item"):
         valores = [eerr_periodos.get(n, {}).get(campo, 0) for n in nombres_periodos]
@@ -991,60 +912,30 @@ def crear_eeff_comparativos(tenant_rut, config, writer):
     row_types.append("subcategory")
     kpi_row("  Ratio de Endeudamiento", [kpis_periodos[n]["ratio_deuda"] for n in nombres_periodos])
     
-    # Escribir a Excel
-    df = pd.DataFrame(rows)
-    df.to_excel(writer, sheet_name="EEFF Comparativos", index=False, header=False)
-    
-    ws = writer.sheets["EEFF Comparativos"]
+    # Escribir a Excel (cada fila con su formato según el tipo)
     num_cols = 2 + len(periodos)
-    
-    # Aplicar formatos
-    for row_idx, row_type in enumerate(row_types, start=1):
-        for col_idx in range(1, num_cols + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            
-            if row_type == "nav_row":
-                if col_idx == 1:
-                    cell.hyperlink = "#'Resumen'!A1"
-                    cell.style = "Hyperlink"
-            elif row_type == "titulo_principal":
-                if col_idx == 1:
-                    cell.font = ESTILOS["font_titulo"]
-            elif row_type == "header":
-                cell.font = ESTILOS["font_header"]
-                cell.fill = ESTILOS["fill_header"]
-                cell.alignment = Alignment(horizontal='center')
-            elif row_type == "section_title":
-                cell.font = ESTILOS["font_section"]
-                cell.fill = ESTILOS["fill_section"]
-            elif row_type == "category":
-                cell.font = ESTILOS["font_category"]
-            elif row_type == "subcategory":
-                cell.font = ESTILOS["font_subcategory"]
-            elif row_type == "subtotal":
-                cell.font = ESTILOS["font_subtotal"]
-                cell.fill = ESTILOS["fill_subtotal"]
-            elif row_type == "total":
-                cell.font = ESTILOS["font_total"]
-            elif row_type == "total_final":
-                cell.font = ESTILOS["font_total_final"]
-                cell.fill = ESTILOS["fill_total_final"]
-            elif row_type == "kpi":
-                if col_idx >= 3:
-                    cell.font = Font(bold=True, color="006400")
-                    cell.alignment = Alignment(horizontal='center')
-            
-            # Formato miles
-            if col_idx >= 3 and row_idx > 1:
-                val = rows[row_idx-1][col_idx-1] if col_idx-1 < len(rows[row_idx-1]) else None
-                if isinstance(val, (int, float)):
-                    cell.number_format = ESTILOS["formato_miles"]
-    
-    # Anchos
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 40
+    anchos = {'A': 12, 'B': 40}
     for i in range(len(periodos)):
-        ws.column_dimensions[get_column_letter(3 + i)].width = 16
+        anchos[get_column_letter(3 + i)] = 16
+    ws = libro.crear_hoja("EEFF Comparativos", anchos=anchos)
+    estilos = libro.estilos(ESTILOS_FILA)
+    
+    cols_valores = range(3, num_cols + 1)
+    for row, row_type in zip(rows, row_types):
+        if row_type == "nav_row":
+            ws.fila(row, columnas={1: NAV_RESUMEN})
+            continue
+        
+        formato = {}
+        if row_type in FILAS_COMPLETAS_EEFF:
+            formato = {c: row_type for c in range(1, num_cols + 1)}
+        elif row_type == "titulo_principal":
+            formato = {1: "titulo"}
+        elif row_type == "kpi":
+            formato = {c: "kpi_centrado" for c in cols_valores}
+        
+        # Formato miles en las columnas de períodos
+        ws.fila(row, columnas=estilos.columnas(row, formato, cols_valores, ESTILOS["formato_miles"]))
 
 
 def cargar_documentacion():
@@ -1054,7 +945,7 @@ def cargar_documentacion():
         return json.load(f)
 
 
-def crear_documentacion(writer, config):
+def crear_documentacion(libro, config):
     """Crea la hoja de documentación combinando archivo externo + config empresa"""
     
     # Cargar documentación base
@@ -1138,21 +1029,12 @@ def crear_documentacion(writer, config):
                 f"Actualizado: {doc['metadata']['ultima_actualizacion']}", 
                 f"Fuente: {doc['metadata']['fuente']}", ""))
     
-    df = pd.DataFrame(data, columns=["Concepto", "Cuentas/Fórmula", "Descripción", ""])
-    df.to_excel(writer, sheet_name="Documentación", index=False, header=False)
-    
-    ws = writer.sheets["Documentación"]
-    
-    # Navegación
-    ws.cell(row=1, column=1).hyperlink = "#'Resumen'!A1"
-    ws.cell(row=1, column=1).style = "Hyperlink"
-    
-    # Título
-    ws.cell(row=3, column=1).font = ESTILOS["font_titulo"]
+    ws = libro.crear_hoja("Documentación", anchos={'A': 40, 'B': 25, 'C': 60})
     
-    ws.column_dimensions['A'].width = 40
-    ws.column_dimensions['B'].width = 25
-    ws.column_dimensions['C'].width = 60
+    # Navegación (fila 1) y título (fila 3)
+    formato = {1: {1: NAV_RESUMEN}, 3: {1: libro.estilos(ESTILOS_FILA)("titulo")}}
+    for row_idx, fila in enumerate(data, start=1):
+        ws.fila(fila, columnas=formato.get(row_idx))
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1202,163 +1084,125 @@ def main(empresa_key):
     })
     df_balance["Ver Detalle"] = ""
     
+    # Análisis por cuenta: se descargan en paralelo antes de abrir el Excel
+    print(f"\n📥 Obteniendo análisis de {len(balance_filtrado)} cuentas...")
+    analisis_por_cuenta = obtener_analisis_cuentas(
+        api_get, tenant["rut"], [c["idCuenta"] for c in balance_filtrado], fecha_corte
+    )
+    
     # Crear archivo
     os.makedirs(output_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{output_dir}/{prefijo}_{tenant['key']}_{periodo}_{timestamp}.xlsx"
     
     cuenta_a_hoja = {}
+    periodo_texto = f"{periodo[:4]}-{periodo[4:]}"
     
-    with pd.ExcelWriter(filename, engine="openpyxl") as writer:
-        # 1. Resumen
-        print("\n📈 Generando Resumen...")
-        crear_resumen(balance, writer, config)
-        
-        # 2. EEFF Comparativos
-        print("\n📊 Generando Estados Financieros Comparativos...")
-        crear_eeff_comparativos(tenant["rut"], config, writer)
-        
-        # 3. Documentación
-        print("\n📝 Generando Documentación...")
-        crear_documentacion(writer, config)
-        
-        # 4. Balance Tributario
-        periodo_texto = f"{periodo[:4]}-{periodo[4:]}"
-        df_balance.to_excel(writer, sheet_name="Balance Tributario", index=False, startrow=2)
-        
-        ws_balance = writer.sheets["Balance Tributario"]
-        ws_balance.cell(row=1, column=1).value = "← Volver al Resumen"
-        ws_balance.cell(row=1, column=1).hyperlink = "#'Resumen'!A1"
-        ws_balance.cell(row=1, column=1).style = "Hyperlink"
-        ws_balance.cell(row=2, column=1).value = f"BALANCE TRIBUTARIO - {tenant['nombre']} - Período: {periodo_texto}"
-        ws_balance.cell(row=2, column=1).font = Font(bold=True, size=12, color="006400")
-        
-        # 5. Hojas de análisis por cuenta
-        print("\n📋 Procesando cuentas con movimientos...")
-        cuentas_con_datos = 0
-        sheet_names = {"Balance Tributario", "Resumen", "EEFF Comparativos", "Documentación"}
+    # Hojas de análisis por cuenta: se preparan antes de escribir, porque en
+    # modo streaming los hipervínculos del balance deben conocer el nombre de hoja
+    print("\n📋 Procesando cuentas con movimientos...")
+    hojas_cuentas = []
+    sheet_names = {"Balance Tributario", "Resumen", "EEFF Comparativos", "Documentación"}
+    
+    for cuenta in balance_filtrado:
+        analisis = analisis_por_cuenta.get(cuenta["idCuenta"])
         
-        for cuenta in balance_filtrado:
-            analisis = get_analisis_cuenta(tenant["rut"], cuenta["idCuenta"], fecha_corte)
+        if analisis and len(analisis) > 0:
+            df_cuenta = pd.DataFrame(analisis)
+            if "saldo" in df_cuenta.columns:
+                df_cuenta = df_cuenta[df_cuenta["saldo"] != 0]
             
-            if analisis and len(analisis) > 0:
-                df_cuenta = pd.DataFrame(analisis)
-                if "saldo" in df_cuenta.columns:
-                    df_cuenta = df_cuenta[df_cuenta["saldo"] != 0]
-                
-                if len(df_cuenta) == 0:
-                    continue
-                
-                # Seleccionar columnas
-                cols_deseadas = ["fecha", "numero", "tipo", "glosa", "debe", "haber", "saldo"]
-                cols_disponibles = [c for c in cols_deseadas if c in df_cuenta.columns]
-                
-                if "auxiliar" in df_cuenta.columns:
-                    cols_disponibles.insert(3, "auxiliar")
-                elif "idAuxiliar" in df_cuenta.columns:
-                    df_cuenta["auxiliar"] = df_cuenta["idAuxiliar"]
-                    cols_disponibles.insert(3, "auxiliar")
-                
-                df_cuenta = df_cuenta[cols_disponibles]
-                df_cuenta = df_cuenta.rename(columns={
-                    "fecha": "Fecha", "numero": "Comprobante", "tipo": "Tipo",
-                    "auxiliar": "Auxiliar", "glosa": "Glosa",
-                    "debe": "Debe", "haber": "Haber", "saldo": "Saldo"
-                })
-                
-                if "Fecha" in df_cuenta.columns:
-                    df_cuenta["Fecha"] = df_cuenta["Fecha"].str[:10]
-                
-                sheet_name = sanitize_sheet_name(cuenta["idCuenta"], cuenta["cuenta"])
-                suffix = 1
-                original = sheet_name
-                while sheet_name in sheet_names:
-                    sheet_name = f"{original[:28]}_{suffix}"
-                    suffix += 1
-                
-                sheet_names.add(sheet_name)
-                df_cuenta.to_excel(writer, sheet_name=sheet_name, index=False, startrow=2)
-                cuenta_a_hoja[cuenta["idCuenta"]] = sheet_name
-                cuentas_con_datos += 1
-                print(f"   ✅ {cuenta['idCuenta']}: {len(df_cuenta)} movimientos")
-                
-                ws_cuenta = writer.sheets[sheet_name]
-                ws_cuenta.cell(row=1, column=1).value = "← Volver al Resumen"
-                ws_cuenta.cell(row=1, column=1).hyperlink = "#'Resumen'!A1"
-                ws_cuenta.cell(row=1, column=1).style = "Hyperlink"
-                ws_cuenta.cell(row=2, column=1).value = f"ANÁLISIS DE CUENTA: {cuenta['idCuenta']} - {cuenta['cuenta']} | Período: {periodo_texto}"
-                ws_cuenta.cell(row=2, column=1).font = Font(bold=True, size=11, color="006400")
-        
-        print(f"\n   📊 Cuentas con datos: {cuentas_con_datos}")
-        
-        # 6. Aplicar formato
-        print("\n💰 Aplicando formato...")
-        
-        # Balance Tributario
-        ws_balance = writer.sheets["Balance Tributario"]
-        for col in range(1, 12):
-            cell = ws_balance.cell(row=3, column=col)
-            cell.font = ESTILOS["font_header"]
-            cell.fill = ESTILOS["fill_header"]
-            cell.alignment = Alignment(horizontal='center')
-            cell.border = ESTILOS["thin_border"]
-        
-        for row in range(4, len(balance_filtrado) + 4):
-            for col in range(1, 12):
-                cell = ws_balance.cell(row=row, column=col)
-                cell.border = ESTILOS["thin_border"]
-                if 3 <= col <= 10:
-                    cell.number_format = ESTILOS["formato_miles"]
-        
-        ws_balance.column_dimensions['A'].width = 12
-        ws_balance.column_dimensions['B'].width = 35
-        for col in ['C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']:
-            ws_balance.column_dimensions[col].width = 14
-        ws_balance.column_dimensions['K'].width = 10
-        
-        # Hojas de cuentas
-        for codigo, sheet_name in cuenta_a_hoja.items():
-            ws = writer.sheets[sheet_name]
-            num_cols = ws.max_column
+            if len(df_cuenta) == 0:
+                continue
             
-            for col in range(1, num_cols + 1):
-                cell = ws.cell(row=3, column=col)
-                cell.font = ESTILOS["font_header"]
-                cell.fill = ESTILOS["fill_header"]
-                cell.alignment = Alignment(horizontal='center')
-                cell.border = ESTILOS["thin_border"]
+            # Seleccionar columnas
+            cols_deseadas = ["fecha", "numero", "tipo", "glosa", "debe", "haber", "saldo"]
+            cols_disponibles = [c for c in cols_deseadas if c in df_cuenta.columns]
             
-            for row in range(4, ws.max_row + 1):
-                for col in range(1, num_cols + 1):
-                    cell = ws.cell(row=row, column=col)
-                    cell.border = ESTILOS["thin_border"]
-                    if col >= num_cols - 2:
-                        cell.number_format = ESTILOS["formato_miles"]
+            if "auxiliar" in df_cuenta.columns:
+                cols_disponibles.insert(3, "auxiliar")
+            elif "idAuxiliar" in df_cuenta.columns:
+                df_cuenta["auxiliar"] = df_cuenta["idAuxiliar"]
+                cols_disponibles.insert(3, "auxiliar")
             
-            ws.column_dimensions['A'].width = 12
-            ws.column_dimensions['B'].width = 12
-            ws.column_dimensions['C'].width = 8
-            if num_cols == 8:
-                ws.column_dimensions['D'].width = 18
-                ws.column_dimensions['E'].width = 35
-                ws.column_dimensions['F'].width = 14
-                ws.column_dimensions['G'].width = 14
-                ws.column_dimensions['H'].width = 14
-            else:
-                ws.column_dimensions['D'].width = 35
-                ws.column_dimensions['E'].width = 14
-                ws.column_dimensions['F'].width = 14
-                ws.column_dimensions['G'].width = 14
+            df_cuenta = df_cuenta[cols_disponibles]
+            df_cuenta = df_cuenta.rename(columns={
+                "fecha": "Fecha", "numero": "Comprobante", "tipo": "Tipo",
+                "auxiliar": "Auxiliar", "glosa": "Glosa",
+                "debe": "Debe", "haber": "Haber", "saldo": "Saldo"
+            })
+            
+            if "Fecha" in df_cuenta.columns:
+                df_cuenta["Fecha"] = df_cuenta["Fecha"].str[:10]
+            
+            sheet_name = nombre_hoja_unico(f"{cuenta['idCuenta']} {cuenta['cuenta']}", sheet_names)
+            cuenta_a_hoja[cuenta["idCuenta"]] = sheet_name
+            hojas_cuentas.append((cuenta, sheet_name, df_cuenta))
+            print(f"   ✅ {cuenta['idCuenta']}: {len(df_cuenta)} movimientos")
+    
+    print(f"\n   📊 Cuentas con datos: {len(hojas_cuentas)}")
+    
+    # Escritura streaming: cada fila se escribe una sola vez, ya con formato
+    libro = LibroStreaming()
+    
+    # 1. Resumen
+    print("\n📈 Generando Resumen...")
+    crear_resumen(balance, libro, config)
+    
+    # 2. EEFF Comparativos
+    print("\n📊 Generando Estados Financieros Comparativos...")
+    crear_eeff_comparativos(tenant["rut"], config, libro)
+    
+    # 3. Documentación
+    print("\n📝 Generando Documentación...")
+    crear_documentacion(libro, config)
+    
+    # 4. Balance Tributario (con hipervínculos a las hojas de cuentas)
+    print("\n💰 Escribiendo Balance Tributario y hojas de cuentas...")
+    estilos = libro.estilos(ESTILOS_FILA)
+    dato, dato_miles = estilos("dato"), estilos("dato", ESTILOS["formato_miles"])
+    
+    anchos = {'A': 12, 'B': 35, 'K': 10}
+    for col in ['C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']:
+        anchos[col] = 14
+    ws_balance = libro.crear_hoja("Balance Tributario", anchos=anchos)
+    ws_balance.fila(["← Volver al Resumen"], columnas={1: NAV_RESUMEN})
+    ws_balance.fila([f"BALANCE TRIBUTARIO - {tenant['nombre']} - Período: {periodo_texto}"],
+                    columnas={1: estilos("titulo_balance")})
+    ws_balance.fila(df_balance.columns, estilo=estilos("header_tabla"))
+    
+    cols_miles = {col: dato_miles for col in range(3, 11)}
+    col_link = df_balance.columns.get_loc("Ver Detalle") + 1
+    for cuenta, fila in zip(balance_filtrado, filas_dataframe(df_balance)):
+        columnas = cols_miles
+        if cuenta["idCuenta"] in cuenta_a_hoja:
+            fila[col_link - 1] = "→ Ver"
+            columnas = {**cols_miles, col_link: {
+                "hyperlink": f"#'{cuenta_a_hoja[cuenta['idCuenta']]}'!A1",
+                "style": "Hyperlink",
+            }}
+        ws_balance.fila(fila, estilo=dato, columnas=columnas)
+    
+    # 5. Hojas de análisis por cuenta
+    for cuenta, sheet_name, df_cuenta in hojas_cuentas:
+        num_cols = len(df_cuenta.columns)
+        anchos = {'A': 12, 'B': 12, 'C': 8}
+        if num_cols == 8:
+            anchos.update({'D': 18, 'E': 35, 'F': 14, 'G': 14, 'H': 14})
+        else:
+            anchos.update({'D': 35, 'E': 14, 'F': 14, 'G': 14})
+        
+        ws = libro.crear_hoja(sheet_name, anchos=anchos)
+        ws.fila(["← Volver al Resumen"], columnas={1: NAV_RESUMEN})
+        ws.fila([f"ANÁLISIS DE CUENTA: {cuenta['idCuenta']} - {cuenta['cuenta']} | Período: {periodo_texto}"],
+                columnas={1: estilos("titulo_cuenta")})
+        ws.fila(df_cuenta.columns, estilo=estilos("header_tabla"))
         
-        # 7. Hipervínculos en Balance Tributario
-        print("🔗 Agregando hipervínculos...")
-        for row_idx, cuenta in enumerate(balance_filtrado, start=4):
-            codigo = cuenta["idCuenta"]
-            if codigo in cuenta_a_hoja:
-                cell = ws_balance.cell(row=row_idx, column=11)
-                cell.value = "→ Ver"
-                cell.hyperlink = f"#'{cuenta_a_hoja[codigo]}'!A1"
-                cell.style = "Hyperlink"
+        cols_montos = {col: dato_miles for col in range(max(1, num_cols - 2), num_cols + 1)}
+        for fila in filas_dataframe(df_cuenta):
+            ws.fila(fila, estilo=dato, columnas=cols_montos)
+    
+    libro.guardar(filename)
     
     print(f"\n💾 Guardado: {filename}")
     print("\n" + "═" * 60)
@@ -1366,12 +1210,18 @@ def main(empresa_key):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Uso: python balance_excel_v2.py <EMPRESA>")
+        print("Uso: python balance_excel_v2.py <EMPRESA> [--refrescar]")
         print("Ejemplo: python balance_excel_v2.py FIDI")
-        print("         python balance_excel_v2.py CISI")
+        print("         python balance_excel_v2.py CISI --refrescar   (ignora balances cacheados)")
         print(f"\nConfiguraciones disponibles en: {CONFIG_EXCEL}")
         sys.exit(1)
     
     empresa_key = sys.argv[1].upper()
+    if "--refrescar" in sys.argv[2:]:
+        from skualo.cache import get_cache_balances
+        cache = get_cache_balances()
+        if cache:
+            rut = cargar_config_desde_excel(empresa_key)["tenant"]["rut"]
+            print(f"🗑️  Balances cacheados eliminados: {cache.invalidar(rut)}")
     main(empresa_key)
 
@@ -18,10 +18,16 @@ Uso:
 import os
 import sys
 import json
-import requests
 from datetime import datetime
 from dotenv import load_dotenv
 
+from skualo.api import mapear_concurrente, CUENTA_WORKERS
+from skualo.trafico import get_json
+from skualo.bancos import detectar_cuentas_bancarias
+from skualo.documentos import verificar_contabilizados as verificar_en_bloque
+from skualo.cache import get_cache_contabilizados
+from skualo.sincronizacion import obtener_dtes_recibidos as sincronizar_dtes, obtener_movimientos_banco
+
 # Configuración
 load_dotenv()
 TOKEN = os.getenv('SKUALO_API_TOKEN')
@@ -69,47 +75,10 @@ def get_nombre_empresa(rut):
     return rut
 
 
-def api_get(rut, endpoint, params=None):
+def api_get(rut, endpoint, params=None, estricto=False):
     """Realiza una llamada GET a la API."""
-    url = f'{BASE_URL}/{rut}{endpoint}'
-    r = requests.get(url, headers=get_headers(), params=params)
-    if r.ok:
-        return r.json()
-    return None
-
-
-def detectar_cuentas_bancarias(balance):
-    """
-    Detecta cuentas bancarias del balance de forma inteligente.
-    No depende de códigos hardcodeados.
-    """
-    cuentas_banco = []
-    
-    # Palabras clave que indican cuenta bancaria
-    palabras_banco = [
-        'banco', 'santander', 'chile', 'estado', 'bci', 'scotiabank', 
-        'itau', 'itaú', 'security', 'bice', 'falabella', 'ripley',
-        'consorcio', 'internacional', 'corpbanca', 'tapp', 'tenpo',
-        'mercado pago', 'cuenta corriente', 'cta cte', 'cta. cte'
-    ]
-    
-    for cuenta in balance:
-        codigo = cuenta.get('idCuenta', '')
-        nombre = cuenta.get('cuenta', '').lower()
-        
-        # Método 1: Prefijo 1102 (estándar para bancos en Chile)
-        if codigo.startswith('1102'):
-            cuentas_banco.append(cuenta)
-            continue
-        
-        # Método 2: Nombre contiene palabra clave de banco
-        if any(palabra in nombre for palabra in palabras_banco):
-            # Verificar que sea cuenta de activo (empieza con 1)
-            if codigo.startswith('1'):
-                cuentas_banco.append(cuenta)
-                continue
-    
-    return cuentas_banco
+    return get_json(rut, f'{BASE_URL}/{rut}{endpoint}', headers=get_headers(), params=params,
+                    estricto=estricto)
 
 
 def obtener_movimientos_sin_conciliar(rut, periodo=None):
@@ -132,23 +101,15 @@ def obtener_movimientos_sin_conciliar(rut, periodo=None):
     # Obtener movimientos sin conciliar de cada cuenta
     resultado = []
     
-    for cuenta in cuentas_banco:
+    # Obtener todos los movimientos (paginado, cuentas en paralelo)
+    movimientos_por_cuenta = mapear_concurrente(
+        lambda c: obtener_movimientos_banco(api_get, rut, c['idCuenta']), cuentas_banco, CUENTA_WORKERS
+    )
+    
+    for cuenta, all_movimientos in zip(cuentas_banco, movimientos_por_cuenta):
         codigo = cuenta['idCuenta']
         nombre = cuenta['cuenta']
         
-        # Obtener todos los movimientos (paginado)
-        all_movimientos = []
-        page = 1
-        while True:
-            data = api_get(rut, f'/bancos/{codigo}', {'PageSize': 100, 'Page': page})
-            if not data:
-                break
-            items = data.get('items', [])
-            all_movimientos.extend(items)
-            if not data.get('next'):
-                break
-            page += 1
-        
         # Filtrar no conciliados
         sin_conciliar = [m for m in all_movimientos if not m.get('conciliado', True)]
         
@@ -165,19 +126,8 @@ def obtener_movimientos_sin_conciliar(rut, periodo=None):
 
 
 def obtener_dtes_recibidos(rut):
-    """Obtiene todos los DTEs recibidos del SII."""
-    all_dtes = []
-    page = 1
-    while True:
-        data = api_get(rut, '/sii/dte/recibidos', {'PageSize': 100, 'Page': page})
-        if not data:
-            break
-        items = data.get('items', [])
-        all_dtes.extend(items)
-        if not data.get('next'):
-            break
-        page += 1
-    return all_dtes
+    """Obtiene todos los DTEs recibidos del SII (incremental si SKUALO_DTE_INCREMENTAL=true)."""
+    return sincronizar_dtes(api_get, rut)
 
 
 def clasificar_dtes(dtes):
@@ -219,21 +169,24 @@ def clasificar_dtes(dtes):
 def verificar_contabilizados(rut, dtes_aceptados):
     """
     Verifica cuáles DTEs aceptados ya están contabilizados.
-    Un DTE está contabilizado si existe en /documentos/{tipo}/{folio}
+    Un DTE está contabilizado si figura en el libro de compras o
+    existe en /documentos/{tipo}/{folio}
     """
     pendientes_contabilizar = []
     ya_contabilizados = []
     
-    for dte in dtes_aceptados:
-        tipo_dte = dte.get('idTipoDocumento')
-        folio = dte.get('folio')
-        
-        # Mapear tipo DTE a tipo interno
-        tipo_interno = TIPO_DTE_A_INTERNO.get(tipo_dte, 'FACE')
-        
-        # Verificar si existe en documentos
-        doc = api_get(rut, f'/documentos/{tipo_interno}/{folio}')
-        
+    # Mapear tipo DTE a tipo interno
+    claves = [
+        (TIPO_DTE_A_INTERNO.get(dte.get('idTipoDocumento'), 'FACE'), dte.get('folio'), dte.get('rutEmisor', ''))
+        for dte in dtes_aceptados
+    ]
+    contabilizados = verificar_en_bloque(
+        api_get, rut, claves, None, TIPO_DTE_A_INTERNO,
+        fechas=[dte.get('fechaEmision') for dte in dtes_aceptados],
+        cache=get_cache_contabilizados(),
+    )
+    
+    for dte, (tipo_interno, _, _), doc in zip(dtes_aceptados, claves, contabilizados):
         if doc:
             ya_contabilizados.append({**dte, 'tipo_interno': tipo_interno})
         else:
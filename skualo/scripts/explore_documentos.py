@@ -4,9 +4,10 @@ Explorar endpoints de Documentos - Skualo API
 
 import os
 import json
-import requests
 from dotenv import load_dotenv
 
+from skualo.api import get_session
+
 load_dotenv()
 
 API_BASE = "https://api.skualo.cl"
@@ -27,7 +28,7 @@ def api_get(path, accept="application/json"):
     }
     print(f"\n🔄 GET {path[:80]}...")
     
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers)
     print(f"   Status: {response.status_code}")
     
     if response.ok:
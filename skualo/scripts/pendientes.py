@@ -12,6 +12,9 @@ Uso:
     python -m skualo.scripts.pendientes              # Todas las empresas
     python -m skualo.scripts.pendientes FIDI         # Una empresa específica
     python -m skualo.scripts.pendientes --output pendientes.json
+    python -m skualo.scripts.pendientes --formato ndjson   # json | compacto | ndjson
+
+El archivo se escribe empresa por empresa (common.salida_json).
 
 Como módulo:
     from skualo.scripts.pendientes import obtener_pendientes
@@ -21,11 +24,18 @@ Como módulo:
 import os
 import sys
 import json
-import requests
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
+from common.salida_json import SalidaReporte
+from skualo.api import paginar, mapear_concurrente, CUENTA_WORKERS
+from skualo.trafico import get_json
+from skualo.bancos import detectar_cuentas_bancarias
+from skualo.documentos import verificar_contabilizados
+from skualo.cache import get_cache_contabilizados
+from skualo.sincronizacion import obtener_dtes_recibidos, obtener_movimientos_banco
+
 load_dotenv()
 
 
@@ -51,12 +61,12 @@ TIPO_DTE_A_INTERNO = {
 }
 
 
-class JSONEncoder(json.JSONEncoder):
-    """Encoder para tipos especiales."""
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+# Listas de detalle que en NDJSON van una por línea
+DETALLE_NDJSON = {
+    'pendientes_sii': 'documentos',
+    'pendientes_contabilizar': 'documentos',
+    'pendientes_conciliar': 'movimientos',
+}
 
 
 def get_headers():
@@ -66,60 +76,15 @@ def get_headers():
     }
 
 
-def api_get(rut: str, endpoint: str, params: dict = None):
+def api_get(rut: str, endpoint: str, params: dict = None, estricto: bool = False):
     """Realiza llamada GET a la API."""
-    url = f'{BASE_URL}/{rut}{endpoint}'
-    try:
-        r = requests.get(url, headers=get_headers(), params=params, timeout=30)
-        if r.ok:
-            return r.json()
-    except Exception as e:
-        print(f'   Error API: {e}')
-    return None
+    return get_json(rut, f'{BASE_URL}/{rut}{endpoint}', headers=get_headers(), params=params,
+                    estricto=estricto)
 
 
 def api_get_all(rut: str, endpoint: str, params: dict = None) -> list:
-    """Obtiene todos los registros paginados."""
-    all_items = []
-    page = 1
-    base_params = params or {}
-    
-    while True:
-        paged_params = {**base_params, 'PageSize': 100, 'Page': page}
-        data = api_get(rut, endpoint, paged_params)
-        if not data:
-            break
-        items = data.get('items', data) if isinstance(data, dict) else data
-        if isinstance(items, list):
-            all_items.extend(items)
-        if not data.get('next'):
-            break
-        page += 1
-    
-    return all_items
-
-
-def detectar_cuentas_bancarias(balance: list) -> list:
-    """Detecta cuentas bancarias del balance."""
-    cuentas_banco = []
-    palabras_banco = [
-        'banco', 'santander', 'chile', 'estado', 'bci', 'scotiabank', 
-        'itau', 'itaú', 'security', 'bice', 'falabella', 'ripley',
-        'consorcio', 'internacional', 'corpbanca', 'tapp', 'tenpo',
-        'mercado pago', 'cuenta corriente', 'cta cte', 'cta. cte'
-    ]
-    
-    for cuenta in balance:
-        codigo = cuenta.get('idCuenta', '')
-        nombre = cuenta.get('cuenta', '').lower()
-        
-        if codigo.startswith('1102'):
-            cuentas_banco.append(cuenta)
-        elif any(palabra in nombre for palabra in palabras_banco):
-            if codigo.startswith('1'):
-                cuentas_banco.append(cuenta)
-    
-    return cuentas_banco
+    """Obtiene todos los registros paginados (páginas en paralelo)."""
+    return paginar(api_get, rut, endpoint, params)
 
 
 def obtener_pendientes_empresa(rut: str) -> dict:
@@ -146,7 +111,7 @@ def obtener_pendientes_empresa(rut: str) -> dict:
     # ═══════════════════════════════════════════════════════════════════
     # 1. DOCUMENTOS RECIBIDOS SII
     # ═══════════════════════════════════════════════════════════════════
-    dtes = api_get_all(rut, '/sii/dte/recibidos')
+    dtes = obtener_dtes_recibidos(api_get, rut)
     
     hoy = datetime.now()
     pendientes_aceptar = []
@@ -197,14 +162,19 @@ def obtener_pendientes_empresa(rut: str) -> dict:
     pendientes_contabilizar = []
     ya_contabilizados = []
     
-    for dte in aceptados:
-        tipo_dte = dte.get('tipo_id')
-        folio = dte.get('folio')
-        tipo_interno = TIPO_DTE_A_INTERNO.get(tipo_dte, 'FACE')
-        
-        # Verificar si existe en documentos
-        doc = api_get(rut, f'/documentos/{tipo_interno}/{folio}')
-        
+    # Verificación en bloque: índice del libro de compras y /documentos
+    # solo para los que no aparecen en el libro
+    claves = [
+        (TIPO_DTE_A_INTERNO.get(dte.get('tipo_id'), 'FACE'), dte.get('folio'), dte.get('emisor_rut') or '')
+        for dte in aceptados
+    ]
+    contabilizados = verificar_contabilizados(
+        api_get, rut, claves, None, TIPO_DTE_A_INTERNO,
+        fechas=[dte.get('fecha') for dte in aceptados],
+        cache=get_cache_contabilizados(),
+    )
+    
+    for dte, (tipo_interno, _, _), doc in zip(aceptados, claves, contabilizados):
         if doc:
             ya_contabilizados.append({**dte, 'tipo_interno': tipo_interno})
         else:
@@ -232,13 +202,15 @@ def obtener_pendientes_empresa(rut: str) -> dict:
         total_cargos = 0
         resumen_bancos = []
         
-        for cuenta in cuentas_banco:
+        # Obtener movimientos (cuentas en paralelo, resultado en orden del balance)
+        movimientos_por_cuenta = mapear_concurrente(
+            lambda c: obtener_movimientos_banco(api_get, rut, c['idCuenta']), cuentas_banco, CUENTA_WORKERS
+        )
+        
+        for cuenta, all_movimientos in zip(cuentas_banco, movimientos_por_cuenta):
             codigo = cuenta['idCuenta']
             nombre = cuenta['cuenta']
             
-            # Obtener movimientos
-            all_movimientos = api_get_all(rut, f'/bancos/{codigo}')
-            
             # Filtrar no conciliados
             sin_conciliar = [m for m in all_movimientos if not m.get('conciliado', True)]
             
@@ -305,20 +277,30 @@ def obtener_pendientes(empresa_id: str = None) -> dict:
     """
     
     reporte = {
-        'generado': datetime.now().isoformat(),
-        'version': '1.0',
-        'sistema': 'skualo',
+        **_cabecera_reporte(),
         'empresas': [],
-        'resumen': {
-            'total_sii': 0,
-            'total_sii_monto': 0,
-            'total_contabilizar': 0,
-            'total_contabilizar_monto': 0,
-            'total_conciliar': 0,
-        }
+        'resumen': _resumen_vacio(),
     }
     
-    # Determinar empresas a procesar
+    for pendientes in iterar_pendientes(empresa_id):
+        reporte['empresas'].append(pendientes)
+        _acumular_resumen(reporte['resumen'], pendientes)
+    
+    return reporte
+
+
+def iterar_pendientes(empresa_id: str = None):
+    """
+    Pendientes de cada empresa, entregados a medida que se terminan de
+    consultar. Las empresas con error se entregan con 'error'.
+    
+    Una empresa desconocida lanza ValueError al llamar (no al iterar).
+    """
+    return _iterar_ruts(_ruts_empresas(empresa_id))
+
+
+def _ruts_empresas(empresa_id: str = None) -> list:
+    """RUTs a procesar: una empresa (ID o RUT) o todas."""
     if empresa_id:
         if '-' in empresa_id:
             ruts = [empresa_id]
@@ -328,40 +310,68 @@ def obtener_pendientes(empresa_id: str = None) -> dict:
             raise ValueError(f"Empresa '{empresa_id}' no encontrada")
     else:
         ruts = [data['rut'] for data in TENANTS.values()]
-    
+    return ruts
+
+
+def _iterar_ruts(ruts: list):
     for rut in ruts:
         try:
             print(f"   Procesando {rut}...")
-            pendientes = obtener_pendientes_empresa(rut)
-            reporte['empresas'].append(pendientes)
-            
-            # Acumular totales
-            reporte['resumen']['total_sii'] += pendientes['pendientes_sii']['cantidad']
-            reporte['resumen']['total_sii_monto'] += pendientes['pendientes_sii']['total']
-            reporte['resumen']['total_contabilizar'] += pendientes['pendientes_contabilizar']['cantidad']
-            reporte['resumen']['total_contabilizar_monto'] += pendientes['pendientes_contabilizar']['total']
-            reporte['resumen']['total_conciliar'] += pendientes['pendientes_conciliar']['cantidad']
-            
+            yield obtener_pendientes_empresa(rut)
         except Exception as e:
             nombre = rut
             for key, data in TENANTS.items():
                 if data['rut'] == rut:
                     nombre = data.get('nombre', key)
-            reporte['empresas'].append({
+            yield {
                 'empresa': nombre,
                 'rut': rut,
                 'error': str(e),
-            })
-    
-    return reporte
+            }
+
+
+def _cabecera_reporte() -> dict:
+    return {
+        'generado': datetime.now().isoformat(),
+        'version': '1.0',
+        'sistema': 'skualo',
+    }
+
+
+def _resumen_vacio() -> dict:
+    return {
+        'total_sii': 0,
+        'total_sii_monto': 0,
+        'total_contabilizar': 0,
+        'total_contabilizar_monto': 0,
+        'total_conciliar': 0,
+    }
+
+
+def _acumular_resumen(resumen: dict, pendientes: dict):
+    """Suma los totales de una empresa al resumen (las empresas con error no suman)."""
+    if 'error' in pendientes:
+        return
+    resumen['total_sii'] += pendientes['pendientes_sii']['cantidad']
+    resumen['total_sii_monto'] += pendientes['pendientes_sii']['total']
+    resumen['total_contabilizar'] += pendientes['pendientes_contabilizar']['cantidad']
+    resumen['total_contabilizar_monto'] += pendientes['pendientes_contabilizar']['total']
+    resumen['total_conciliar'] += pendientes['pendientes_conciliar']['cantidad']
 
 
 def main():
-    """Función principal."""
+    """
+    Función principal.
+    
+    Cada empresa se escribe en el archivo apenas termina su consulta, así
+    el reporte completo no queda en memoria. Retorna la cabecera y el
+    resumen del reporte, con la ruta del archivo en 'archivo'.
+    """
     
     # Parsear argumentos
     empresa_id = None
     output_file = None
+    formato = 'json'
     
     args = sys.argv[1:]
     i = 0
@@ -369,6 +379,9 @@ def main():
         if args[i] == '--output' and i + 1 < len(args):
             output_file = args[i + 1]
             i += 2
+        elif args[i] == '--formato' and i + 1 < len(args):
+            formato = args[i + 1]
+            i += 2
         elif not args[i].startswith('--'):
             empresa_id = args[i]
             i += 1
@@ -384,49 +397,49 @@ def main():
         print("❌ Error: SKUALO_API_TOKEN no configurado en .env")
         sys.exit(1)
     
-    # Obtener datos
+    if output_file is None:
+        output_dir = SCRIPT_DIR.parent.parent / 'temp'
+        output_dir.mkdir(exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        sufijo = f"_{empresa_id}" if empresa_id else ""
+        extension = 'ndjson' if formato == 'ndjson' else 'json'
+        output_file = output_dir / f'pendientes_skualo{sufijo}_{timestamp}.{extension}'
+    
+    # Consultar y escribir cada empresa a medida que termina
     print("📊 Consultando pendientes...")
-    reporte = obtener_pendientes(empresa_id)
+    cabecera = _cabecera_reporte()
+    resumen = _resumen_vacio()
     
-    # Mostrar resumen
-    print()
-    print("=" * 70)
-    print("   RESUMEN")
-    print("=" * 70)
+    empresas = iterar_pendientes(empresa_id)
     
-    for emp in reporte['empresas']:
-        if 'error' in emp:
-            print(f"\n❌ {emp['empresa']}: {emp['error']}")
-            continue
+    with SalidaReporte(output_file, formato, cabecera, DETALLE_NDJSON) as salida:
+        for emp in empresas:
+            salida.empresa(emp)
+            _acumular_resumen(resumen, emp)
+            
+            if 'error' in emp:
+                print(f"\n❌ {emp['empresa']}: {emp['error']}")
+                continue
+            
+            print(f"\n🏢 {emp['empresa']} ({emp['rut']})")
+            print(f"   📄 SII pendientes: {emp['pendientes_sii']['cantidad']} docs (${emp['pendientes_sii']['total']:,.0f})")
+            print(f"   📝 Por contabilizar: {emp['pendientes_contabilizar']['cantidad']} docs (${emp['pendientes_contabilizar']['total']:,.0f})")
+            print(f"   🏦 Por conciliar: {emp['pendientes_conciliar']['cantidad']} movimientos")
         
-        print(f"\n🏢 {emp['empresa']} ({emp['rut']})")
-        print(f"   📄 SII pendientes: {emp['pendientes_sii']['cantidad']} docs (${emp['pendientes_sii']['total']:,.0f})")
-        print(f"   📝 Por contabilizar: {emp['pendientes_contabilizar']['cantidad']} docs (${emp['pendientes_contabilizar']['total']:,.0f})")
-        print(f"   🏦 Por conciliar: {emp['pendientes_conciliar']['cantidad']} movimientos")
+        salida.resumen(resumen)
     
     print()
     print("-" * 70)
     print(f"📊 TOTALES:")
-    print(f"   Documentos SII: {reporte['resumen']['total_sii']} (${reporte['resumen']['total_sii_monto']:,.0f})")
-    print(f"   Por contabilizar: {reporte['resumen']['total_contabilizar']} (${reporte['resumen']['total_contabilizar_monto']:,.0f})")
-    print(f"   Movimientos banco: {reporte['resumen']['total_conciliar']}")
-    
-    # Guardar JSON
-    if output_file is None:
-        output_dir = SCRIPT_DIR.parent.parent / 'temp'
-        output_dir.mkdir(exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        sufijo = f"_{empresa_id}" if empresa_id else ""
-        output_file = output_dir / f'pendientes_skualo{sufijo}_{timestamp}.json'
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(reporte, f, cls=JSONEncoder, ensure_ascii=False, indent=2)
+    print(f"   Documentos SII: {resumen['total_sii']} (${resumen['total_sii_monto']:,.0f})")
+    print(f"   Por contabilizar: {resumen['total_contabilizar']} (${resumen['total_contabilizar_monto']:,.0f})")
+    print(f"   Movimientos banco: {resumen['total_conciliar']}")
     
     print()
     print(f"✅ JSON guardado: {output_file}")
     print("=" * 70)
     
-    return reporte
+    return {**cabecera, 'resumen': resumen, 'archivo': str(output_file)}
 
 
 if __name__ == '__main__':
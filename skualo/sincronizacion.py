@@ -0,0 +1,244 @@
+"""
+Sincronización incremental de DTEs recibidos y movimientos bancarios.
+
+/sii/dte/recibidos devuelve el historial completo de la empresa, pero para
+los controles solo importan los DTEs recientes (la ventana de 8 días de
+aceptación tácita). En modo incremental se guarda el historial en la caché
+local (skualo.cache.DtesRecibidosCache) y en cada corrida solo se
+descargan los DTEs creados desde la marca de agua (mayor creadoEl guardado).
+
+Para no perder cambios de estado (fechaRespuesta), siempre se relee la
+ventana de aceptación completa aunque la marca de agua sea más reciente.
+
+Límite: un DTE que aparece con creadoEl anterior al corte (carga
+retroactiva) o que se elimina en Skualo no se detecta en modo
+incremental. Por eso cada SKUALO_DTE_RECONCILIAR_DIAS se hace una
+descarga completa que reemplaza el historial guardado (DtesRecibidosCache
+.reemplazar): entra lo retroactivo y se borra lo que la API ya no entrega.
+
+Estrategias, en orden:
+    1. Filtro de fecha en la API (SKUALO_DTE_PARAM_DESDE=<nombre del parámetro>)
+    2. Corte temprano: se recorren las páginas en orden y se para en la
+       primera página que llega a DTEs anteriores al corte. Requiere que
+       la API entregue los DTEs del más nuevo al más antiguo; si no, se
+       descarga todo (como el modo normal).
+
+Los movimientos bancarios siguen la misma idea (skualo.cache.MovimientosBancoCache):
+se guardan por GUID, se descargan solo las páginas recientes (según `fecha`)
+y los movimientos que seguían sin conciliar se vuelven a consultar uno a
+uno con GET /bancos/{idCuenta}/{id}, en paralelo, para ver si ya se concilió.
+Si la API responde que el movimiento no existe (404: eliminado o anulado
+en Skualo), se borra de la caché para que no siga contando como pendiente.
+
+Toda la sincronización consulta con api_get(..., estricto=True) (ver
+skualo.trafico.get_json): None significa 404 y nada más. Un 401/403 (token
+vencido, sin permiso) o un cuerpo inválido lanza ApiSkualoRechazo, y un
+error transitorio ApiSkualoNoDisponible; en ambos casos la sincronización
+se corta y la caché queda como estaba.
+
+Configuración (.env, todas opcionales):
+    SKUALO_DTE_INCREMENTAL=false    # true = usar sincronización incremental
+    SKUALO_DTE_PARAM_DESDE=         # Parámetro de fecha de la API, si existe
+    SKUALO_DTE_DIAS_RELECTURA=9     # Días hacia atrás que siempre se releen
+    SKUALO_DTE_RECONCILIAR_DIAS=7   # Cada cuántos días se descarga todo (0 = solo la primera vez)
+    SKUALO_BANCO_INCREMENTAL=false  # true = movimientos bancarios incrementales
+    SKUALO_BANCO_DIAS_RELECTURA=15  # Días hacia atrás que siempre se releen
+"""
+
+import os
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, List, Optional
+
+from common.entorno import env_bool, env_int
+
+from .api import PAGE_SIZE, paginar, mapear_concurrente, _items_pagina, _hay_siguiente
+from .cache import get_cache_dtes, get_cache_movimientos
+from .trafico import ApiSkualoRechazo
+
+ENDPOINT_DTES = '/sii/dte/recibidos'
+
+INCREMENTAL = env_bool('SKUALO_DTE_INCREMENTAL', False)
+PARAM_DESDE = (os.getenv('SKUALO_DTE_PARAM_DESDE') or '').strip() or None
+DIAS_RELECTURA = env_int('SKUALO_DTE_DIAS_RELECTURA', 9)
+RECONCILIAR_DIAS = env_int('SKUALO_DTE_RECONCILIAR_DIAS', 7)
+
+BANCO_INCREMENTAL = env_bool('SKUALO_BANCO_INCREMENTAL', False)
+BANCO_DIAS_RELECTURA = env_int('SKUALO_BANCO_DIAS_RELECTURA', 15)
+
+
+def _paginar_hasta(api_get: Callable, rut: str, endpoint: str, campo: str, corte: str,
+                   page_size: int = PAGE_SIZE) -> Optional[List]:
+    """
+    Recorre las páginas hasta la primera que cruza el corte (según `campo`).
+
+    Retorna None si la API no entrega los registros del más nuevo al más
+    antiguo (en ese caso el corte temprano no es confiable). Lanza
+    ApiSkualoRechazo si el listado no existe (404 en la primera página).
+    """
+    def fecha(item):
+        return str(item.get(campo) or '')
+
+    registros = []
+    page = 1
+    while True:
+        data = api_get(rut, endpoint, {'PageSize': page_size, 'Page': page})
+        if data is None and page == 1:
+            raise ApiSkualoRechazo(f'Listado no disponible (404): {endpoint}', 404)
+        if not data:
+            return registros
+        items = _items_pagina(data)
+        fechas = [fecha(i) for i in items if fecha(i)]
+        if page == 1 and fechas and fechas[0] < fechas[-1]:
+            return None
+        registros.extend(i for i in items if fecha(i) >= corte or not fecha(i))
+        # Orden descendente: si esta página ya cruzó el corte, las siguientes son más antiguas
+        if not _hay_siguiente(data) or (fechas and min(fechas) < corte):
+            return registros
+        page += 1
+
+
+def sincronizar_dtes_recibidos(api_get: Callable, rut: str, cache,
+                               workers: int = None,
+                               dias_relectura: int = None,
+                               param_desde: str = None,
+                               reconciliar_dias: int = None) -> List:
+    """
+    Actualiza la caché de DTEs recibidos y retorna el historial completo.
+
+    Args:
+        api_get: Función (rut, endpoint, params=None, estricto=False) -> dict | None
+        rut: RUT de la empresa
+        cache: DtesRecibidosCache donde se guarda el historial
+        workers: Páginas simultáneas para descargas completas
+        dias_relectura: Días hacia atrás que siempre se releen (default SKUALO_DTE_DIAS_RELECTURA)
+        param_desde: Parámetro de fecha de la API (default SKUALO_DTE_PARAM_DESDE)
+        reconciliar_dias: Días entre descargas completas (default SKUALO_DTE_RECONCILIAR_DIAS)
+
+    Returns:
+        Lista de DTEs (del más nuevo al más antiguo)
+    """
+    if dias_relectura is None:
+        dias_relectura = DIAS_RELECTURA
+    if reconciliar_dias is None:
+        reconciliar_dias = RECONCILIAR_DIAS
+    param_desde = param_desde or PARAM_DESDE
+    api_get = partial(api_get, estricto=True)
+
+    marca = cache.marca_de_agua(rut)
+    completa = cache.ultima_completa(rut)
+    vencida = reconciliar_dias > 0 and (
+        not completa
+        or completa < (datetime.now() - timedelta(days=reconciliar_dias)).isoformat()
+    )
+    if not marca or vencida:
+        # Primera corrida o reconciliación periódica: historial completo
+        cache.reemplazar(rut, paginar(api_get, rut, ENDPOINT_DTES, workers=workers))
+        return cache.obtener(rut)
+
+    ventana = (datetime.now() - timedelta(days=dias_relectura)).isoformat()
+    corte = min(marca, ventana)
+
+    if param_desde:
+        nuevos = paginar(api_get, rut, ENDPOINT_DTES, {param_desde: corte[:10]}, workers=workers)
+    else:
+        nuevos = _paginar_hasta(api_get, rut, ENDPOINT_DTES, 'creadoEl', corte)
+        if nuevos is None:
+            # Sin orden descendente se descargó todo: sirve como reconciliación
+            cache.reemplazar(rut, paginar(api_get, rut, ENDPOINT_DTES, workers=workers))
+            return cache.obtener(rut)
+
+    cache.guardar(rut, nuevos)
+    return cache.obtener(rut)
+
+
+def obtener_dtes_recibidos(api_get: Callable, rut: str, incremental: bool = None,
+                           workers: int = None) -> List:
+    """
+    DTEs recibidos de la empresa.
+
+    Con modo incremental (y caché habilitada) sincroniza contra la caché
+    local; si no, descarga el endpoint completo.
+    """
+    if incremental is None:
+        incremental = INCREMENTAL
+    cache = get_cache_dtes() if incremental else None
+    if cache is None:
+        return paginar(api_get, rut, ENDPOINT_DTES, workers=workers)
+    return sincronizar_dtes_recibidos(api_get, rut, cache, workers=workers)
+
+
+def sincronizar_movimientos_banco(api_get: Callable, rut: str, cuenta: str, cache,
+                                  workers: int = None,
+                                  dias_relectura: int = None) -> List:
+    """
+    Actualiza la caché de movimientos de una cuenta y retorna su historial.
+
+    1. Sin historial guardado: descarga completa.
+    2. Con historial: páginas recientes (desde la marca de agua de `fecha`,
+       o desde hace `dias_relectura` días si es anterior).
+    3. Los movimientos guardados sin conciliar que no vinieron en esas
+       páginas se consultan con GET /bancos/{cuenta}/{id}; los que ya no
+       existen (404) se eliminan de la caché.
+
+    Args:
+        api_get: Función (rut, endpoint, params=None, estricto=False) -> dict | None
+        rut: RUT de la empresa
+        cuenta: Código de la cuenta contable del banco (idCuenta)
+        cache: MovimientosBancoCache donde se guarda el historial
+        workers: Requests simultáneos
+        dias_relectura: Días hacia atrás que siempre se releen (default SKUALO_BANCO_DIAS_RELECTURA)
+
+    Returns:
+        Lista de movimientos de la cuenta (del más nuevo al más antiguo)
+    """
+    if dias_relectura is None:
+        dias_relectura = BANCO_DIAS_RELECTURA
+    api_get = partial(api_get, estricto=True)
+    endpoint = f'/bancos/{cuenta}'
+
+    marca = cache.marca_de_agua(rut, cuenta)
+    if not marca:
+        cache.guardar(rut, cuenta, paginar(api_get, rut, endpoint, workers=workers))
+        return cache.obtener(rut, cuenta)
+
+    ventana = (datetime.now() - timedelta(days=dias_relectura)).isoformat()
+    recientes = _paginar_hasta(api_get, rut, endpoint, 'fecha', min(marca, ventana))
+    if recientes is None:
+        recientes = paginar(api_get, rut, endpoint, workers=workers)
+    cache.guardar(rut, cuenta, recientes)
+
+    # Pendientes antiguos: ver si ya se conciliaron
+    vistos = {str(m.get('id')) for m in recientes}
+    pendientes = [m for m in cache.sin_conciliar(rut, cuenta) if str(m.get('id')) not in vistos]
+
+    def releer(movimiento):
+        return api_get(rut, f'{endpoint}/{movimiento["id"]}')
+
+    # Un error transitorio o un 401/403 lanza excepción: la caché no se toca
+    respuestas = mapear_concurrente(releer, pendientes, workers)
+    cache.guardar(rut, cuenta, [
+        {**movimiento, **data} for movimiento, data in zip(pendientes, respuestas) if isinstance(data, dict)
+    ])
+    # None = la API respondió 404: el movimiento se eliminó o anuló en Skualo
+    cache.eliminar(rut, cuenta, [
+        movimiento['id'] for movimiento, data in zip(pendientes, respuestas) if data is None
+    ])
+
+    return cache.obtener(rut, cuenta)
+
+
+def obtener_movimientos_banco(api_get: Callable, rut: str, cuenta: str,
+                              incremental: bool = None, workers: int = None) -> List:
+    """
+    Movimientos de una cuenta bancaria.
+
+    Con modo incremental (y caché habilitada) sincroniza contra la caché
+    local; si no, descarga el historial completo.
+    """
+    if incremental is None:
+        incremental = BANCO_INCREMENTAL
+    cache = get_cache_movimientos() if incremental else None
+    if cache is None:
+        return paginar(api_get, rut, f'/bancos/{cuenta}', workers=workers)
+    return sincronizar_movimientos_banco(api_get, rut, cuenta, cache, workers=workers)
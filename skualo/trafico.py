@@ -0,0 +1,502 @@
+"""
+Control de tráfico hacia la API de Skualo.
+
+Evita que un 429 o un 5xx pasajero corte una paginación a medias (antes la
+página fallida devolvía None y paginar() terminaba ahí, con la lista
+truncada). Cada GET pasa por:
+
+    1. Circuit breaker por empresa: tras SKUALO_CIRCUITO_FALLOS errores
+       seguidos (5xx / conexión) las llamadas fallan de inmediato durante
+       SKUALO_CIRCUITO_PAUSA segundos; después se deja pasar una de prueba.
+    2. Token bucket global: como máximo SKUALO_RATE requests por segundo
+       (ráfagas de hasta SKUALO_RATE_RAFAGA). Un 429 con Retry-After pausa
+       el bucket para todos los hilos, no solo para el que lo recibió.
+    3. Concurrencia adaptativa por empresa (AIMD): el límite de requests
+       simultáneos sube en 1 por cada ventana de respuestas OK y se reduce
+       a la mitad con cada 429/503, entre 1 y SKUALO_CONCURRENCIA_MAX.
+    4. Reintentos: solo 429, 5xx y errores de conexión, con backoff
+       exponencial con jitter (o el Retry-After del servidor). Un 404 u
+       otro 4xx no se reintenta y se entrega como None, como antes.
+
+Si se agotan los reintentos (o el circuito está abierto) se lanza
+ApiSkualoNoDisponible en vez de devolver None: así un error persistente
+no se confunde con "no hay más datos".
+
+Con estricto=True solo un 404 se entrega como None; un 401/403 (token
+vencido, sin permiso), otro 4xx o un cuerpo que no es JSON lanzan
+ApiSkualoRechazo. Lo usa la sincronización incremental, que borra de la
+caché lo que la API dice que ya no existe.
+
+Configuración (.env, todas opcionales):
+    SKUALO_RATE=0                   # Requests por segundo (0 = sin límite fijo)
+    SKUALO_RATE_RAFAGA=20           # Requests que pueden salir de una vez
+    SKUALO_REINTENTOS=4             # Reintentos por request
+    SKUALO_BACKOFF_BASE=0.5         # Segundos del primer reintento (se duplica)
+    SKUALO_BACKOFF_MAX=30           # Espera máxima entre reintentos
+    SKUALO_CIRCUITO_FALLOS=5        # Errores seguidos que abren el circuito
+    SKUALO_CIRCUITO_PAUSA=30        # Segundos con el circuito abierto
+    SKUALO_CONCURRENCIA_MAX=16      # Requests simultáneos máximos por empresa
+
+Uso:
+    from skualo.trafico import get_json
+    data = get_json(rut, url, headers=headers, params=params)   # None si 404/4xx
+    data = get_json(rut, url, headers=headers, estricto=True)   # None solo si 404
+
+AsyncSkualoControl usa las mismas piezas con asyncio (ControlTrafico decide,
+quien llama espera con asyncio.sleep). estadisticas() entrega los contadores
+por empresa.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+
+from common.entorno import env_float, env_int
+
+from .api import get_session
+
+
+TRAFICO_CONFIG = {
+    'rate': env_float('SKUALO_RATE', 0),
+    'rafaga': env_int('SKUALO_RATE_RAFAGA', 20),
+    'reintentos': env_int('SKUALO_REINTENTOS', 4),
+    'backoff_base': env_float('SKUALO_BACKOFF_BASE', 0.5),
+    'backoff_max': env_float('SKUALO_BACKOFF_MAX', 30),
+    'circuito_fallos': env_int('SKUALO_CIRCUITO_FALLOS', 5),
+    'circuito_pausa': env_float('SKUALO_CIRCUITO_PAUSA', 30),
+    'concurrencia_max': env_int('SKUALO_CONCURRENCIA_MAX', 16),
+}
+
+# Respuestas que indican que hay que bajar el ritmo (además de reintentar)
+STATUS_SATURADO = (429, 503)
+
+
+class ApiSkualoNoDisponible(Exception):
+    """La API sigue fallando (429/5xx/conexión) tras los reintentos, o el circuito está abierto."""
+
+
+class ApiSkualoRechazo(Exception):
+    """Respuesta definitiva que no es un 404 (401/403, otro 4xx o cuerpo no JSON), en modo estricto."""
+
+    def __init__(self, mensaje: str, status: Optional[int] = None):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def es_reintentable(status: Optional[int]) -> bool:
+    """True para 429, 5xx y errores de conexión (status None)."""
+    return status is None or status == 429 or status >= 500
+
+
+def segundos_retry_after(valor: Optional[str]) -> Optional[float]:
+    """Header Retry-After (segundos o fecha HTTP) a segundos de espera."""
+    if not valor:
+        return None
+    valor = valor.strip()
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+
+
+def espera_reintento(intento: int, retry_after: Optional[float] = None, config: dict = None) -> float:
+    """
+    Segundos a esperar antes del reintento `intento` (0 = primer reintento).
+
+    Backoff exponencial con jitter completo; si el servidor mandó
+    Retry-After se respeta, con un poco de jitter para que los hilos que
+    recibieron el mismo 429 no vuelvan todos en el mismo instante.
+    """
+    config = config or TRAFICO_CONFIG
+    base, maximo = config['backoff_base'], config['backoff_max']
+    if retry_after is not None:
+        return min(retry_after, maximo) + random.uniform(0, base)
+    return random.uniform(0, min(maximo, base * 2 ** intento))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TOKEN BUCKET
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TokenBucket:
+    """
+    Límite de tasa compartido por todos los hilos (y el event loop).
+
+    reservar() no bloquea: descuenta un token y retorna cuántos segundos
+    hay que esperar para usarlo, así sirve igual con time.sleep que con
+    asyncio.sleep.
+    """
+
+    def __init__(self, tasa: float, rafaga: int):
+        self.tasa = tasa
+        self.rafaga = max(1, rafaga)
+        self._tokens = float(self.rafaga)
+        self._ultimo = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        with self._lock:
+            ahora = time.monotonic()
+            if self.tasa <= 0:
+                return max(0.0, self._pausa_hasta - ahora)
+            self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            self._tokens -= 1
+            espera = -self._tokens / self.tasa if self._tokens < 0 else 0.0
+            return max(espera, self._pausa_hasta - ahora)
+
+    def pausar(self, segundos: float):
+        """Nadie sale antes de `segundos` (Retry-After de un 429)."""
+        with self._lock:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CIRCUIT BREAKER
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class CircuitBreaker:
+    """
+    Cerrado: todo pasa. Abierto: todo falla de inmediato por `pausa`
+    segundos. Semiabierto: pasa un request de prueba; si responde, se
+    cierra, y si falla, se vuelve a abrir.
+
+    Solo quien tomó la prueba (permitir() == 'prueba') la entrega, con
+    exito/fallo(prueba=True) o liberar(): un request que entró con el
+    circuito cerrado y termina durante el semiabierto no la suelta.
+    """
+
+    def __init__(self, fallos: int, pausa: float):
+        self.umbral = max(1, fallos)
+        self.pausa = pausa
+        self.fallos = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        if self.fallos < self.umbral:
+            return 'cerrado'
+        return 'abierto' if time.monotonic() < self._abierto_hasta else 'semiabierto'
+
+    def permitir(self) -> Optional[str]:
+        """'cerrado' o 'prueba' si el request puede salir; None si no."""
+        with self._lock:
+            estado = self.estado
+            if estado == 'cerrado':
+                return 'cerrado'
+            if estado == 'semiabierto' and not self._probando:
+                self._probando = True
+                return 'prueba'
+            return None
+
+    def exito(self, prueba: bool = False):
+        with self._lock:
+            self.fallos = 0
+            if prueba:
+                self._probando = False
+
+    def fallo(self, prueba: bool = False):
+        with self._lock:
+            self.fallos += 1
+            if prueba:
+                self._probando = False
+            if self.fallos >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.pausa
+
+    def liberar(self):
+        """
+        Suelta la prueba en curso sin cambiar el estado (429, excepción
+        inesperada): el siguiente request vuelve a ser la prueba.
+        """
+        with self._lock:
+            self._probando = False
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONCURRENCIA ADAPTATIVA
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ConcurrenciaAdaptativa:
+    """
+    Límite de requests simultáneos que se ajusta con lo que responde la API
+    (AIMD, como el control de congestión de TCP):
+
+    - Cada respuesta OK suma 1/límite: tras una ventana completa de
+      respuestas OK el límite sube en 1.
+    - Un 429/503 lo reduce a la mitad (como máximo una vez por segundo,
+      para que los 429 de una misma ventana no lo derrumben).
+
+    adquirir()/liberar() bloquean hilos; ConcurrenciaAdaptativaAsync es la
+    versión para asyncio.
+    """
+
+    def __init__(self, maximo: int, minimo: int = 1, inicial: int = None):
+        self.maximo = max(1, maximo)
+        self.minimo = max(1, min(minimo, self.maximo))
+        self._limite = float(min(self.maximo, inicial or self.maximo))
+        self._ultima_baja = 0.0
+        self.en_curso = 0
+        self.contadores = {'ok': 0, 'saturado': 0, 'error': 0, 'reintentos': 0}
+        self._lock = threading.Lock()
+        self._libre = threading.Condition(self._lock)
+
+    @property
+    def limite(self) -> int:
+        return int(self._limite)
+
+    def exito(self):
+        with self._lock:
+            self.contadores['ok'] += 1
+            self._limite = min(self.maximo, self._limite + 1 / self._limite)
+
+    def saturado(self):
+        with self._lock:
+            self.contadores['saturado'] += 1
+            ahora = time.monotonic()
+            if ahora - self._ultima_baja >= 1:
+                self._limite = max(self.minimo, self._limite / 2)
+                self._ultima_baja = ahora
+
+    def error(self):
+        with self._lock:
+            self.contadores['error'] += 1
+
+    def reintento(self):
+        with self._lock:
+            self.contadores['reintentos'] += 1
+
+    def adquirir(self):
+        with self._libre:
+            self._libre.wait_for(lambda: self.en_curso < self.limite)
+            self.en_curso += 1
+
+    def liberar(self):
+        with self._libre:
+            self.en_curso -= 1
+            self._libre.notify_all()
+
+
+class ConcurrenciaAdaptativaAsync(ConcurrenciaAdaptativa):
+    """ConcurrenciaAdaptativa para corrutinas de un mismo event loop."""
+
+    def __init__(self, maximo: int, minimo: int = 1, inicial: int = None):
+        super().__init__(maximo, minimo, inicial)
+        self._libre_async = asyncio.Condition()
+
+    async def adquirir(self):
+        async with self._libre_async:
+            await self._libre_async.wait_for(lambda: self.en_curso < self.limite)
+            self.en_curso += 1
+
+    async def liberar(self):
+        async with self._libre_async:
+            self.en_curso -= 1
+            self._libre_async.notify_all()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONTROL POR EMPRESA
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ControlTrafico:
+    """
+    Estado de tráfico de una empresa: circuito, concurrencia y reintentos.
+
+    El bucket de tasa es global (el límite de la API es por token, no por
+    empresa). La espera y el GET los hace quien llama (time.sleep o
+    asyncio.sleep): esta clase solo decide.
+    """
+
+    def __init__(self, rut: str, bucket: TokenBucket, concurrencia: ConcurrenciaAdaptativa = None,
+                 config: dict = None):
+        self.config = config or TRAFICO_CONFIG
+        self.rut = rut
+        self.bucket = bucket
+        self.circuito = CircuitBreaker(self.config['circuito_fallos'], self.config['circuito_pausa'])
+        self.concurrencia = concurrencia or ConcurrenciaAdaptativa(self.config['concurrencia_max'])
+
+    @property
+    def reintentos(self) -> int:
+        return self.config['reintentos']
+
+    def antes(self) -> Tuple[float, bool]:
+        """
+        (segundos a esperar antes de enviar, si el request es la prueba del
+        circuito semiabierto). Lanza ApiSkualoNoDisponible si el circuito está abierto.
+        """
+        permiso = self.circuito.permitir()
+        if not permiso:
+            raise ApiSkualoNoDisponible(
+                f"API Skualo no disponible para {self.rut}: circuito abierto tras "
+                f"{self.circuito.fallos} errores seguidos"
+            )
+        return self.bucket.reservar(), permiso == 'prueba'
+
+    def despues(self, status: Optional[int], retry_after: Optional[float], intento: int,
+                prueba: bool = False) -> Optional[float]:
+        """
+        Registra la respuesta (status None = error de conexión). Si el request
+        era la prueba del circuito (`prueba`), queda entregada.
+
+        Returns:
+            None si no hay que reintentar (respuesta OK o 4xx definitivo), o
+            los segundos a esperar antes del reintento.
+
+        Raises:
+            ApiSkualoNoDisponible si la respuesta es reintentable pero ya
+            no quedan reintentos.
+        """
+        if not es_reintentable(status):
+            # 2xx o 4xx definitivo (404...): la API responde
+            self.circuito.exito(prueba)
+            if 200 <= status < 300:
+                self.concurrencia.exito()
+            return None
+
+        if status in STATUS_SATURADO:
+            self.concurrencia.saturado()
+        else:
+            self.concurrencia.error()
+        if status != 429:
+            self.circuito.fallo(prueba)
+        elif prueba:
+            # Un 429 es control de tasa, no una caída del servicio
+            self.circuito.liberar()
+        if retry_after is not None:
+            self.bucket.pausar(retry_after)
+
+        if intento >= self.reintentos:
+            detalle = f'HTTP {status}' if status else 'error de conexión'
+            raise ApiSkualoNoDisponible(
+                f"API Skualo no disponible para {self.rut}: {detalle} tras {intento + 1} intentos"
+            )
+        self.concurrencia.reintento()
+        return espera_reintento(intento, retry_after, self.config)
+
+    def estadisticas(self) -> Dict:
+        return {
+            'rut': self.rut,
+            'limite_concurrencia': self.concurrencia.limite,
+            'en_curso': self.concurrencia.en_curso,
+            'circuito': self.circuito.estado,
+            **self.concurrencia.contadores,
+        }
+
+
+_bucket: Optional[TokenBucket] = None
+_traficos: Dict[str, ControlTrafico] = {}
+_lock = threading.Lock()
+
+
+def get_bucket() -> TokenBucket:
+    """Token bucket global, creado en el primer uso."""
+    global _bucket
+    if _bucket is None:
+        with _lock:
+            if _bucket is None:
+                _bucket = TokenBucket(TRAFICO_CONFIG['rate'], TRAFICO_CONFIG['rafaga'])
+    return _bucket
+
+
+def get_trafico(rut: str) -> ControlTrafico:
+    """Control de tráfico (síncrono) de la empresa, creado en el primer uso."""
+    trafico = _traficos.get(rut)
+    if trafico is None:
+        bucket = get_bucket()
+        with _lock:
+            trafico = _traficos.get(rut)
+            if trafico is None:
+                trafico = _traficos[rut] = ControlTrafico(rut, bucket)
+    return trafico
+
+
+def estadisticas() -> list:
+    """Contadores por empresa (respuestas OK, 429/503, errores, reintentos, límite actual)."""
+    return [trafico.estadisticas() for trafico in list(_traficos.values())]
+
+
+def cuerpo_json(exito: bool, status: int, leer: Callable, url: str, estricto: bool = False):
+    """
+    JSON de una respuesta definitiva (sin reintentos pendientes).
+
+    None si es un 4xx o un cuerpo que no es JSON; con `estricto`, None solo
+    para un 404 y ApiSkualoRechazo para el resto.
+    """
+    if not exito:
+        if estricto and status != 404:
+            raise ApiSkualoRechazo(f'HTTP {status}: {url}', status)
+        return None
+    try:
+        return leer()
+    except ValueError as e:
+        if estricto:
+            raise ApiSkualoRechazo(f'Respuesta no JSON: {url}', status) from e
+        print(f'Error API: {e}')
+        return None
+
+
+def get_json(rut: str, url: str, headers: Dict = None, params: Dict = None, timeout: float = 30,
+             estricto: bool = False):
+    """
+    GET a la API de Skualo con límite de tasa, reintentos y circuit breaker.
+
+    Returns:
+        El JSON de la respuesta, o None si la API responde un 4xx definitivo
+        (404...) o un cuerpo que no es JSON. Con `estricto`, None solo si 404.
+
+    Raises:
+        ApiSkualoNoDisponible si tras los reintentos sigue el 429/5xx/error
+        de conexión, o si el circuito de la empresa está abierto.
+        ApiSkualoRechazo (solo con `estricto`) si la respuesta es otro 4xx
+        (401/403...) o no es JSON.
+    """
+    trafico = get_trafico(rut)
+    intento = 0
+    while True:
+        espera, prueba = trafico.antes()
+        try:
+            if espera > 0:
+                time.sleep(espera)
+            error = None
+            trafico.concurrencia.adquirir()
+            try:
+                r = get_session().get(url, headers=headers, params=params, timeout=timeout)
+                status, retry_after = r.status_code, segundos_retry_after(r.headers.get('Retry-After'))
+            except requests.RequestException as e:
+                status, retry_after, error = None, None, e
+            finally:
+                trafico.concurrencia.liberar()
+
+            try:
+                reintentar_en = trafico.despues(status, retry_after, intento, prueba)
+            except ApiSkualoNoDisponible as e:
+                raise e from error
+            finally:
+                prueba = False  # despues ya entregó la prueba
+        finally:
+            if prueba:
+                # Este request era la prueba del circuito semiabierto y salió
+                # por una excepción inesperada: la prueba no queda tomada
+                trafico.circuito.liberar()
+        if reintentar_en is None:
+            break
+        time.sleep(reintentar_en)
+        intento += 1
+
+    return cuerpo_json(r.ok, status, r.json, url, estricto)
@@ -0,0 +1,55 @@
+"""Tests de skualo.api.paginar contra una API falsa (sin red)."""
+
+import threading
+
+import pytest
+
+from skualo.api import paginar
+
+
+class ApiFalsa:
+    """Endpoint paginado con `registros` ítems; registra las páginas pedidas."""
+
+    def __init__(self, registros: int, con_total: bool, falla_en: int = None):
+        self.registros = list(range(registros))
+        self.con_total = con_total
+        self.falla_en = falla_en
+        self.paginas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, rut, endpoint, params=None):
+        page, size = params['Page'], params['PageSize']
+        with self._lock:
+            self.paginas.append(page)
+        if page == self.falla_en:
+            return None
+        items = self.registros[(page - 1) * size:page * size]
+        data = {'items': items, 'next': f'?Page={page + 1}' if page * size < len(self.registros) else None}
+        if self.con_total:
+            data['totalItems'] = len(self.registros)
+        return data
+
+
+@pytest.mark.parametrize('workers', [1, 3, 8])
+@pytest.mark.parametrize('registros', [0, 7, 10, 95])
+def test_paginar_con_total_pide_justo_las_paginas(registros, workers):
+    api = ApiFalsa(registros, con_total=True)
+    assert paginar(api, '1-9', '/x', workers=workers, page_size=10) == list(range(registros))
+    assert sorted(api.paginas) == list(range(1, max(1, -(-registros // 10)) + 1))
+
+
+@pytest.mark.parametrize('workers', [1, 3, 8])
+@pytest.mark.parametrize('registros', [0, 7, 10, 95])
+def test_paginar_sin_total_sigue_next(registros, workers):
+    api = ApiFalsa(registros, con_total=False)
+    assert paginar(api, '1-9', '/x', workers=workers, page_size=10) == list(range(registros))
+    ultima = max(1, -(-registros // 10))
+    # Por lotes de `workers`: a lo más workers - 1 páginas de más tras la última
+    assert set(range(1, ultima + 1)) <= set(api.paginas)
+    assert max(api.paginas) < ultima + workers
+    assert len(api.paginas) == len(set(api.paginas))
+
+
+def test_paginar_corta_en_pagina_fallida():
+    api = ApiFalsa(95, con_total=True, falla_en=4)
+    assert paginar(api, '1-9', '/x', workers=4, page_size=10) == list(range(30))
@@ -0,0 +1,97 @@
+"""Tests de skualo.cache (cachés SQLite locales)."""
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from skualo import cache as cache_mod
+from skualo.cache import BalancesCache, CacheLocal, ContabilizadosCache, periodo_cerrado
+
+
+@pytest.fixture
+def conexiones(monkeypatch):
+    """Registra las conexiones SQLite que abren las cachés."""
+    abiertas = []
+    conectar = sqlite3.connect
+
+    def registrar(*args, **kwargs):
+        conn = conectar(*args, **kwargs)
+        abiertas.append(conn)
+        return conn
+
+    monkeypatch.setattr(cache_mod.sqlite3, 'connect', registrar)
+    return abiertas
+
+
+def _cerrada(conn) -> bool:
+    try:
+        conn.execute('SELECT 1')
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_cache_local_es_abstracta(tmp_path):
+    with pytest.raises(TypeError):
+        CacheLocal(tmp_path / 'cache.db')
+
+
+def test_cada_operacion_cierra_su_conexion(tmp_path, conexiones):
+    cache = ContabilizadosCache(tmp_path / 'cache.db')
+    cache.marcar('1-9', [('33', '10', '2-7')])
+    assert cache.filtrar_confirmados('1-9', [('33', '10', '2-7'), ('33', '11', '2-7')]) == [True, False]
+
+    assert len(conexiones) == 3
+    assert all(_cerrada(conn) for conn in conexiones)
+
+
+def test_error_en_escritura_hace_rollback(tmp_path):
+    cache = ContabilizadosCache(tmp_path / 'cache.db')
+    cache.marcar('1-9', [('33', '10', '2-7')])
+    with pytest.raises(RuntimeError):
+        with cache._conectar() as conn:
+            conn.execute('DELETE FROM contabilizados')
+            raise RuntimeError('falla a mitad de la escritura')
+    assert cache.filtrar_confirmados('1-9', [('33', '10', '2-7')]) == [True]
+
+
+@pytest.mark.parametrize('periodo, cerrado', [
+    ('202511', False),   # mes actual
+    ('202509', False),   # dentro de los 3 meses abiertos
+    ('202508', True),
+    ('202412', True),
+    ('202601', False),   # futuro
+    ('', False),
+    (None, False),
+])
+def test_periodo_cerrado(periodo, cerrado):
+    assert periodo_cerrado(periodo, meses_abiertos=3, hoy=datetime(2025, 11, 15)) is cerrado
+
+
+def test_balance_de_periodo_cerrado_no_vence(tmp_path):
+    cache = BalancesCache(tmp_path / 'cache.db')
+    balance = [{'idCuenta': '1101001', 'saldo': 100}]
+    cache.guardar('1-9', '202001', balance)
+    cache.guardar('1-9', '209912', balance)
+
+    assert cache.obtener('1-9', '202001', ttl=-1) == balance
+    assert cache.obtener('1-9', '209912', ttl=-1) is None
+    assert cache.obtener('1-9', '209912', ttl=3600) == balance
+
+
+def test_balance_obtenido_con_periodo_abierto_vence_aunque_ya_este_cerrado(tmp_path):
+    cache = BalancesCache(tmp_path / 'cache.db')
+    balance = [{'idCuenta': '1101001', 'saldo': 100}]
+    cache.guardar('1-9', '202001', balance)
+    cache.guardar('2-7', '202001', balance)
+    with cache._conectar() as conn:
+        # 1-9: obtenido con enero 2020 aún abierto (hoy ya está cerrado)
+        conn.execute('UPDATE balances SET obtenido_el = ? WHERE rut = ?',
+                     (datetime(2020, 1, 20).timestamp(), '1-9'))
+        # 2-7: obtenido con enero 2020 ya cerrado
+        conn.execute('UPDATE balances SET obtenido_el = ? WHERE rut = ?',
+                     (datetime(2020, 6, 1).timestamp(), '2-7'))
+
+    assert cache.obtener('1-9', '202001', ttl=3600) is None
+    assert cache.obtener('2-7', '202001', ttl=3600) == balance
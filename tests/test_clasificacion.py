@@ -0,0 +1,59 @@
+"""Tests de common.clasificacion: el índice por prefijo equivale al recorrido lineal original."""
+
+import random
+
+from common.clasificacion import ClasificadorCuentas
+
+REGLAS = {
+    'caja': {'nombre': 'Caja', 'cuentas_especificas': ['1101001', '1101002']},
+    'activo_corriente': {'nombre': 'Activo corriente', 'prefijos': ['11'], 'excluir_cuentas': ['1102001']},
+    'deudores': {'nombre': 'Deudores', 'prefijos': ['1102', '1103']},
+    'activo_fijo': {'nombre': 'Activo fijo', 'prefijos': ['12', '1']},
+    'pasivo': {'nombre': 'Pasivo', 'prefijos': ['2']},
+    'patrimonio': {'nombre': 'Patrimonio', 'cuentas_especificas': ['1101002', '3101001']},
+    'resultado_corto': {'nombre': 'Resultado', 'prefijos': ['4101001', '41']},
+}
+
+
+def clasificar_lineal(codigo, reglas):
+    """Recorrido lineal previo a ClasificadorCuentas (skualo balance clasificado)."""
+    for categoria, regla in reglas.items():
+        if 'cuentas_especificas' in regla and codigo in regla['cuentas_especificas']:
+            return categoria
+    for categoria, regla in reglas.items():
+        if 'cuentas_especificas' in regla:
+            continue
+        if codigo in regla.get('excluir_cuentas', []):
+            continue
+        for prefijo in regla.get('prefijos', []):
+            if codigo.startswith(prefijo):
+                return categoria
+    return None
+
+
+def test_casos_de_precedencia():
+    clasificador = ClasificadorCuentas(REGLAS)
+    assert clasificador.clasificar('1101002') == 'caja'          # primera con cuentas_especificas
+    assert clasificador.clasificar('3101001') == 'patrimonio'    # específica sin prefijo
+    assert clasificador.clasificar('1105001') == 'activo_corriente'
+    assert clasificador.clasificar('1102001') == 'deudores'      # excluida de la primera que calza
+    assert clasificador.clasificar('1201001') == 'activo_fijo'
+    assert clasificador.clasificar('4101001') == 'resultado_corto'
+    assert clasificador.clasificar('5101001') is None
+    assert clasificador.clasificar('') is None
+
+
+def test_equivale_al_recorrido_lineal():
+    azar = random.Random(0)
+    codigos = [''.join(azar.choice('0123456') for _ in range(azar.randint(1, 7))) for _ in range(2000)]
+    codigos += ['1101001', '1101002', '1102001', '3101001', '4101001']
+
+    clasificador = ClasificadorCuentas(REGLAS)
+    assert clasificador.clasificar_lote(codigos) == [clasificar_lineal(c, REGLAS) for c in codigos]
+
+
+def test_agrupar_conserva_orden():
+    clasificador = ClasificadorCuentas(REGLAS)
+    assert clasificador.agrupar(['2101', '1105', '9', '2102']) == {
+        'pasivo': ['2101', '2102'], 'activo_corriente': ['1105'], None: ['9'],
+    }
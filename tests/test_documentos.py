@@ -0,0 +1,72 @@
+"""Tests de skualo.documentos (verificación en bloque contra el libro de compras)."""
+
+from datetime import date, timedelta
+
+from skualo.documentos import (IndiceDocumentos, periodos_desde_fechas, periodos_hasta_hoy,
+                               verificar_contabilizados)
+
+TIPOS = {33: 'FACE', 34: 'FCEE'}
+
+
+def test_indice_exige_rut_de_emisor():
+    indice = IndiceDocumentos()
+    indice.agregar('FACE', 100, '76.123.456-7')
+    indice.agregar('FACE', 200, '')
+    assert indice.contiene('face', '100.0', '761234567')
+    assert not indice.contiene('FACE', 100, '11111111-1')
+    assert not indice.contiene('FACE', 200, '761234567')
+    assert indice.coincide_sin_emisor('FACE', 200, '761234567')
+
+
+def test_periodos_hasta_hoy():
+    assert periodos_hasta_hoy('2025-11-20', hoy=date(2026, 1, 5)) == ['202511', '202512', '202601']
+    assert periodos_hasta_hoy('sin fecha') is None
+
+
+def test_periodos_desde_fechas_recientes_hasta_hoy_y_antiguas_con_mes_siguiente():
+    hoy = date(2026, 1, 5)
+    periodos = periodos_desde_fechas(['2025-12-30', '2025-03-10', None], meses_completos=3, hoy=hoy)
+    assert periodos == ['202503', '202504', '202512', '202601']
+
+
+def _api_falsa(libro, documentos, llamadas):
+    def api_get(rut, endpoint, params=None):
+        llamadas.append(endpoint)
+        if '/librocompras/' in endpoint:
+            return libro
+        if endpoint.startswith('/documentos/'):
+            return {'ok': True} if endpoint in documentos else None
+        return None
+    return api_get
+
+
+def test_pendientes_recientes_no_consultan_documentos():
+    hoy = date.today().isoformat()
+    antigua = (date.today() - timedelta(days=800)).isoformat()
+    libro = [
+        {'idTipoDoc': 33, 'numDoc': 1, 'rutEmisor': '1-9'},
+        {'idTipoDoc': 33, 'numDoc': 3},  # Sin RUT de emisor
+    ]
+    claves = [
+        ('FACE', 1, '1-9'),   # En el libro
+        ('FACE', 2, '1-9'),   # Pendiente reciente: el libro basta
+        ('FACE', 3, '2-7'),   # Solo calza sin RUT: se confirma en /documentos
+        ('FACE', 4, '1-9'),   # Antiguo: el libro no cubre hasta hoy
+    ]
+    llamadas = []
+    api_get = _api_falsa(libro, {'/documentos/FACE/4'}, llamadas)
+    resultado = verificar_contabilizados(api_get, '1-9', claves, None, TIPOS, workers=1,
+                                         fechas=[hoy, hoy, hoy, antigua])
+    assert resultado == [True, False, False, True]
+    assert sorted(l for l in llamadas if l.startswith('/documentos/')) == [
+        '/documentos/FACE/3', '/documentos/FACE/4'
+    ]
+
+
+def test_libro_no_descargado_consulta_documentos():
+    hoy = date.today().isoformat()
+    llamadas = []
+    api_get = _api_falsa(None, {'/documentos/FACE/2'}, llamadas)
+    resultado = verificar_contabilizados(api_get, '1-9', [('FACE', 2, '1-9')], None, TIPOS,
+                                         workers=1, fechas=[hoy])
+    assert resultado == [True]
@@ -0,0 +1,34 @@
+"""Tests de common.excel (sin escribir archivos)."""
+
+from common.excel import LibroStreaming, nombre_hoja_unico
+
+
+def test_nombre_hoja_unico_limpia_y_trunca():
+    usados = set()
+    assert nombre_hoja_unico('1101001 Caja [CLP]: a/b', usados) == '1101001 Caja CLP ab'
+    largo = nombre_hoja_unico('2101001 ' + 'Proveedores nacionales por pagar', usados)
+    assert len(largo) == 31
+    assert usados == {'1101001 Caja CLP ab', largo}
+
+
+def test_nombre_hoja_unico_agrega_sufijo():
+    usados = {'Balance Tributario'}
+    nombre = '1101001 Cuenta con un nombre muy largo'
+    primero = nombre_hoja_unico(nombre, usados)
+    segundo = nombre_hoja_unico(nombre, usados)
+    tercero = nombre_hoja_unico(nombre, usados)
+    assert primero == nombre[:31]
+    assert segundo == nombre[:28] + '_1'
+    assert tercero == nombre[:28] + '_2'
+    assert nombre_hoja_unico('Balance Tributario', usados) == 'Balance Tributario_1'
+
+
+def test_estilos_se_registran_una_vez_por_libro():
+    libro = LibroStreaming()
+    estilos = libro.estilos({'total': {}})
+    assert libro.estilos(estilos.definiciones) is estilos
+    assert estilos('total') == {'style': 'total'}
+    assert estilos('total', '#,##0') == {'style': 'total #,##0'}
+    estilos('total')
+    nombres = [n for n in libro.wb.named_styles if n.startswith('total')]
+    assert nombres == ['total', 'total #,##0']
@@ -0,0 +1,79 @@
+"""Tests de skualo.reportes (libro mayor en bloque, sin red)."""
+
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from skualo import reportes
+
+
+BALANCE_DICIEMBRE = [
+    {'idCuenta': '1101001', 'deudor': 1000, 'acreedor': 0},
+    {'idCuenta': '2101001', 'deudor': 0, 'acreedor': 300},
+    {'idCuenta': '4101001', 'deudor': 0, 'acreedor': 5000},
+]
+
+LIBRO_MAYOR = [
+    {'idCuenta': '1101001', 'fecha': '2025-01-10', 'montoDebe': 50, 'montoHaber': 0},
+    {'idCuenta': '1101001', 'fecha': '2025-01-05', 'montoDebe': 0, 'montoHaber': 20},
+    {'idCuenta': '2101001', 'fecha': '2025-02-01', 'montoDebe': 0, 'montoHaber': 100},
+    {'idCuenta': '4101001', 'fecha': '2025-03-01', 'montoDebe': 0, 'montoHaber': 70},
+]
+
+
+def _api_falsa(llamadas):
+    def api_get(rut, endpoint, params=None):
+        llamadas.append(endpoint)
+        if 'balancetributario/202412' in endpoint:
+            return BALANCE_DICIEMBRE
+        if endpoint.startswith(reportes.ENDPOINT_LIBRO_MAYOR):
+            query = parse_qs(urlsplit(endpoint).query)
+            inicio, fin = query['IdCuentaInicio'][0], query['IdCuentaFin'][0]
+            return [m for m in LIBRO_MAYOR if inicio <= m['idCuenta'] <= fin]
+        return None
+    return api_get
+
+
+@pytest.fixture(autouse=True)
+def sin_cache(monkeypatch):
+    monkeypatch.setattr(reportes, 'get_cache_balances', lambda: None)
+
+
+def test_periodo_apertura():
+    assert reportes.periodo_apertura('2025-01-01') == '202412'
+
+
+def test_libro_mayor_parte_del_saldo_de_apertura():
+    llamadas = []
+    detalle = reportes.obtener_detalle_libro_mayor(
+        _api_falsa(llamadas), '1-9', ['1101001', '2101001', '4101001', '1109999'],
+        '2025-01-01', '2025-03-31', workers=1,
+    )
+    # Cuentas de balance: arrastran el saldo de diciembre
+    assert [f['saldo'] for f in detalle['1101001']] == [980, 1030]
+    assert [f['saldo'] for f in detalle['2101001']] == [-400]
+    # Cuentas de resultado: parten en 0
+    assert [f['saldo'] for f in detalle['4101001']] == [-70]
+    assert detalle['1109999'] is None
+
+
+def test_rangos_de_cuentas_por_clase():
+    assert reportes.rangos_de_cuentas(['1102001', '4101001', '1101001', '']) == [
+        ('1101001', '1102001'), ('4101001', '4101001')
+    ]
+
+
+def test_libro_mayor_async_igual_que_sincrono():
+    api_get = _api_falsa([])
+
+    async def api_get_async(rut, endpoint, params=None):
+        return api_get(rut, endpoint, params)
+
+    codigos = ['1101001', '2101001', '4101001']
+    asincrono = asyncio.run(reportes.obtener_detalle_libro_mayor_async(
+        api_get_async, '1-9', codigos, '2025-01-01', '2025-03-31'
+    ))
+    assert asincrono == reportes.obtener_detalle_libro_mayor(
+        api_get, '1-9', codigos, '2025-01-01', '2025-03-31', workers=1
+    )
@@ -0,0 +1,44 @@
+"""Tests de common.salida_json y del orden de common.concurrencia.iterar_concurrente."""
+
+import json
+import time
+
+import pytest
+
+from common.concurrencia import iterar_concurrente
+from common.salida_json import SalidaReporte
+
+
+def test_reporte_completo_se_renombra(tmp_path):
+    archivo = tmp_path / 'reporte.json'
+    with SalidaReporte(archivo, 'json', {'version': '1.0'}) as salida:
+        salida.empresa({'empresa': 'A'})
+        assert not archivo.exists()
+        salida.resumen({'total': 1})
+
+    assert json.loads(archivo.read_text(encoding='utf-8')) == {
+        'version': '1.0', 'empresas': [{'empresa': 'A'}], 'resumen': {'total': 1},
+    }
+    assert [p.name for p in tmp_path.iterdir()] == ['reporte.json']
+
+
+def test_error_a_mitad_no_deja_json_truncado(tmp_path):
+    archivo = tmp_path / 'reporte.json'
+    archivo.write_text('{"anterior": true}', encoding='utf-8')
+
+    with pytest.raises(RuntimeError):
+        with SalidaReporte(archivo, 'compacto', {'version': '1.0'}) as salida:
+            salida.empresa({'empresa': 'A'})
+            raise RuntimeError('falla la consulta')
+
+    assert json.loads(archivo.read_text(encoding='utf-8')) == {'anterior': True}
+    assert [p.name for p in tmp_path.iterdir()] == ['reporte.json']
+
+
+def test_iterar_concurrente_respeta_orden_de_items():
+    def consultar(demora):
+        time.sleep(demora)
+        return demora
+
+    demoras = [0.05, 0.0, 0.02, 0.0]
+    assert list(iterar_concurrente(consultar, demoras, workers=4)) == demoras
@@ -0,0 +1,114 @@
+"""Tests de skualo.sincronizacion contra una API falsa y una caché SQLite temporal."""
+
+import pytest
+
+from skualo.cache import DtesRecibidosCache, MovimientosBancoCache
+from skualo.sincronizacion import sincronizar_dtes_recibidos, sincronizar_movimientos_banco
+from skualo.trafico import ApiSkualoNoDisponible, ApiSkualoRechazo, cuerpo_json
+
+
+def _movimiento(id_, fecha, conciliado=False):
+    return {'id': id_, 'fecha': fecha, 'conciliado': conciliado, 'monto': 100}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MovimientosBancoCache(tmp_path / 'cache.db')
+    cache.guardar('1-9', '1102001', [
+        _movimiento('a', '2020-01-03T00:00:00'),
+        _movimiento('b', '2020-01-02T00:00:00'),
+        _movimiento('c', '2020-01-01T00:00:00'),
+    ])
+    return cache
+
+
+def _api(respuestas):
+    """
+    API falsa: endpoint -> (status, cuerpo), con la misma lectura que get_json.
+
+    Los listados (con params) responden una página vacía salvo que se indique.
+    """
+    def api_get(rut, endpoint, params=None, estricto=False):
+        clave = endpoint if params is None else ('listado', endpoint)
+        status, cuerpo = respuestas.get(clave, (200, {'items': [], 'next': None}))
+        return cuerpo_json(status < 400, status, lambda: cuerpo, endpoint, estricto)
+    return api_get
+
+
+def test_releer_pendientes_actualiza_y_elimina_solo_404(cache):
+    api_get = _api({
+        '/bancos/1102001/a': (200, {'id': 'a', 'conciliado': True}),
+        '/bancos/1102001/b': (404, None),  # eliminado en Skualo
+        '/bancos/1102001/c': (200, {'id': 'c', 'conciliado': False}),
+    })
+
+    movimientos = sincronizar_movimientos_banco(api_get, '1-9', '1102001', cache, workers=1)
+    assert {m['id']: m['conciliado'] for m in movimientos} == {'a': True, 'c': False}
+    assert [m['id'] for m in cache.sin_conciliar('1-9', '1102001')] == ['c']
+
+
+@pytest.mark.parametrize('status', [401, 403])
+def test_token_o_permiso_rechazado_conserva_la_cache(cache, status):
+    api_get = _api({
+        '/bancos/1102001/a': (200, {'id': 'a', 'conciliado': True}),
+        '/bancos/1102001/b': (status, {'error': 'no autorizado'}),
+        '/bancos/1102001/c': (status, {'error': 'no autorizado'}),
+    })
+
+    with pytest.raises(ApiSkualoRechazo):
+        sincronizar_movimientos_banco(api_get, '1-9', '1102001', cache, workers=1)
+    assert len(cache.sin_conciliar('1-9', '1102001')) == 3
+
+
+def test_listado_fallido_corta_la_sincronizacion(cache):
+    api_get = _api({('listado', '/bancos/1102001'): (404, None)})
+
+    with pytest.raises(ApiSkualoRechazo):
+        sincronizar_movimientos_banco(api_get, '1-9', '1102001', cache, workers=1)
+    assert len(cache.sin_conciliar('1-9', '1102001')) == 3
+
+
+def test_error_transitorio_conserva_la_cache(cache):
+    def api_get(rut, endpoint, params=None, estricto=False):
+        if params is not None:
+            return {'items': [], 'next': None}
+        raise ApiSkualoNoDisponible('503')
+
+    with pytest.raises(ApiSkualoNoDisponible):
+        sincronizar_movimientos_banco(api_get, '1-9', '1102001', cache, workers=1)
+    assert len(cache.sin_conciliar('1-9', '1102001')) == 3
+
+
+def _dte(folio, creado_el):
+    return {'idTipoDocumento': 33, 'folio': folio, 'rutEmisor': '2-7', 'creadoEl': creado_el}
+
+
+def _api_dtes(dtes):
+    """API falsa de /sii/dte/recibidos (del más nuevo al más antiguo, una página)."""
+    def api_get(rut, endpoint, params=None, estricto=False):
+        return {'items': sorted(dtes, key=lambda d: d['creadoEl'], reverse=True), 'next': None}
+    return api_get
+
+
+def test_dtes_incremental_no_ve_retroactivos_ni_eliminados(tmp_path):
+    cache = DtesRecibidosCache(tmp_path / 'cache.db')
+    dtes = [_dte(1, '2099-01-02T00:00:00'), _dte(2, '2020-01-01T00:00:00')]
+    sincronizar_dtes_recibidos(_api_dtes(dtes), '1-9', cache, reconciliar_dias=7)
+
+    # Se elimina el folio 2 y aparece el 3 con creadoEl anterior al corte
+    dtes = [_dte(1, '2099-01-02T00:00:00'), _dte(3, '2020-01-02T00:00:00')]
+    folios = [d['folio'] for d in sincronizar_dtes_recibidos(_api_dtes(dtes), '1-9', cache, reconciliar_dias=7)]
+    assert folios == [1, 2]
+
+
+def test_dtes_reconciliacion_periodica(tmp_path):
+    cache = DtesRecibidosCache(tmp_path / 'cache.db')
+    dtes = [_dte(1, '2099-01-02T00:00:00'), _dte(2, '2020-01-01T00:00:00')]
+    sincronizar_dtes_recibidos(_api_dtes(dtes), '1-9', cache, reconciliar_dias=7)
+    with cache._conectar() as conn:
+        conn.execute("UPDATE dtes_recibidos_completa SET completa_el = '2000-01-01T00:00:00'")
+
+    dtes = [_dte(1, '2099-01-02T00:00:00'), _dte(3, '2020-01-02T00:00:00')]
+    folios = [d['folio'] for d in sincronizar_dtes_recibidos(_api_dtes(dtes), '1-9', cache, reconciliar_dias=7)]
+    assert folios == [1, 3]
+    assert cache.ultima_completa('1-9') > '2000-01-01T00:00:00'
@@ -0,0 +1,122 @@
+"""Tests de odoo.snapshots (sin base Odoo: solo el almacén SQLite y las fechas)."""
+
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+from odoo import snapshots as snapshots_mod
+from odoo.snapshots import SnapshotsCache, fin_de_mes, obtener_saldos, ultimo_periodo_cerrado
+
+
+def test_almacen_cierra_conexiones_y_conserva_montos(tmp_path, monkeypatch):
+    abiertas = []
+    conectar = sqlite3.connect
+
+    def registrar(*args, **kwargs):
+        conn = conectar(*args, **kwargs)
+        abiertas.append(conn)
+        return conn
+
+    monkeypatch.setattr(snapshots_mod.sqlite3, 'connect', registrar)
+
+    cache = SnapshotsCache(tmp_path / 'snapshots.db')
+    cache.guardar('base', '2025-01', '2025-02-01T00:00:00', {7: [Decimal('10.10'), Decimal('0')]})
+    assert cache.ultimo('base', '2025-03') == ('2025-01', '2025-02-01T00:00:00')
+    assert cache.saldos('base', '2025-01') == {7: [Decimal('10.10'), Decimal('0')]}
+
+    for conn in abiertas:
+        try:
+            conn.execute('SELECT 1')
+        except sqlite3.ProgrammingError:
+            continue
+        raise AssertionError('conexión SQLite sin cerrar')
+
+
+def test_fin_de_mes():
+    assert fin_de_mes('202402') == date(2024, 2, 29)
+    assert fin_de_mes('202302') == date(2023, 2, 28)
+    assert fin_de_mes('202512') == date(2025, 12, 31)
+
+
+def test_ultimo_periodo_cerrado():
+    hoy = date(2025, 11, 15)
+    # Abiertos: nov, oct y sep (3 meses) -> último cerrado agosto
+    assert ultimo_periodo_cerrado(date(2025, 11, 30), meses_abiertos=3, hoy=hoy) == '202508'
+    # La fecha pedida es anterior: último mes completo hasta esa fecha
+    assert ultimo_periodo_cerrado(date(2025, 3, 31), meses_abiertos=3, hoy=hoy) == '202503'
+    assert ultimo_periodo_cerrado(date(2025, 3, 30), meses_abiertos=3, hoy=hoy) == '202502'
+    # Cruce de año
+    assert ultimo_periodo_cerrado(date(2026, 1, 31), meses_abiertos=1, hoy=date(2026, 1, 10)) == '202512'
+    assert ultimo_periodo_cerrado(date(2026, 1, 31), meses_abiertos=0, hoy=date(2026, 1, 10)) == '202601'
+
+
+class CursorFalso:
+    """Cursor psycopg2 falso sobre un libro en memoria (solo las consultas de odoo.snapshots)."""
+
+    def __init__(self, asientos):
+        self.asientos = asientos  # id -> {'date', 'write_date', 'state', 'lineas': [(cuenta, debe, haber)]}
+        self.reloj = 0
+        self._filas = []
+
+    def ahora(self) -> str:
+        self.reloj += 1
+        return f'2026-01-01T00:00:{self.reloj:02d}'
+
+    def execute(self, query, params=None):
+        asientos = self.asientos.values()
+        if query == snapshots_mod.QUERY_SUMAS:
+            desde, hasta = params
+            sumas = {}
+            for a in asientos:
+                if a['state'] == 'posted' and desde < a['date'] <= hasta:
+                    for cuenta, debe, haber in a['lineas']:
+                        s = sumas.setdefault(cuenta, [0, 0])
+                        s[0] += debe
+                        s[1] += haber
+            self._filas = [(c, Decimal(d), Decimal(h)) for c, (d, h) in sumas.items()]
+        elif query == snapshots_mod.QUERY_ASIENTOS:
+            desde, hasta = params
+            self._filas = [(i,) for i, a in self.asientos.items()
+                           if a['state'] == 'posted' and desde < a['date'] <= hasta]
+        elif query == snapshots_mod.QUERY_CAMBIOS:
+            hasta, tomado_el = params
+            self._filas = [(1,) for a in asientos if a['date'] <= hasta and a['write_date'] > tomado_el][:1]
+        elif query == snapshots_mod.QUERY_CAMBIADOS_FUERA:
+            hasta, tomado_el = params
+            self._filas = [(i,) for i, a in self.asientos.items()
+                           if a['date'] > hasta and a['write_date'] > tomado_el]
+        elif query == snapshots_mod.QUERY_CUENTAS:
+            self._filas = [(c, str(c), f'Cuenta {c}', 1) for c in sorted(params[0])]
+        elif 'now()' in query:
+            self._filas = [(datetime.fromisoformat(self.ahora()),)]
+        else:
+            raise AssertionError(query)
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+    def fetchall(self):
+        return self._filas
+
+
+def test_asiento_cambiado_de_fecha_a_mes_abierto_no_se_cuenta_dos_veces(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots_mod, '_cache', SnapshotsCache(tmp_path / 'snapshots.db'))
+    monkeypatch.setattr(snapshots_mod, 'SNAPSHOTS_HABILITADOS', True)
+    monkeypatch.setattr(snapshots_mod, 'MESES_ABIERTOS', 1)
+    hasta = date.today()
+    cursor = CursorFalso({
+        1: {'date': date(2020, 1, 10), 'write_date': '2020-01-10T00:00:00', 'state': 'posted',
+            'lineas': [(7, 100, 0), (8, 0, 100)]},
+    })
+    assert obtener_saldos(cursor, 'base', hasta) == [
+        ('7', 'Cuenta 7', 1, Decimal(100), Decimal(0), Decimal(100)),
+        ('8', 'Cuenta 8', 1, Decimal(0), Decimal(100), Decimal(-100)),
+    ]
+
+    # Borrador, nueva fecha en el mes abierto y contabilizado otra vez
+    cursor.asientos[1].update(date=hasta, write_date=cursor.ahora())
+    filas = obtener_saldos(cursor, 'base', hasta)
+    assert [(codigo, debe, haber) for codigo, _, _, debe, haber, _ in filas] == [
+        ('7', Decimal(100), Decimal(0)),
+        ('8', Decimal(0), Decimal(100)),
+    ]
@@ -0,0 +1,236 @@
+"""Tests de skualo.trafico (sin red: sesión HTTP falsa)."""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from skualo import trafico
+from skualo.trafico import ApiSkualoNoDisponible, CircuitBreaker, TokenBucket
+
+
+class Respuesta:
+    def __init__(self, status, datos=None, headers=None):
+        self.status_code = status
+        self.ok = status < 400
+        self.headers = headers or {}
+        self._datos = datos
+
+    def json(self):
+        return self._datos
+
+
+class Sesion:
+    """Entrega las respuestas del guion en orden (una excepción se lanza)."""
+
+    def __init__(self, guion):
+        self.guion = list(guion)
+        self.llamadas = 0
+
+    def get(self, url, **kwargs):
+        self.llamadas += 1
+        respuesta = self.guion.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+
+@pytest.fixture
+def sesion(monkeypatch):
+    monkeypatch.setitem(trafico.TRAFICO_CONFIG, 'backoff_base', 0.001)
+    monkeypatch.setitem(trafico.TRAFICO_CONFIG, 'circuito_fallos', 3)
+    monkeypatch.setitem(trafico.TRAFICO_CONFIG, 'circuito_pausa', 0.05)
+    monkeypatch.setattr(trafico, '_traficos', {})
+    monkeypatch.setattr(trafico, '_bucket', TokenBucket(0, 1))
+
+    def usar(guion):
+        falsa = Sesion(guion)
+        monkeypatch.setattr(trafico, 'get_session', lambda: falsa)
+        return falsa
+    return usar
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CIRCUIT BREAKER / TOKEN BUCKET
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def test_circuito_abre_tras_fallos_y_deja_una_prueba():
+    circuito = CircuitBreaker(fallos=2, pausa=0.05)
+    circuito.fallo()
+    assert circuito.permitir() == 'cerrado'
+    circuito.fallo()
+    assert circuito.estado == 'abierto'
+    assert circuito.permitir() is None
+
+    time.sleep(0.06)
+    assert circuito.estado == 'semiabierto'
+    assert circuito.permitir() == 'prueba'
+    assert circuito.permitir() is None  # Solo una prueba a la vez
+    circuito.exito(prueba=True)
+    assert circuito.estado == 'cerrado'
+    assert circuito.permitir() == 'cerrado'
+
+
+def test_circuito_prueba_fallida_vuelve_a_abrir():
+    circuito = CircuitBreaker(fallos=1, pausa=0.05)
+    circuito.fallo()
+    time.sleep(0.06)
+    assert circuito.permitir() == 'prueba'
+    circuito.fallo(prueba=True)
+    assert circuito.estado == 'abierto'
+    time.sleep(0.06)
+    assert circuito.permitir() == 'prueba'
+
+
+def test_circuito_liberar_suelta_la_prueba():
+    circuito = CircuitBreaker(fallos=1, pausa=0.01)
+    circuito.fallo()
+    time.sleep(0.02)
+    assert circuito.permitir() == 'prueba'
+    circuito.liberar()
+    assert circuito.estado == 'semiabierto'
+    assert circuito.permitir() == 'prueba'
+
+
+def test_request_que_no_es_la_prueba_no_la_suelta():
+    control = trafico.ControlTrafico('1-9', TokenBucket(0, 1), config={
+        **trafico.TRAFICO_CONFIG, 'circuito_fallos': 1, 'circuito_pausa': 0.01,
+    })
+    _, prueba = control.antes()  # Entra con el circuito cerrado
+    assert not prueba
+    control.circuito.fallo()
+    time.sleep(0.02)
+    assert control.antes()[1]  # Otro hilo toma la prueba
+
+    # El primero termina con 429 o con éxito durante el semiabierto
+    control.despues(429, 0, 0, prueba)
+    assert control.circuito.permitir() is None
+    control.despues(200, None, 0, prueba)
+    control.circuito.fallo()
+    time.sleep(0.02)
+    assert control.circuito.permitir() is None  # La prueba sigue en curso
+
+
+def test_bucket_rafaga_y_tasa():
+    bucket = TokenBucket(tasa=10, rafaga=2)
+    esperas = [bucket.reservar() for _ in range(4)]
+    assert esperas[:2] == [0, 0]
+    assert esperas[2] == pytest.approx(0.1, abs=0.02)
+    assert esperas[3] == pytest.approx(0.2, abs=0.02)
+
+
+def test_bucket_sin_tasa_respeta_pausa():
+    bucket = TokenBucket(tasa=0, rafaga=1)
+    assert bucket.reservar() == 0
+    bucket.pausar(0.5)
+    assert 0.4 < bucket.reservar() <= 0.5
+
+
+def test_segundos_retry_after():
+    assert trafico.segundos_retry_after('3') == 3
+    assert trafico.segundos_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert trafico.segundos_retry_after('') is None
+    assert trafico.segundos_retry_after('mañana') is None
+
+
+def test_concurrencia_baja_a_la_mitad_y_sube():
+    concurrencia = trafico.ConcurrenciaAdaptativa(16)
+    concurrencia.saturado()
+    assert concurrencia.limite == 8
+    concurrencia.saturado()  # Mismo segundo: no vuelve a bajar
+    assert concurrencia.limite == 8
+    for _ in range(9):  # Una ventana completa de respuestas OK
+        concurrencia.exito()
+    assert concurrencia.limite == 9
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# GET_JSON
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def test_get_json_reintenta_429_y_5xx(sesion):
+    falsa = sesion([
+        Respuesta(429, headers={'Retry-After': '0'}),
+        Respuesta(503),
+        requests.ConnectionError('caída'),
+        Respuesta(200, {'items': [1]}),
+    ])
+    assert trafico.get_json('1-9', 'url') == {'items': [1]}
+    assert falsa.llamadas == 4
+
+
+def test_get_json_404_sin_reintento(sesion):
+    falsa = sesion([Respuesta(404), Respuesta(200, {})])
+    assert trafico.get_json('1-9', 'url') is None
+    assert falsa.llamadas == 1
+
+
+def test_get_json_reintentos_agotados(sesion):
+    sesion([Respuesta(500)] * (trafico.TRAFICO_CONFIG['reintentos'] + 1))
+    with pytest.raises(ApiSkualoNoDisponible):
+        trafico.get_json('1-9', 'url')
+
+
+def test_get_json_semiabierto_429_no_bloquea_el_circuito(sesion):
+    sesion([Respuesta(500)] * 3)
+    with pytest.raises(ApiSkualoNoDisponible):
+        trafico.get_json('1-9', 'url')
+    circuito = trafico.get_trafico('1-9').circuito
+    assert circuito.estado == 'abierto'
+    with pytest.raises(ApiSkualoNoDisponible):
+        trafico.get_json('1-9', 'url')
+
+    time.sleep(0.06)
+    falsa = sesion([Respuesta(429, headers={'Retry-After': '0'}), Respuesta(200, [1])])
+    assert trafico.get_json('1-9', 'url') == [1]
+    assert falsa.llamadas == 2
+    assert circuito.estado == 'cerrado'
+
+
+def test_get_json_excepcion_inesperada_suelta_la_prueba(sesion):
+    sesion([Respuesta(500)] * 3)
+    with pytest.raises(ApiSkualoNoDisponible):
+        trafico.get_json('1-9', 'url')
+    time.sleep(0.06)
+
+    sesion([RuntimeError('bug')])
+    with pytest.raises(RuntimeError):
+        trafico.get_json('1-9', 'url')
+    sesion([Respuesta(200, [1])])
+    assert trafico.get_json('1-9', 'url') == [1]
+
+
+def test_get_json_que_no_es_la_prueba_no_la_suelta_al_fallar(sesion, monkeypatch):
+    sesion([])
+    circuito = trafico.get_trafico('1-9').circuito
+    enviado, seguir = threading.Event(), threading.Event()
+
+    class SesionLenta:
+        def get(self, url, **kwargs):
+            enviado.set()
+            seguir.wait(5)
+            raise RuntimeError('bug')
+
+    monkeypatch.setattr(trafico, 'get_session', lambda: SesionLenta())
+    errores = []
+
+    def pedir():
+        try:
+            trafico.get_json('1-9', 'url')
+        except RuntimeError as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=pedir)
+    hilo.start()
+    assert enviado.wait(5)  # Entró con el circuito cerrado
+
+    for _ in range(3):
+        circuito.fallo()
+    time.sleep(0.06)
+    assert circuito.permitir() == 'prueba'  # Prueba de otro hilo
+    seguir.set()
+    hilo.join(5)
+
+    assert errores
+    assert circuito.permitir() is None